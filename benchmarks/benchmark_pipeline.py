@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmark_pipeline.py
+
+Benchmark de extremo a extremo de predict_pipeline sobre un hato sintético
+(ver generar_hato.py) o sobre una carpeta de CSV crudos existente.
+
+Corre el mismo flujo que `predict_pipeline.py --input-dir` (fuentes_ordenos
++ predecir_vacas + JSON) y mide por separado cada etapa envolviendo sus
+funciones:
+  - carga_modelos:  cargar_modelos
+  - ingesta_csv:    lectura de los CSV (pipeline_ordenos.leer_csv_*)
+  - features:       limpieza y features de pipeline_ordenos (sin la lectura)
+  - preprocesar:    predict_pipeline.preprocesar_df
+  - scoring_xgb:    predicción instantánea (predecir_prob_xgb_lote)
+  - c2_features:    construir_pipeline_C2
+  - c2_scoring:     predecir_c2_rebano
+  - salida_json:    json.dumps del resultado
+  - otros:          el resto de predecir_vacas (armado de resultados, etc.)
+
+Los tiempos son exclusivos: una etapa no incluye las etapas que llama.
+El reporte es JSON (a stdout o --reporte) y se puede comparar con el de
+otra versión con --comparar.
+
+Uso:
+    python benchmark_pipeline.py --vacas 200 --dias 365 --reporte base.json
+    python benchmark_pipeline.py --datos /tmp/hato --comparar base.json
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import inspect
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime
+from importlib import metadata
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "python"))
+import numpy as np
+import pandas as pd
+import pipeline_ordenos
+import predict_pipeline
+
+from generar_hato import generar_hato
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+ETAPAS = ["carga_modelos", "ingesta_csv", "features", "preprocesar", "scoring_xgb",
+          "c2_features", "c2_scoring", "salida_json", "otros"]
+
+
+class Cronometro:
+    """Acumula tiempo exclusivo y número de llamadas por etapa."""
+
+    def __init__(self):
+        self.segundos = {etapa: 0.0 for etapa in ETAPAS}
+        self.llamadas = {etapa: 0 for etapa in ETAPAS}
+        self._pila = []
+
+    @contextlib.contextmanager
+    def medir(self, etapa):
+        # Cada nivel de la pila acumula el tiempo de sus llamadas internas
+        self._pila.append(0.0)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            total = time.perf_counter() - inicio
+            internas = self._pila.pop()
+            if self._pila:
+                self._pila[-1] += total
+            self.segundos[etapa] += total - internas
+            self.llamadas[etapa] += 1
+
+    def envolver(self, modulo, nombre, etapa):
+        """
+        Reemplaza modulo.nombre por una versión que mide su tiempo. En los
+        generadores se mide cada next() (ahí es donde trabajan).
+        """
+        original = getattr(modulo, nombre)
+
+        if inspect.isgeneratorfunction(original):
+            def medida(*args, **kwargs):
+                iterador = original(*args, **kwargs)
+                while True:
+                    with self.medir(etapa):
+                        try:
+                            valor = next(iterador)
+                        except StopIteration:
+                            return
+                    yield valor
+        else:
+            def medida(*args, **kwargs):
+                with self.medir(etapa):
+                    return original(*args, **kwargs)
+
+        setattr(modulo, nombre, medida)
+
+
+def instrumentar(cronometro):
+    """Envuelve las funciones de cada etapa en los módulos que las llaman."""
+    for nombre in ("leer_csv_individual", "leer_csv_por_bloques"):
+        cronometro.envolver(pipeline_ordenos, nombre, "ingesta_csv")
+    cronometro.envolver(pipeline_ordenos, "features_de_ordenos", "features")
+    cronometro.envolver(predict_pipeline, "preprocesar_df", "preprocesar")
+    cronometro.envolver(predict_pipeline, "predecir_prob_xgb_lote", "scoring_xgb")
+    if predict_pipeline.C2_DISPONIBLE:
+        cronometro.envolver(predict_pipeline, "construir_pipeline_C2", "c2_features")
+        cronometro.envolver(predict_pipeline, "predecir_c2_rebano", "c2_scoring")
+
+
+def version_repo():
+    """Commit actual del repo (o None si no hay git)."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def version_paquete(nombre):
+    try:
+        return metadata.version(nombre)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def memoria_max_mb():
+    if resource is None:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    return round(maximo / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def contar_filas(rutas):
+    """Filas de datos de los CSV (sin las dos filas de encabezado)."""
+    filas = 0
+    for ruta in rutas:
+        with open(ruta, "rb") as f:
+            filas += max(sum(1 for _ in f) - 2, 0)
+    return filas
+
+
+def correr_pipeline(input_dir, models_dir=None, threads=None, motor="xgboost",
+                    filas_por_bloque=0, verbose=False, compacto=False):
+    """
+    Corre fuentes_ordenos + predecir_vacas + JSON midiendo cada etapa.
+
+    Returns:
+        (cronometro, segundos_totales, resultado)
+    """
+    cronometro = Cronometro()
+    instrumentar(cronometro)
+
+    base_dir = os.path.dirname(os.path.abspath(predict_pipeline.__file__))
+    salida_diagnostico = sys.stderr if verbose else open(os.devnull, "w")
+    inicio = time.perf_counter()
+    with contextlib.redirect_stderr(salida_diagnostico):
+        modelo_path, models_dir = predict_pipeline.resolver_ruta_modelo(models_dir, base_dir)
+        with cronometro.medir("carga_modelos"):
+            modelo_xgb, modelos_f1 = predict_pipeline.cargar_modelos(
+                modelo_path, models_dir, threads, motor)
+
+        rutas = predict_pipeline.buscar_ordenos(input_dir)
+        fuentes = predict_pipeline.fuentes_ordenos(
+            rutas, None, modelo_xgb, modelos_f1, filas_por_bloque=filas_por_bloque)
+        with cronometro.medir("otros"):
+            resultado = predict_pipeline.predecir_vacas(
+                fuentes, modelo_xgb, modelos_f1, compacto)
+        with cronometro.medir("salida_json"):
+            json.dumps(resultado, ensure_ascii=False)
+    total = time.perf_counter() - inicio
+    if not verbose:
+        salida_diagnostico.close()
+    return cronometro, total, resultado
+
+
+def armar_reporte(cronometro, total, resultado, datos, args):
+    filas = datos["filas"]
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "version": version_repo(),
+        "entorno": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "xgboost": version_paquete("xgboost"),
+        },
+        "configuracion": {
+            "tree_backend": args.tree_backend,
+            "threads": args.threads,
+            "chunk_size": args.chunk_size,
+            "compact": args.compact,
+        },
+        "datos": datos,
+        "etapas": {etapa: {"segundos": round(cronometro.segundos[etapa], 4),
+                           "llamadas": cronometro.llamadas[etapa]}
+                   for etapa in ETAPAS},
+        "total_segundos": round(total, 4),
+        "filas_por_segundo": round(filas / total, 1) if total > 0 else None,
+        "memoria_max_mb": memoria_max_mb(),
+        "vacas_con_resultado": resultado.get("total_vacas"),
+    }
+
+
+def comparar(reporte, base):
+    """Tabla de tiempos por etapa contra un reporte anterior (a stderr)."""
+    print(f"\n{'etapa':<15}{'base (s)':>12}{'actual (s)':>12}{'razón':>9}", file=sys.stderr)
+    filas = [(etapa, base["etapas"].get(etapa, {}).get("segundos"),
+              reporte["etapas"][etapa]["segundos"]) for etapa in ETAPAS]
+    filas.append(("total", base.get("total_segundos"), reporte["total_segundos"]))
+    for etapa, antes, ahora in filas:
+        razon = f"{ahora / antes:.2f}x" if antes else "-"
+        antes = f"{antes:.3f}" if antes is not None else "-"
+        print(f"{etapa:<15}{antes:>12}{ahora:>12.3f}{razon:>9}", file=sys.stderr)
+    if base.get("datos", {}).get("filas") != reporte["datos"]["filas"]:
+        print("[WARN] Los reportes no usan los mismos datos", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark por etapas de predict_pipeline sobre un hato sintético")
+    parser.add_argument("--datos", type=str, default=None,
+                        help="Carpeta con CSV crudos; si no se indica se genera un hato sintético")
+    parser.add_argument("--vacas", type=int, default=100,
+                        help="Vacas del hato sintético (default: 100)")
+    parser.add_argument("--dias", type=int, default=365,
+                        help="Días de historial del hato sintético (default: 365)")
+    parser.add_argument("--semilla", type=int, default=0,
+                        help="Semilla del hato sintético (default: 0)")
+    parser.add_argument("--conservar", type=str, default=None,
+                        help="Carpeta donde dejar el hato generado (default: temporal, se borra)")
+    parser.add_argument("--models-dir", type=str, default=None,
+                        help="Directorio de modelos (default: el de predict_pipeline)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Hilos para la predicción XGBoost")
+    parser.add_argument("--tree-backend", choices=predict_pipeline.MOTORES, default="xgboost",
+                        help="Evaluador de los árboles (default: xgboost)")
+    parser.add_argument("--chunk-size", type=int, default=0,
+                        help="Leer los CSV en bloques de este número de filas (default: 0)")
+    parser.add_argument("--compact", action="store_true",
+                        help="Modo de memoria compacta de predict_pipeline (float32 + categóricas)")
+    parser.add_argument("--reporte", type=str, default=None,
+                        help="Archivo JSON de salida (default: stdout)")
+    parser.add_argument("--comparar", type=str, default=None,
+                        help="Reporte JSON anterior contra el que comparar los tiempos")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Mostrar los mensajes de diagnóstico del pipeline")
+    args = parser.parse_args()
+
+    temporal = None
+    if args.datos:
+        input_dir = args.datos
+        rutas = sorted(glob.glob(os.path.join(input_dir, "*.csv")))
+        datos = {"origen": os.path.abspath(input_dir), "vacas": len(rutas),
+                 "filas": contar_filas(rutas),
+                 "bytes": sum(os.path.getsize(r) for r in rutas)}
+    else:
+        input_dir = args.conservar or tempfile.mkdtemp(prefix="hato_")
+        temporal = None if args.conservar else input_dir
+        print(f"[INFO] Generando hato sintético: {args.vacas} vacas x {args.dias} días "
+              f"en {input_dir}", file=sys.stderr)
+        datos = {"origen": "sintetico",
+                 **generar_hato(args.vacas, args.dias, input_dir, args.semilla,
+                                workers=os.cpu_count() or 1)}
+
+    try:
+        print(f"[INFO] Corriendo pipeline sobre {datos['vacas']} vacas, "
+              f"{datos['filas']} filas", file=sys.stderr)
+        cronometro, total, resultado = correr_pipeline(
+            input_dir, args.models_dir, args.threads, args.tree_backend,
+            args.chunk_size, args.verbose, args.compact)
+    finally:
+        if temporal:
+            shutil.rmtree(temporal, ignore_errors=True)
+
+    reporte = armar_reporte(cronometro, total, resultado, datos, args)
+    texto = json.dumps(reporte, ensure_ascii=False, indent=2)
+    if args.reporte:
+        with open(args.reporte, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+        print(f"[INFO] Reporte guardado en: {args.reporte}", file=sys.stderr)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(reporte, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
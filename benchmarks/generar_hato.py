@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+generar_hato.py
+
+Genera exportaciones sintéticas de ordeños (un CSV por vaca) con el mismo
+formato que las del robot: BOM UTF-8, una fila de encabezados de grupo, una
+fila de encabezados de columna (DI/DD/TI/TD repetidos por grupo), fechas
+"dd/mm/YYYY hh:mm a. m." y celdas vacías donde el robot no registra nada.
+
+Las distribuciones imitan las de uploads/pruebas: ~2.4 ordeños por día,
+~3% de visitas rechazadas o sin ordeñar (solo hora, acción y box), marcas
+de patada / incompleto / pezones no encontrados en ~15% de los ordeños
+(los cuartos incompletos quedan en 0.00) y episodios de mastitis ocasionales
+en un cuarto (conductividad alta, flujo bajo, sangre y leche desviada).
+
+Cada vaca usa su propia semilla (semilla, vaca_id), así que el resultado no
+depende del orden ni del número de workers.
+
+Uso:
+    python generar_hato.py --vacas 10000 --dias 730 --output-dir /tmp/hato
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+ENCABEZADO_GRUPOS = (
+    "Main,,,,Estado,,,,,Estado AMD,,Media de los flujos (kg/min),,,,Sangre (ppm),,,,"
+    "Conductividad (mS / cm),,,,Misc,,,,Flujos máximos (kg/min),,,,Producciones (kg),,,")
+CUARTOS = ["DI", "DD", "TI", "TD"]
+ENCABEZADO_COLUMNAS = ",".join(
+    ["Hora de inicio", "Acción", "Duración (mm:ss)", "Producción (kg)", "Número de ordeño",
+     "RCS (* 1000 células / ml)", "Patada", "Incompleto", "Pezones no encontrados",
+     "Ubre", "Pezón"]
+    + CUARTOS + CUARTOS + CUARTOS
+    + ["EO/PO", "Usuario", "Destino Leche", "Razón de la desviación"]
+    + CUARTOS + CUARTOS)
+
+FECHA_INICIO = "2024-01-01"
+ID_INICIAL = 1000
+BOXES = ["VMS 1", "VMS 2", "VMS 3"]
+# Marcas por cuarto: la mayoría de los ordeños no tienen ninguna
+MARCAS = CUARTOS + ["TI,TD", "DI,TD", "DI,TI", "DD,TD"]
+
+
+def _marcas(rng, n, prob):
+    """Columna de marcas de cuartos ("" o p. ej. "TI,TD") con probabilidad prob."""
+    valores = np.array(MARCAS, dtype=object)[rng.integers(0, len(MARCAS), n)]
+    return np.where(rng.random(n) < prob, valores, "")
+
+
+def generar_vaca(vaca_id: int, dias: int, semilla: int = 0,
+                 fecha_inicio: str = FECHA_INICIO) -> tuple:
+    """
+    Ordeños sintéticos de una vaca.
+
+    Returns:
+        (datos, n_filas): datos es un DataFrame con las 35 columnas del
+        export en orden (nombres de columna internos, sin repetir)
+    """
+    rng = np.random.default_rng([semilla, vaca_id])
+
+    # --- Horarios: intervalos de ~10 h entre visitas al robot ---
+    n_max = int(dias * 3.5) + 1
+    intervalos = np.clip(rng.gamma(4.0, 2.5, n_max), 4.0, None)
+    horas = np.cumsum(intervalos)
+    horas = horas[horas < dias * 24]
+    n = len(horas)
+    inicio = pd.Timestamp(fecha_inicio)
+    fechas = inicio + pd.to_timedelta(np.round(horas * 60), unit="min")
+
+    accion = np.full(n, "Ordeño", dtype=object)
+    sorteo = rng.random(n)
+    accion[sorteo < 0.024] = "Rechazada"
+    accion[(sorteo >= 0.024) & (sorteo < 0.032)] = "Echada sin ordeñar"
+    ordeno = accion == "Ordeño"
+
+    # Número de ordeño dentro del día calendario
+    dia = (fechas.normalize() - inicio.normalize()).days.to_numpy()
+    numero = pd.Series(ordeno.astype(int)).groupby(dia).cumsum().to_numpy()
+
+    # --- Nivel propio de la vaca y variación por ordeño ---
+    prod_media = rng.normal(14.0, 3.0)
+    reparto = rng.dirichlet([20, 20, 22, 24])
+    flujo_base = np.clip(rng.normal(1.05, 0.2, 4), 0.5, None)
+    cond_base = rng.normal(4.6, 0.3, 4)
+
+    produccion = np.clip(rng.normal(prod_media, 4.0, n), 0.5, None)
+    prod_cuarto = produccion[:, None] * reparto[None, :] * rng.normal(1, 0.08, (n, 4))
+    flujo = flujo_base[None, :] * rng.normal(1, 0.12, (n, 4))
+    conductividad = cond_base[None, :] + rng.normal(0, 0.2, (n, 4))
+    sangre = np.where(rng.random((n, 4)) < 0.01, rng.integers(50, 400, (n, 4)), 0)
+    ubre = (rng.random(n) < 0.12).astype(int)
+    destino = np.full(n, "Tanque", dtype=object)
+
+    # --- Episodios de mastitis en un cuarto (~1 cada 200 días) ---
+    for _ in range(rng.poisson(dias / 200)):
+        desde = rng.integers(0, max(n, 1))
+        hasta = min(n, desde + rng.integers(6, 25))
+        cuarto = rng.integers(0, 4)
+        conductividad[desde:hasta, cuarto] += rng.uniform(1.5, 4.0)
+        flujo[desde:hasta, cuarto] *= rng.uniform(0.5, 0.8)
+        prod_cuarto[desde:hasta, cuarto] *= rng.uniform(0.5, 0.8)
+        sangre[desde:hasta, cuarto] = rng.integers(500, 6000, hasta - desde)
+        ubre[desde:hasta] = 1
+        destino[desde:hasta] = rng.choice(["Drenaje", "Divert 3"])
+
+    flujo_max = flujo * rng.normal(1.45, 0.1, (n, 4))
+
+    # Cuartos incompletos: el robot no los ordeña y registra 0.00
+    incompleto = _marcas(rng, n, 0.14)
+    for j, cuarto in enumerate(CUARTOS):
+        sin_ordenar = np.array([cuarto in m.split(",") for m in incompleto])
+        for valores in (prod_cuarto, flujo, conductividad, flujo_max):
+            valores[sin_ordenar, j] = 0.0
+        sangre[sin_ordenar, j] = 0
+    produccion = prod_cuarto.sum(axis=1)
+
+    segundos = np.round(produccion / np.maximum(flujo.sum(axis=1), 0.5) * 60 * 2.4
+                        + rng.normal(60, 20, n)).astype(int)
+    segundos = np.where(ordeno, np.clip(segundos, 60, 3599), 0)
+
+    # --- Armar columnas; las visitas sin ordeño solo tienen hora, acción y box ---
+    def numerica(valores, entero=False):
+        serie = pd.Series(valores).where(ordeno)
+        return serie.astype("Int64") if entero else serie
+
+    periodo = np.where(fechas.hour < 12, "a. m.", "p. m.")
+    columnas = {
+        "hora": fechas.strftime("%d/%m/%Y %I:%M").to_numpy() + " " + periodo,
+        "accion": accion,
+        "duracion": [f"{s // 60:02d}:{s % 60:02d}" for s in segundos],
+        "produccion": numerica(produccion),
+        "numero": numerica(numero, entero=True),
+        "rcs": "",
+        "patada": np.where(ordeno, _marcas(rng, n, 0.18), ""),
+        "incompleto": np.where(ordeno, incompleto, ""),
+        "pezones": np.where(ordeno, _marcas(rng, n, 0.17), ""),
+        "ubre": numerica(ubre, entero=True),
+        "pezon": np.where(ordeno, _marcas(rng, n, 0.11), ""),
+    }
+    for grupo, valores, entero in (("flujo", flujo, False), ("sangre", sangre, True),
+                                   ("cond", conductividad, False)):
+        for j, cuarto in enumerate(CUARTOS):
+            columnas[f"{grupo}_{cuarto}"] = numerica(valores[:, j], entero)
+    columnas["eopo"] = np.array(BOXES, dtype=object)[rng.integers(0, len(BOXES))]
+    columnas["usuario"] = ""
+    columnas["destino"] = np.where(ordeno, destino, "")
+    columnas["razon"] = ""
+    for grupo, valores in (("flujo_max", flujo_max), ("prod", prod_cuarto)):
+        for j, cuarto in enumerate(CUARTOS):
+            columnas[f"{grupo}_{cuarto}"] = numerica(valores[:, j])
+
+    return pd.DataFrame(columnas), n
+
+
+def escribir_vaca(df: pd.DataFrame, ruta: str):
+    """Escribe un export con las dos filas de encabezado del robot."""
+    with open(ruta, "w", encoding="utf-8-sig", newline="") as f:
+        f.write(ENCABEZADO_GRUPOS + "\n")
+        f.write(ENCABEZADO_COLUMNAS + "\n")
+        df.to_csv(f, header=False, index=False, float_format="%.2f", na_rep="",
+                  lineterminator="\n")
+
+
+def _generar_y_escribir(tarea):
+    vaca_id, dias, semilla, output_dir = tarea
+    df, n = generar_vaca(vaca_id, dias, semilla)
+    escribir_vaca(df, os.path.join(output_dir, f"{vaca_id}.csv"))
+    return n
+
+
+def generar_hato(vacas: int, dias: int, output_dir: str, semilla: int = 0,
+                 workers: int = 1) -> dict:
+    """
+    Genera vacas CSV (IDs desde ID_INICIAL) en output_dir.
+
+    Returns:
+        Dict con "vacas", "dias", "semilla", "filas" y "bytes" generados
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tareas = [(ID_INICIAL + i, dias, semilla, output_dir) for i in range(vacas)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            filas = sum(executor.map(_generar_y_escribir, tareas, chunksize=16))
+    else:
+        filas = sum(_generar_y_escribir(t) for t in tareas)
+
+    total_bytes = sum(os.path.getsize(os.path.join(output_dir, f"{vaca_id}.csv"))
+                      for vaca_id, _, _, _ in tareas)
+    return {"vacas": vacas, "dias": dias, "semilla": semilla,
+            "filas": int(filas), "bytes": int(total_bytes)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Genera exportaciones sintéticas de ordeños (un CSV por vaca)")
+    parser.add_argument("--vacas", type=int, default=100,
+                        help="Número de vacas (default: 100)")
+    parser.add_argument("--dias", type=int, default=365,
+                        help="Días de historial por vaca (default: 365)")
+    parser.add_argument("--output-dir", required=True,
+                        help="Carpeta donde se escriben los CSV")
+    parser.add_argument("--semilla", type=int, default=0,
+                        help="Semilla del generador (default: 0)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos para generar en paralelo (default: 1, 0 = todos los núcleos)")
+    args = parser.parse_args()
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    resumen = generar_hato(args.vacas, args.dias, args.output_dir, args.semilla, workers)
+    print(f"[INFO] {resumen['vacas']} vacas, {resumen['filas']} filas, "
+          f"{resumen['bytes'] / 1e6:.1f} MB en {args.output_dir}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+verificar_compacto.py
+
+Corre predict_pipeline.py --input-dir dos veces sobre los mismos datos, en
+modo normal y con --compact, y compara:
+  - las probabilidades (prob_xgb de cada ordeño y C2 de cada horizonte)
+    contra compacto.TOLERANCIA, y los cambios de nivel_alarma / pred C2;
+  - el pico de memoria y el tiempo de cada corrida (bloque "metrics" de
+    --timings; cada corrida es un proceso aparte para que el pico sea suyo).
+
+Sale con código 1 si alguna probabilidad se aleja más que la tolerancia.
+
+Uso:
+    python verificar_compacto.py --vacas 500 --dias 365
+    python verificar_compacto.py --datos ../uploads/pruebas
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(RAIZ, "src", "python"))
+from compacto import comparar_resultados, TOLERANCIA
+
+from generar_hato import generar_hato
+
+
+SCRIPT = os.path.join(RAIZ, "src", "python", "predict_pipeline.py")
+
+
+def correr(input_dir, compacto, extra):
+    """Salida JSON de predict_pipeline (con "metrics") en un proceso aparte."""
+    comando = [sys.executable, SCRIPT, "--input-dir", input_dir, "--timings",
+               "--log-level", "warn"] + extra
+    if compacto:
+        comando.append("--compact")
+    proceso = subprocess.run(comando, capture_output=True, text=True)
+    if proceso.returncode != 0:
+        sys.stderr.write(proceso.stderr)
+        raise RuntimeError(f"predict_pipeline terminó con código {proceso.returncode}")
+    return json.loads(proceso.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compara predict_pipeline normal y --compact (probabilidades y memoria)")
+    parser.add_argument("--datos", type=str, default=None,
+                        help="Carpeta con CSV crudos; si no se indica se genera un hato sintético")
+    parser.add_argument("--vacas", type=int, default=200,
+                        help="Vacas del hato sintético (default: 200)")
+    parser.add_argument("--dias", type=int, default=365,
+                        help="Días de historial del hato sintético (default: 365)")
+    parser.add_argument("--semilla", type=int, default=0,
+                        help="Semilla del hato sintético (default: 0)")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA,
+                        help=f"Diferencia máxima de probabilidad aceptada (default: {TOLERANCIA})")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Hilos para la predicción XGBoost")
+    args = parser.parse_args()
+
+    extra = ["--threads", str(args.threads)] if args.threads else []
+    temporal = None
+    if args.datos:
+        input_dir = args.datos
+    else:
+        input_dir = temporal = tempfile.mkdtemp(prefix="hato_")
+        print(f"[INFO] Generando hato sintético: {args.vacas} vacas x {args.dias} días",
+              file=sys.stderr)
+        generar_hato(args.vacas, args.dias, input_dir, args.semilla,
+                     workers=os.cpu_count() or 1)
+
+    try:
+        base = correr(input_dir, False, extra)
+        compacto = correr(input_dir, True, extra)
+    finally:
+        if temporal:
+            shutil.rmtree(temporal, ignore_errors=True)
+
+    metricas_base, metricas_comp = base.pop("metrics"), compacto.pop("metrics")
+    comparacion = comparar_resultados(base, compacto, args.tolerancia)
+    reporte = {
+        "vacas": base.get("total_vacas"),
+        "registros": base.get("total_registros"),
+        "normal": {"wall_s": metricas_base["wall_s"], "rss_max_mb": metricas_base["rss_max_mb"]},
+        "compacto": {"wall_s": metricas_comp["wall_s"], "rss_max_mb": metricas_comp["rss_max_mb"]},
+        "comparacion": comparacion,
+    }
+    print(json.dumps(reporte, ensure_ascii=False, indent=2))
+
+    if not comparacion["ok"]:
+        print(f"[ERROR] El modo compacto se aleja {comparacion['max_diff']:.3g} "
+              f"(tolerancia {args.tolerancia})", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
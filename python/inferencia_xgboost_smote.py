@@ -12,6 +12,10 @@ import joblib
 import pandas as pd
 import numpy as np
 
+# Módulos compartidos de src/python (en el instalador quedan junto a este script)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "python"))
+from predictor_xgb import PredictorXGB
+
 
 # ==========================================
 # 1. FUNCIONES AUXILIARES
@@ -80,6 +84,12 @@ def main():
         default="outputs/Reporte_Mastitis_Niveles.xlsx",
         help="Ruta de salida para el reporte final (por defecto: outputs/Reporte_Mastitis_Niveles.xlsx)",
     )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="Hilos para la predicción (por defecto: todos los núcleos)",
+    )
 
     args = parser.parse_args()
 
@@ -124,9 +134,11 @@ def main():
     # Calcular probabilidades
     print("\n[INFO] Calculando probabilidades de mastitis...")
     try:
-        probs = modelo.predict_proba(X_nuevos)[:, 1]
+        # Columnas en el orden de entrenamiento, validadas una sola vez
+        predictor = PredictorXGB(modelo, nthread=args.threads)
+        probs = predictor.predecir(X_nuevos)
     except Exception as e:
-        print("[ERROR] Error al calcular predict_proba:", str(e))
+        print("[ERROR] Error al calcular las probabilidades:", str(e))
         sys.exit(3)
 
     df_resultados = df_nuevos.copy()
@@ -33,13 +33,18 @@ def _df_to_excel_strip_time(self, *args, **kwargs):
 
 pd.DataFrame.to_excel = _df_to_excel_strip_time
 import os
+import sys
 import glob
 import re
-from datetime import datetime
 
 import pandas as pd
 import numpy as np
 
+# Módulos compartidos de src/python (en el instalador quedan junto a este script)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "python"))
+from fechas_ordeno import parsear_fechas_ordeno
+from registro_features import calcular_features, nombres_features
+
 
 # -------------------------------------------------------------------
 # 1. Combinar CSV en un solo DataFrame
@@ -68,14 +73,6 @@ def combinar_csvs(input_dir: str) -> pd.DataFrame:
 # -------------------------------------------------------------------
 # 2. Etiquetar mastitis usando archivo de descripción
 # -------------------------------------------------------------------
-def parsear_hora(fecha_str: str):
-    """Convierte 'dd/mm/YYYY hh:mm AM/PM' a datetime, o NaT si falla."""
-    try:
-        return datetime.strptime(fecha_str, "%d/%m/%Y %I:%M %p")
-    except Exception:
-        return pd.NaT
-
-
 def etiquetar_mastitis(df_ordeños: pd.DataFrame, desc_path: str) -> pd.DataFrame:
     print(f"[INFO] Leyendo archivo de descripción: {desc_path}")
     desc = pd.read_excel(desc_path)
@@ -88,18 +85,11 @@ def etiquetar_mastitis(df_ordeños: pd.DataFrame, desc_path: str) -> pd.DataFram
     mask_mastitis = desc["Descripción"].str.contains("mastitis", case=False, na=False)
     mastitis = desc[mask_mastitis].copy()
 
-    # Normalizar texto de hora
-    df_ordeños["Hora de inicio"] = (
-        df_ordeños["Hora de inicio"]
-        .astype(str)
-        .str.replace("a. m.", "AM", regex=False)
-        .str.replace("p. m.", "PM", regex=False)
-        .str.strip()
+    # Parsear hora (solo formato de 12h, sin respaldo de 24h)
+    df_ordeños["Hora de inicio"] = parsear_fechas_ordeno(
+        df_ordeños["Hora de inicio"], fallback_24h=False
     )
 
-    # Parsear hora
-    df_ordeños["Hora de inicio"] = df_ordeños["Hora de inicio"].apply(parsear_hora)
-
     # Parsear fecha de eventos
     mastitis["Fecha del evento"] = pd.to_datetime(
         mastitis["Fecha del evento"], format="%d/%m/%Y", errors="coerce"
@@ -108,17 +98,12 @@ def etiquetar_mastitis(df_ordeños: pd.DataFrame, desc_path: str) -> pd.DataFram
     mastitis["fecha"] = mastitis["Fecha del evento"].dt.date
     df_ordeños["fecha"] = df_ordeños["Hora de inicio"].dt.date
 
-    # Inicializar columna objetivo
-    df_ordeños["Mastitis"] = 0
-
-    # Marcar ordeños con mastitis
-    for _, row in mastitis.iterrows():
-        vaca = row["vaca_id"]
-        fecha = row["fecha"]
-        df_ordeños.loc[
-            (df_ordeños["vaca_id"] == vaca) & (df_ordeños["fecha"] == fecha),
-            "Mastitis"
-        ] = 1
+    # Marcar ordeños con mastitis: una sola búsqueda de cada (vaca_id, fecha)
+    # de ordeño entre los (vaca_id, fecha) de los eventos. Los eventos sin
+    # vaca o sin fecha no marcan ningún ordeño.
+    eventos = pd.MultiIndex.from_frame(mastitis[["vaca_id", "fecha"]].dropna())
+    claves = pd.MultiIndex.from_frame(df_ordeños[["vaca_id", "fecha"]])
+    df_ordeños["Mastitis"] = claves.isin(eventos).astype(np.int64)
 
     # Mensajes de diagnóstico
     invalid_horas = df_ordeños[df_ordeños["Hora de inicio"].isna()]
@@ -250,81 +235,8 @@ def crear_features_basicas(df: pd.DataFrame) -> pd.DataFrame:
     - Conductividad_DI, Conductividad_DD, Conductividad_TI, Conductividad_TD
     - Produccion_DI, Produccion_DD, Produccion_TI, Produccion_TD
     """
-
-    # --- Promedios de flujo y conductividad ---
-    df["FlujoMedio_promedio"] = df[
-        ["FlujoMedio_DI", "FlujoMedio_DD", "FlujoMedio_TI", "FlujoMedio_TD"]
-    ].mean(axis=1)
-
-    df["Conductividad_promedio"] = df[
-        ["Conductividad_DI", "Conductividad_DD", "Conductividad_TI", "Conductividad_TD"]
-    ].mean(axis=1)
-
-    # --- Desviación estándar ---
-    df["FlujoMedio_std"] = df[
-        ["FlujoMedio_DI", "FlujoMedio_DD", "FlujoMedio_TI", "FlujoMedio_TD"]
-    ].std(axis=1)
-
-    df["Conductividad_std"] = df[
-        ["Conductividad_DI", "Conductividad_DD", "Conductividad_TI", "Conductividad_TD"]
-    ].std(axis=1)
-
-    # --- Diferencia máxima - mínima de conductividad ---
-    df["Conductividad_rango"] = (
-        df[["Conductividad_DI", "Conductividad_DD", "Conductividad_TI", "Conductividad_TD"]]
-        .max(axis=1)
-        - df[["Conductividad_DI", "Conductividad_DD", "Conductividad_TI", "Conductividad_TD"]]
-        .min(axis=1)
-    )
-
-    # --- Diferencia entre máximo y promedio de conductividad ---
-    conduct_cols = ["Conductividad_DI", "Conductividad_DD", "Conductividad_TI", "Conductividad_TD"]
-    df["Conductividad_diff_max_prom"] = df[conduct_cols].max(axis=1) - df[conduct_cols].mean(axis=1)
-    df["Conductividad_diff_min_prom"] = df[conduct_cols].mean(axis=1) - df[conduct_cols].min(axis=1)
-
-    # --- Promedios por lado (izquierdo vs derecho) ---
-    df["FlujoMedio_izq"] = df[["FlujoMedio_DI", "FlujoMedio_TI"]].mean(axis=1)
-    df["FlujoMedio_der"] = df[["FlujoMedio_DD", "FlujoMedio_TD"]].mean(axis=1)
-
-    df["Conductividad_izq"] = df[["Conductividad_DI", "Conductividad_TI"]].mean(axis=1)
-    df["Conductividad_der"] = df[["Conductividad_DD", "Conductividad_TD"]].mean(axis=1)
-
-    # --- Relación flujo/conductividad promedio ---
-    df["FlujoConductividad_ratio"] = (
-        df["FlujoMedio_promedio"] / (df["Conductividad_promedio"] + 1e-6)
-    )
-
-    # --- Producción: promedios, totales y diferencias ---
-    df["Produccion_promedio"] = df[
-        ["Produccion_DI", "Produccion_DD", "Produccion_TI", "Produccion_TD"]
-    ].mean(axis=1)
-
-    df["Produccion_total"] = df[
-        ["Produccion_DI", "Produccion_DD", "Produccion_TI", "Produccion_TD"]
-    ].sum(axis=1)
-
-    df["Produccion_izq"] = df[["Produccion_DI", "Produccion_TI"]].sum(axis=1)
-    df["Produccion_der"] = df[["Produccion_DD", "Produccion_TD"]].sum(axis=1)
-
-    df["Produccion_diff_lados"] = (df["Produccion_izq"] - df["Produccion_der"]).abs()
-
-    df["Produccion_std"] = df[
-        ["Produccion_DI", "Produccion_DD", "Produccion_TI", "Produccion_TD"]
-    ].std(axis=1)
-
-    df["Produccion_ratio_lados"] = (
-        df[["Produccion_izq", "Produccion_der"]].max(axis=1)
-        / (df[["Produccion_izq", "Produccion_der"]].min(axis=1) + 1e-6)
-    )
-
-    df["Produccion_rango"] = (
-        df[["Produccion_DI", "Produccion_DD", "Produccion_TI", "Produccion_TD"]].max(axis=1)
-        - df[["Produccion_DI", "Produccion_DD", "Produccion_TI", "Produccion_TD"]].min(axis=1)
-    )
-
-    df["Eficiencia_flujo_produccion"] = (
-        df["FlujoMedio_promedio"] / (df["Produccion_promedio"] + 1e-6)
-    )
+    # Fórmulas en registro_features (las mismas que usa la inferencia)
+    calcular_features(df, nombres_features("basicas"))
 
     return df
 
@@ -333,62 +245,8 @@ def crear_features_basicas(df: pd.DataFrame) -> pd.DataFrame:
 # 6. Features de asimetría, variabilidad y temporalidad
 # -------------------------------------------------------------------
 def crear_features_asimetria_temporalidad(df: pd.DataFrame) -> pd.DataFrame:
-    # Diferencias entre lados
-    if "FlujoMedio_izq" in df.columns and "FlujoMedio_der" in df.columns:
-        df["Flujo_diff_lados"] = (df["FlujoMedio_izq"] - df["FlujoMedio_der"]).abs()
-    else:
-        df["Flujo_diff_lados"] = (df["FlujoMedio_DI"] - df["FlujoMedio_DD"]).abs()
-
-    if "Conductividad_izq" in df.columns and "Conductividad_der" in df.columns:
-        df["Conductividad_diff_lados"] = (
-            df["Conductividad_izq"] - df["Conductividad_der"]
-        ).abs()
-    else:
-        df["Conductividad_diff_lados"] = (
-            df["Conductividad_DI"] - df["Conductividad_DD"]
-        ).abs()
-
-    # Índices de asimetría
-    df["Indice_asimetria_flujo"] = df["FlujoMedio_std"] / (df["FlujoMedio_promedio"] + 1e-6)
-    df["Indice_asimetria_conductividad"] = (
-        df["Conductividad_std"] / (df["Conductividad_promedio"] + 1e-6)
-    )
-
-    # Ratio flujo máximo / mínimo entre los cuatro cuartos
-    flujo_cols = ["FlujoMedio_DI", "FlujoMedio_DD", "FlujoMedio_TI", "FlujoMedio_TD"]
-    df["Flujo_ratio_max_min"] = (
-        df[flujo_cols].max(axis=1) / (df[flujo_cols].min(axis=1) + 1e-6)
-    )
-
-    # Eficiencia fisiológica
-    df["Eficiencia_conductividad"] = (
-        df["Produccion_promedio"] / (df["Conductividad_promedio"] + 1e-6)
-    )
-    df["Flujo_conductividad_balance"] = (
-        df["FlujoMedio_promedio"] / (df["Conductividad_promedio"] + 1e-6)
-    )
-    df["Flujo_por_kg"] = df["FlujoMedio_promedio"] / (df["Produccion_total"] + 1e-6)
-    df["Conductividad_por_kg"] = (
-        df["Conductividad_promedio"] / (df["Produccion_total"] + 1e-6)
-    )
-    df["Conductividad_sobre_flujo"] = (
-        df["Conductividad_promedio"] / (df["FlujoMedio_promedio"] + 1e-6)
-    )
-
-    # Indicadores de variabilidad
-    df["CV_flujo"] = df["FlujoMedio_std"] / (df["FlujoMedio_promedio"] + 1e-6)
-    df["CV_conductividad"] = df["Conductividad_std"] / (df["Conductividad_promedio"] + 1e-6)
-    df["Conductividad_rango_relativo"] = (
-        df["Conductividad_rango"] / (df["Conductividad_promedio"] + 1e-6)
-    )
-    df["Indice_variabilidad_total"] = (df["FlujoMedio_std"] + df["Conductividad_std"]) / 2
-
-    # Score de anomalía simple
-    df["Score_anomalia_simple"] = (
-        df["Conductividad_rango_relativo"]
-        + df["Indice_asimetria_flujo"]
-        + df["Indice_asimetria_conductividad"]
-    )
+    # Asimetría y variabilidad (registro_features)
+    calcular_features(df, nombres_features("asimetria"))
 
     # Variables temporales (orden por vaca y fecha)
     df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
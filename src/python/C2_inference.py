@@ -12,9 +12,24 @@ Los modelos F1 esperan 376 features:
 - ~310 features con lags (62 features base × 5 lags)
 """
 
+import re
+
 import numpy as np
 import pandas as pd
 
+from fechas_ordeno import parsear_fechas_ordeno
+from registro_features import calcular_features
+from predictor_xgb import como_predictor
+
+
+# Lags que esperan los modelos F1 (1 a MAX_LAG)
+MAX_LAG = 5
+
+# Registros por vaca que bastan para calcular exacta la última fila C2:
+# MAX_LAG filas atrás para los lags, más una para que el lag más antiguo de
+# las features *_prev / delta_* / tasa_cambio_* tenga su registro anterior.
+FILAS_COLA_C2 = MAX_LAG + 2
+
 
 # Features base que necesitan lags (extraídas del modelo F1)
 FEATURES_BASE_PARA_LAGS = [
@@ -41,61 +56,86 @@ FEATURES_BASE_PARA_LAGS = [
     'tasa_cambio_produccion'
 ]
 
+# Columnas que agrega cada paso de construir_pipeline_C2
+FEATURES_DERIVADAS = ['CV_flujo', 'CV_conductividad', 'Conductividad_rango_relativo',
+                      'Indice_variabilidad_total']
+FEATURES_TEMPORALES = ['Produccion_promedio_prev', 'delta_produccion_promedio',
+                       'tasa_cambio_produccion', 'Conductividad_promedio_prev',
+                       'delta_conductividad_promedio', 'tasa_cambio_conductividad']
+FEATURES_PROB_ROLLING = ['prob_roll3_mean', 'prob_roll5_mean', 'prob_roll5_max',
+                         'prob_roll5_min']
+
+PATRON_LAG = re.compile(r"^(.*)_lag(\d+)$")
 
-def calcular_features_derivadas(df):
+
+def planificar_c2(modelos_f1):
+    """
+    Reúne las features que piden los modelos F1 cargados (meta["features"])
+    para que construir_pipeline_C2 calcule solo esas y sus dependencias.
+
+    Returns:
+        Dict con:
+          - "columnas": features sin lag que usa algún modelo
+          - "lags": {feature_base: [lags]} de las columnas *_lagN pedidas
+          - "bases": columnas más bases de lag (lo que hay que tener calculado)
+    """
+    columnas, lags = set(), {}
+    for info in modelos_f1.values():
+        for feat in info["features"]:
+            m = PATRON_LAG.match(feat)
+            if m:
+                lags.setdefault(m.group(1), set()).add(int(m.group(2)))
+            else:
+                columnas.add(feat)
+
+    lags = {feat: sorted(lags[feat]) for feat in sorted(lags)}
+    return {"columnas": columnas, "lags": lags, "bases": columnas | set(lags)}
+
+
+def features_omitidas_c2(plan):
+    """Features que construir_pipeline_C2 calcula por defecto y el plan no usa."""
+    todas = FEATURES_DERIVADAS + ['Score_anomalia_simple'] + FEATURES_TEMPORALES + \
+        FEATURES_PROB_ROLLING
+    omitidas = [f for f in todas if f not in plan["bases"]]
+    omitidas += [f"{feat}_lag{lag}" for feat in FEATURES_BASE_PARA_LAGS
+                 for lag in range(1, MAX_LAG + 1)
+                 if lag not in plan["lags"].get(feat, ())]
+    return omitidas
+
+
+def calcular_features_derivadas(df, necesarias=None, copiar=True):
     """
     Calcula las features derivadas que faltan para el modelo F1.
     Estas son features que el pipeline original V7 no genera pero F1 necesita.
-    """
-    df = df.copy()
 
-    # === Features de variabilidad (CV) ===
-    if 'FlujoMedio_promedio' in df.columns and 'FlujoMedio_std' in df.columns:
-        df['CV_flujo'] = np.where(
-            df['FlujoMedio_promedio'] > 0,
-            df['FlujoMedio_std'] / df['FlujoMedio_promedio'],
-            0
-        )
-    else:
-        df['CV_flujo'] = 0
-
-    if 'Conductividad_promedio' in df.columns and 'Conductividad_std' in df.columns:
-        df['CV_conductividad'] = np.where(
-            df['Conductividad_promedio'] > 0,
-            df['Conductividad_std'] / df['Conductividad_promedio'],
-            0
-        )
-    else:
-        df['CV_conductividad'] = 0
+    necesarias: si se indica, solo se calculan las que están en ese conjunto
+    (ver planificar_c2).
+    copiar: con False se agregan las columnas sobre df en vez de sobre una copia.
+    """
+    if copiar:
+        df = df.copy()
 
-    # === Conductividad rango relativo ===
-    if 'Conductividad_rango' in df.columns and 'Conductividad_promedio' in df.columns:
-        df['Conductividad_rango_relativo'] = np.where(
-            df['Conductividad_promedio'] > 0,
-            df['Conductividad_rango'] / df['Conductividad_promedio'],
-            0
-        )
-    else:
-        df['Conductividad_rango_relativo'] = 0
+    def pedidas(nombres):
+        return [f for f in nombres if necesarias is None or f in necesarias]
 
-    # === Índice de variabilidad total ===
-    df['Indice_variabilidad_total'] = (
-        df.get('CV_flujo', 0) + df.get('CV_conductividad', 0)
-    ) / 2
+    # Variante "c2" de registro_features: CV y rango relativo sin épsilon
+    # (0 si el promedio no es positivo o si faltan las columnas)
+    calcular_features(df, pedidas(FEATURES_DERIVADAS), variante="c2", recalcular=True)
 
-    # === Score anomalía simple (si no existe) ===
-    if 'Score_anomalia_simple' not in df.columns:
-        df['Score_anomalia_simple'] = 0
+    # Score anomalía simple (si no existe)
+    calcular_features(df, pedidas(["Score_anomalia_simple"]), variante="c2")
 
     return df
 
 
-def calcular_features_temporales(df, vaca_col='vaca_id'):
+def calcular_features_temporales(df, vaca_col='vaca_id', copiar=True):
     """
     Calcula features temporales: prev, delta, tasa de cambio.
     Estas features comparan el registro actual con el anterior.
+    copiar: con False se agregan las columnas sobre df en vez de sobre una copia.
     """
-    df = df.copy()
+    if copiar:
+        df = df.copy()
 
     # Produccion_promedio_prev y delta
     if 'Produccion_promedio' in df.columns:
@@ -133,11 +173,13 @@ def calcular_features_temporales(df, vaca_col='vaca_id'):
     return df
 
 
-def calcular_features_prob_rolling(df, vaca_col='vaca_id'):
+def calcular_features_prob_rolling(df, vaca_col='vaca_id', copiar=True):
     """
     Calcula features rolling de prob_xgb que el modelo F1 necesita.
+    copiar: con False se agregan las columnas sobre df en vez de sobre una copia.
     """
-    df = df.copy()
+    if copiar:
+        df = df.copy()
 
     if 'prob_xgb' not in df.columns:
         df['prob_roll3_mean'] = 0
@@ -146,72 +188,246 @@ def calcular_features_prob_rolling(df, vaca_col='vaca_id'):
         df['prob_roll5_min'] = 0
         return df
 
-    # Rolling mean de prob_xgb
-    df['prob_roll3_mean'] = df.groupby(vaca_col)['prob_xgb'].transform(
-        lambda x: x.rolling(3, min_periods=1).mean()
-    )
-    df['prob_roll5_mean'] = df.groupby(vaca_col)['prob_xgb'].transform(
-        lambda x: x.rolling(5, min_periods=1).mean()
-    )
-    df['prob_roll5_max'] = df.groupby(vaca_col)['prob_xgb'].transform(
-        lambda x: x.rolling(5, min_periods=1).max()
-    )
-    df['prob_roll5_min'] = df.groupby(vaca_col)['prob_xgb'].transform(
-        lambda x: x.rolling(5, min_periods=1).min()
-    )
+    # Rolling de prob_xgb por vaca (ventanas de 3 y 5, min_periods=1)
+    codigos, _ = pd.factorize(df[vaca_col])
+    stats = rolling_por_segmento(
+        df['prob_xgb'].to_numpy(dtype=np.float64), codigos, ventanas=(3, 5))
+
+    df['prob_roll3_mean'] = stats[3]['mean']
+    df['prob_roll5_mean'] = stats[5]['mean']
+    df['prob_roll5_max'] = stats[5]['max']
+    df['prob_roll5_min'] = stats[5]['min']
 
     return df
 
 
-def crear_lags(df, features_para_lags, max_lag=5, vaca_col='vaca_id'):
+def rolling_por_segmento(valores, codigos, ventanas=(3, 5)):
+    """
+    Estadísticas rolling (mean, max, min) por segmento sin lambdas por vaca.
+
+    Equivale a groupby(vaca).transform(lambda x: x.rolling(w, min_periods=1).stat())
+    para cada ventana w, pero arma una sola matriz (n_filas, max(ventanas))
+    con los valores actuales y anteriores de la misma vaca y calcula todas las
+    ventanas y estadísticas sobre ella en una pasada. Los NaN no cuentan para
+    min_periods, igual que en pandas.
+
+    Args:
+        valores: Array (n_filas,) con la serie a resumir
+        codigos: Segmento de cada fila (pd.factorize de la columna de vaca);
+            las filas con -1 quedan en NaN, como en groupby
+        ventanas: Tamaños de ventana a calcular
+
+    Returns:
+        Dict {ventana: {"mean": array, "max": array, "min": array}}
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    codigos = np.asarray(codigos)
+    n = len(valores)
+    ancho = max(ventanas)
+
+    # Columna k = valor k registros atrás en la misma vaca (NaN si no existe)
+    matriz = np.full((n, ancho), np.nan)
+    matriz[:, 0] = valores
+    for k in range(1, ancho):
+        fuente = indices_desplazados(codigos, k)
+        ok = fuente >= 0
+        matriz[ok, k] = valores[fuente[ok]]
+    matriz[codigos == -1, :] = np.nan
+
+    validos = ~np.isnan(matriz)
+    resultados = {}
+    for w in ventanas:
+        val_w = validos[:, :w]
+        cuenta = val_w.sum(axis=1)
+        vacia = cuenta == 0
+        # Suma del más antiguo al más reciente, como recorre la ventana pandas
+        suma = np.where(val_w, matriz[:, :w], 0.0)[:, ::-1].sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            media = suma / cuenta
+        maximo = np.where(val_w, matriz[:, :w], -np.inf).max(axis=1)
+        minimo = np.where(val_w, matriz[:, :w], np.inf).min(axis=1)
+        media[vacia] = np.nan
+        maximo[vacia] = np.nan
+        minimo[vacia] = np.nan
+        resultados[w] = {"mean": media, "max": maximo, "min": minimo}
+
+    return resultados
+
+
+def indices_desplazados(codigos, desplazamiento):
+    """
+    Para cada fila, índice de la fila que está `desplazamiento` posiciones
+    antes dentro de su mismo segmento (misma vaca, en orden de aparición),
+    o -1 si no existe. Equivale a groupby(vaca).shift(desplazamiento) sobre
+    posiciones de fila, sin iterar por vaca.
+
+    Args:
+        codigos: Array de enteros con el segmento de cada fila (pd.factorize);
+            -1 marca filas sin vaca, que nunca tienen fila anterior
+        desplazamiento: Número de posiciones hacia atrás (>= 1)
+
+    Returns:
+        Array de enteros (n_filas,) con índices de fila o -1
+    """
+    codigos = np.asarray(codigos)
+    n = len(codigos)
+    resultado = np.full(n, -1, dtype=np.int64)
+    if n <= desplazamiento:
+        return resultado
+
+    # Orden estable por segmento: conserva el orden de aparición dentro de cada vaca
+    orden = np.argsort(codigos, kind="stable")
+    seg = codigos[orden]
+
+    valido = (seg[desplazamiento:] == seg[:-desplazamiento]) & (seg[desplazamiento:] != -1)
+    fuente = np.full(n, -1, dtype=np.int64)
+    fuente[desplazamiento:] = np.where(valido, orden[:-desplazamiento], -1)
+
+    resultado[orden] = fuente
+    return resultado
+
+
+def crear_lags(df, features_para_lags, max_lag=5, vaca_col='vaca_id', lags=None,
+               relleno=None, copiar=True):
     """
     Crea columnas de lag (1 a max_lag) para las features especificadas.
     Los modelos F1 necesitan lags de 1 a 5 para ~62 features.
-    """
-    df = df.copy()
 
-    for feat in features_para_lags:
-        if feat not in df.columns:
-            continue
+    lags: {feature: [lags]} opcional (ver planificar_c2); si se indica, cada
+    feature lleva solo sus lags en vez de 1 a max_lag.
+    relleno: valor para los lags sin registro anterior (NaN por defecto). Con
+    df ya sin NaN ni infinitos, relleno=0 da lo mismo que rellenar el
+    resultado después, sin recorrer de nuevo el DataFrame ancho.
+    copiar: con False y sin lags que agregar se devuelve df tal cual.
+
+    Todos los lags de las features numéricas se construyen como un solo bloque
+    NumPy contiguo (usando los límites de segmento de cada vaca) y se agregan
+    con un único concat. Los nombres y valores son los mismos que da
+    df.groupby(vaca_col)[feat].shift(lag).
+    """
+    feats = [f for f in features_para_lags if f in df.columns]
+    numericas = [f for f in feats if pd.api.types.is_numeric_dtype(df[f])
+                 and not pd.api.types.is_bool_dtype(df[f])]
+    otras = [f for f in feats if f not in numericas]
+
+    codigos, _ = pd.factorize(df[vaca_col])
+    n = len(df)
+
+    bloques = []
+    columnas = []
+
+    def lags_de(feat):
+        return range(1, max_lag + 1) if lags is None else lags[feat]
+
+    if numericas:
+        # Sin columnas float64 (features compactas, ver compacto.py) el bloque
+        # queda en float32: es el bloque más grande del DataFrame C2
+        dtype = np.float64 if any(df[f].dtype == np.float64 for f in numericas) \
+            else np.float32
+        valores = df[numericas].to_numpy(dtype=dtype)
+        # (feature, lag) de cada columna del bloque, en orden feature-lag
+        pares = [(i, lag) for i, feat in enumerate(numericas) for lag in lags_de(feat)]
+        bloque = np.full((n, len(pares)), np.nan if relleno is None else relleno,
+                         dtype=dtype)
+        for lag in sorted({lag for _, lag in pares}):
+            destino = [j for j, (_, l) in enumerate(pares) if l == lag]
+            origen = [pares[j][0] for j in destino]
+            fuente = indices_desplazados(codigos, lag)
+            ok = np.flatnonzero(fuente >= 0)
+            bloque[np.ix_(ok, destino)] = valores[np.ix_(fuente[ok], origen)]
+        # copy=False: el DataFrame usa el bloque ya reservado (pandas >= 3
+        # copia los arrays 2D por defecto)
+        bloques.append(pd.DataFrame(
+            bloque,
+            columns=[f"{numericas[i]}_lag{lag}" for i, lag in pares],
+            index=df.index,
+            copy=False,
+        ))
+        columnas.extend(bloques[-1].columns)
+
+    # Columnas no numéricas (poco comunes): se conserva el shift de pandas
+    if otras:
+        grupos = df.groupby(vaca_col)
+        lags_otras = {
+            f"{feat}_lag{lag}": grupos[feat].shift(lag)
+            for feat in otras for lag in lags_de(feat)
+        }
+        if relleno is not None:
+            lags_otras = {k: v.fillna(relleno) for k, v in lags_otras.items()}
+        bloques.append(pd.DataFrame(lags_otras, index=df.index))
+        columnas.extend(lags_otras)
 
-        for lag in range(1, max_lag + 1):
-            lag_col = f"{feat}_lag{lag}"
-            df[lag_col] = df.groupby(vaca_col)[feat].shift(lag)
+    if not bloques:
+        return df.copy() if copiar else df
 
-    return df
+    repetidas = [c for c in columnas if c in df.columns]
+    if repetidas:
+        df = df.drop(columns=repetidas)
+    return pd.concat([df] + bloques, axis=1)
 
 
-def construir_pipeline_C2(df, modelo_instant, columnas_modelo_instant):
+def construir_pipeline_C2(df, modelo_instant, columnas_modelo_instant, solo_cola=False,
+                          plan=None):
     """
     Construye el pipeline C2 completo con las 376 features que esperan los modelos F1.
 
     Args:
         df: DataFrame con features V7 ya calculadas
-        modelo_instant: Modelo XGBoost instantáneo cargado
+        modelo_instant: Modelo XGBoost instantáneo cargado (o su PredictorXGB)
         columnas_modelo_instant: Lista de columnas que espera el modelo instantáneo
+        solo_cola: Si es True, solo usa los últimos FILAS_COLA_C2 registros de
+            cada vaca. La última fila de cada vaca queda idéntica a la del
+            historial completo y el costo no crece con la longitud del historial.
+        plan: Resultado de planificar_c2 con los modelos cargados; si se
+            indica, solo se calculan las features y lags que esos modelos usan.
 
     Returns:
-        DataFrame con todas las features para C2 (376 columnas para modelos F1)
+        DataFrame con todas las features para C2 (376 columnas para modelos F1).
+        Con solo_cola=True contiene únicamente las filas de la cola de cada vaca.
+        El DataFrame recibido no se modifica.
     """
-    df = df.copy()
-
     # Detectar columna de fecha
     fecha_col = "fecha" if "fecha" in df.columns else "Hora de inicio"
     vaca_col = "vaca_id"
 
+    # El orden por vaca y fecha (y la cola de cada vaca) se calcula solo
+    # sobre las columnas clave: df se copia una única vez, en las filas que
+    # se usan, y los pasos siguientes agregan sus columnas a esa copia
+    if vaca_col in df.columns:
+        vacas = df[vaca_col].array
+    elif 'vaca' in df.columns:
+        vacas = df['vaca'].array
+    else:
+        vacas = np.zeros(len(df), dtype=np.int64)
+    claves = pd.DataFrame({vaca_col: vacas})
+
+    if fecha_col in df.columns:
+        if fecha_col == "Hora de inicio":
+            # Formato fijo dd/mm/YYYY: la inferencia de to_datetime lee los
+            # días <= 12 como mes y desordena el historial
+            claves[fecha_col] = parsear_fechas_ordeno(df[fecha_col]).array
+        else:
+            claves[fecha_col] = pd.to_datetime(df[fecha_col], errors="coerce").array
+    orden = claves.sort_values(list(claves.columns)).index.to_numpy()
+
+    # Para predecir el estado más reciente solo hace falta la cola de cada vaca
+    if solo_cola:
+        vacas_ordenadas = claves[vaca_col].take(orden).reset_index(drop=True)
+        cola = vacas_ordenadas.groupby(vacas_ordenadas, sort=False, dropna=False).tail(
+            FILAS_COLA_C2).index
+        orden = orden[cola.to_numpy()]
+
+    df = df.take(orden)
+    df.index = pd.RangeIndex(len(df))
+
     # Asegurar que existe vaca_id
     if vaca_col not in df.columns:
         if 'vaca' in df.columns:
             df[vaca_col] = df['vaca']
         else:
             df[vaca_col] = 0
-
-    # Ordenar por vaca y fecha
-    if fecha_col in df.columns:
-        df[fecha_col] = pd.to_datetime(df[fecha_col], errors="coerce")
-        df = df.sort_values([vaca_col, fecha_col]).reset_index(drop=True)
-    else:
-        df = df.sort_values([vaca_col]).reset_index(drop=True)
+    if fecha_col in claves.columns:
+        df[fecha_col] = claves[fecha_col].array.take(orden)
 
     # === 1. Calcular prob_xgb si no existe ===
     if "prob_xgb" not in df.columns:
@@ -223,24 +439,44 @@ def construir_pipeline_C2(df, modelo_instant, columnas_modelo_instant):
             columns=columnas_modelo_instant, fill_value=0)
 
         # Predecir probabilidad instantánea
-        prob = modelo_instant.predict_proba(X_inst)[:, 1]
+        prob = como_predictor(modelo_instant, columnas_modelo_instant).predecir(X_inst)
         df["prob_xgb"] = prob
 
+    necesarias = None if plan is None else plan["bases"]
+
+    def se_usa(features):
+        return necesarias is None or any(f in necesarias for f in features)
+
     # === 2. Calcular features derivadas (CV, índices, etc.) ===
-    df = calcular_features_derivadas(df)
+    df = calcular_features_derivadas(df, necesarias, copiar=False)
 
     # === 3. Calcular features temporales (prev, delta, tasa_cambio) ===
-    df = calcular_features_temporales(df, vaca_col)
+    if se_usa(FEATURES_TEMPORALES):
+        df = calcular_features_temporales(df, vaca_col, copiar=False)
 
     # === 4. Calcular features rolling de prob_xgb ===
-    df = calcular_features_prob_rolling(df, vaca_col)
-
-    # === 5. Crear lags de todas las features base ===
-    df = crear_lags(df, FEATURES_BASE_PARA_LAGS, max_lag=5, vaca_col=vaca_col)
-
-    # === 6. Rellenar NaN y valores infinitos ===
-    df = df.fillna(0)
-    df = df.replace([np.inf, -np.inf], 0)
+    if se_usa(FEATURES_PROB_ROLLING):
+        df = calcular_features_prob_rolling(df, vaca_col, copiar=False)
+
+    # === 5. Rellenar NaN y valores infinitos ===
+    # Antes de los lags y en el lugar, sobre la copia de trabajo: los lags de
+    # valores ya limpios (con relleno=0 donde no hay registro anterior) son
+    # los mismos que limpiar después el DataFrame ancho. Las columnas de fecha,
+    # duración o texto con nulos no admiten un 0 en el lugar: esas se rellenan
+    # aparte y pasan a object, igual que con fillna(0)
+    for col, tipo in df.dtypes.items():
+        if (tipo.kind in "mM" or isinstance(tipo, pd.StringDtype)) and df[col].isna().any():
+            df[col] = df[col].fillna(0)
+    df.fillna(0, inplace=True)
+    df.replace([np.inf, -np.inf], 0, inplace=True)
+
+    # === 6. Crear lags de las features base (bloque ya limpio, un solo concat) ===
+    if plan is None:
+        df = crear_lags(df, FEATURES_BASE_PARA_LAGS, max_lag=MAX_LAG, vaca_col=vaca_col,
+                        relleno=0, copiar=False)
+    elif plan["lags"]:
+        df = crear_lags(df, list(plan["lags"]), vaca_col=vaca_col, lags=plan["lags"],
+                        relleno=0, copiar=False)
 
     return df
 
@@ -298,7 +534,7 @@ def predecir_c2_para_vaca(df_vaca, modelos_f1):
 
         # Predecir con la última fila
         X_last = X.iloc[[-1]]
-        prob = model.predict_proba(X_last)[0, 1]
+        prob = como_predictor(model, feats).predecir(X_last)[0]
         pred = int(prob >= thr)
 
         resultados[key] = {
@@ -308,3 +544,58 @@ def predecir_c2_para_vaca(df_vaca, modelos_f1):
         }
 
     return resultados
+
+
+def predecir_c2_rebano(dfs_vacas, modelos_f1):
+    """
+    Realiza predicciones C2 (t1, t2, t3, next3) para todo el hato.
+
+    Junta la última fila de cada vaca en una sola matriz por horizonte y hace
+    una única predicción por horizonte, en lugar de una por vaca.
+
+    Args:
+        dfs_vacas: Dict {vaca_id: DataFrame con features C2 ya calculadas}.
+            Solo se usa la última fila de cada DataFrame.
+        modelos_f1: Dict con modelos F1 cargados {key: {"model": model, "thr": threshold, "features": list}}
+
+    Returns:
+        Dict {vaca_id: {key: {"prob": float, "pred": int, "thr": float}}},
+        con el mismo contenido que predecir_c2_para_vaca para cada vaca
+    """
+    resultados = {vaca_id: {} for vaca_id in dfs_vacas}
+
+    # Última fila de cada vaca (las vacas sin filas no entran a la matriz)
+    ids_con_datos = [v for v, df in dfs_vacas.items() if len(df) > 0]
+    ultimas = None
+    if ids_con_datos:
+        ultimas = pd.concat(
+            [dfs_vacas[v].iloc[[-1]] for v in ids_con_datos], ignore_index=True)
+
+    for key in ["t1", "t2", "t3", "next3"]:
+        if key not in modelos_f1:
+            for vaca_id in resultados:
+                resultados[vaca_id][key] = {"prob": 0.0, "pred": 0, "thr": 0.5}
+            continue
+
+        model = modelos_f1[key]["model"]
+        thr = modelos_f1[key]["thr"]
+        feats = modelos_f1[key]["features"]
+
+        for vaca_id in resultados:
+            resultados[vaca_id][key] = {"prob": 0.0, "pred": 0, "thr": thr}
+
+        if ultimas is None:
+            continue
+
+        # Una sola predicción para todas las vacas en este horizonte
+        X = preparar_X_para_modelo(ultimas, feats)
+        probs = como_predictor(model, feats).predecir(X)
+
+        for vaca_id, prob in zip(ids_con_datos, probs):
+            resultados[vaca_id][key] = {
+                "prob": float(prob),
+                "pred": int(prob >= thr),
+                "thr": float(thr)
+            }
+
+    return resultados
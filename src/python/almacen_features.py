@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+almacen_features.py
+
+Lectura y escritura de los archivos de features por vaca (processed/).
+
+Formatos soportados:
+  - "npz": NumPy .npz con un arreglo por columna más la lista ordenada de
+    columnas. Los números se guardan binarios con su dtype, así que al leer
+    no hay que parsear texto ni convertir columnas. No requiere dependencias.
+  - "feather": Arrow IPC (requiere pyarrow; si no está se usa npz).
+  - "csv": texto, el formato original (vaca_<id>_features.csv).
+
+Los lectores detectan el formato por la extensión, así que un processed/
+puede mezclar archivos de distintos formatos.
+
+Partes (modo incremental, --append): a un npz/feather no se le pueden
+agregar filas sin reescribirlo entero, así que las filas nuevas de cada
+corrida van a un archivo aparte, vaca_<id>_features.<n>.<ext>, en el mismo
+formato y con las mismas columnas que el principal. leer_features devuelve
+el principal con sus partes concatenadas en orden, y buscar_archivos_features
+lista solo los principales. Cuando una vaca junta PARTES_MAXIMAS partes, la
+siguiente corrida las compacta en el principal (ver
+pipeline_ordenos.anexar_features_vaca); el costo de reescribir el historial
+se paga una vez cada PARTES_MAXIMAS corridas y no en cada una.
+"""
+
+import os
+import re
+import sys
+import glob
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    FEATHER_DISPONIBLE = True
+except ImportError:
+    FEATHER_DISPONIBLE = False
+
+
+FORMATOS = ("npz", "feather", "csv")
+FORMATO_DEFECTO = "npz"
+EXTENSIONES = {"npz": ".npz", "feather": ".feather", "csv": ".csv"}
+
+# Partes que se acumulan antes de compactarlas en el archivo principal
+# (con una corrida --append diaria, un mes)
+PARTES_MAXIMAS = 30
+PATRON_PARTE = re.compile(r"_features\.(\d+)\.[^.]+$")
+
+
+def resolver_formato(formato: str = None) -> str:
+    """Valida el formato pedido; feather sin pyarrow cae a npz."""
+    formato = formato or FORMATO_DEFECTO
+    if formato not in FORMATOS:
+        raise ValueError(
+            f"Formato de features desconocido: {formato} (opciones: {', '.join(FORMATOS)})")
+    if formato == "feather" and not FEATHER_DISPONIBLE:
+        print("[WARN] pyarrow no disponible, se usa formato npz", file=sys.stderr)
+        return "npz"
+    return formato
+
+
+def nombre_features(vaca_id, formato: str = None) -> str:
+    """Nombre del archivo de features de una vaca."""
+    return f"vaca_{vaca_id}_features{EXTENSIONES[resolver_formato(formato)]}"
+
+
+def formato_de_ruta(ruta: str) -> str:
+    """Formato de un archivo de features según su extensión (o None)."""
+    extension = os.path.splitext(ruta)[1].lower()
+    for formato, ext in EXTENSIONES.items():
+        if ext == extension:
+            return formato
+    return None
+
+
+def buscar_archivos_features(directorio: str, vaca_id=None) -> list:
+    """
+    Archivos vaca_*_features.{npz,feather,csv} de un directorio, ordenados.
+    Las partes (vaca_<id>_features.<n>.<ext>) no se listan: se leen con su
+    archivo principal.
+    """
+    patron = f"vaca_{vaca_id}_features.*" if vaca_id is not None else "vaca_*_features.*"
+    return sorted(ruta for ruta in glob.glob(os.path.join(directorio, patron))
+                  if formato_de_ruta(ruta) is not None and numero_parte(ruta) is None)
+
+
+def ruta_parte(ruta: str, numero: int) -> str:
+    """Ruta de la parte numero de un archivo principal de features."""
+    base, extension = os.path.splitext(ruta)
+    return f"{base}.{numero}{extension}"
+
+
+def numero_parte(ruta: str):
+    """Número de una parte (vaca_<id>_features.<n>.<ext>), o None si no es parte."""
+    coincidencia = PATRON_PARTE.search(ruta)
+    return int(coincidencia.group(1)) if coincidencia else None
+
+
+def buscar_partes(ruta: str) -> list:
+    """Partes de un archivo principal de features, en orden de número."""
+    base, extension = os.path.splitext(ruta)
+    partes = [parte for parte in glob.glob(f"{glob.escape(base)}.*{extension}")
+              if numero_parte(parte) is not None
+              and ruta_parte(ruta, numero_parte(parte)) == parte]
+    return sorted(partes, key=numero_parte)
+
+
+# -------------------------------------------------------------------
+# Escritura
+# -------------------------------------------------------------------
+def _escribir_npz(df: pd.DataFrame, destino, comprimir: bool):
+    """
+    Columnas numéricas: un bloque 2D por dtype ("num_<dtype>") con los índices
+    de sus columnas ("idx_<dtype>"). Columnas de texto: códigos int32 en un
+    bloque ("txt_codigos", -1 = nulo) y los valores únicos de cada una
+    ("txt_<i>"). Así el archivo tiene pocos arreglos y se lee sin pickle.
+    """
+    arreglos = {"columnas": np.array([str(c) for c in df.columns], dtype=str)}
+    numericas = {}
+    texto = []
+    for i, (_, serie) in enumerate(df.items()):
+        if serie.dtype == object:
+            serie = serie.infer_objects()
+        if pd.api.types.is_numeric_dtype(serie.dtype):
+            numericas.setdefault(serie.dtype.str, []).append((i, serie.to_numpy()))
+        else:
+            codigos, unicos = pd.factorize(serie)
+            texto.append((i, codigos.astype(np.int32)))
+            arreglos[f"txt_{i}"] = np.array([str(v) for v in unicos], dtype=str)
+
+    for dtype, columnas in numericas.items():
+        clave = dtype.lstrip("<>|=")
+        arreglos[f"idx_{clave}"] = np.array([i for i, _ in columnas], dtype=np.int32)
+        arreglos[f"num_{clave}"] = np.column_stack([v for _, v in columnas])
+    if texto:
+        arreglos["idx_txt"] = np.array([i for i, _ in texto], dtype=np.int32)
+        arreglos["txt_codigos"] = np.column_stack([c for _, c in texto])
+
+    (np.savez_compressed if comprimir else np.savez)(destino, **arreglos)
+
+
+def escribir_features(df: pd.DataFrame, ruta: str, comprimir: bool = False):
+    """
+    Escribe df en ruta con el formato de su extensión. La escritura es atómica
+    (archivo temporal + reemplazo). comprimir aplica a npz (zip) y feather (zstd).
+    """
+    formato = formato_de_ruta(ruta)
+    ruta_tmp = ruta + ".tmp"
+
+    if formato == "npz":
+        with open(ruta_tmp, "wb") as f:
+            _escribir_npz(df, f, comprimir)
+    elif formato == "feather":
+        df.reset_index(drop=True).to_feather(
+            ruta_tmp, compression="zstd" if comprimir else "uncompressed")
+    elif formato == "csv":
+        df.to_csv(ruta_tmp, index=False)
+    else:
+        raise ValueError(f"Extensión de features no soportada: {ruta}")
+
+    os.replace(ruta_tmp, ruta)
+
+
+# -------------------------------------------------------------------
+# Lectura
+# -------------------------------------------------------------------
+def _leer_npz(ruta: str) -> pd.DataFrame:
+    with np.load(ruta, allow_pickle=False) as datos:
+        columnas = datos["columnas"].tolist()
+        valores = {}
+        for clave in datos.files:
+            if not clave.startswith("num_"):
+                continue
+            bloque = datos[clave]
+            for k, i in enumerate(datos["idx_" + clave[4:]]):
+                valores[int(i)] = bloque[:, k]
+        if "idx_txt" in datos.files:
+            codigos = datos["txt_codigos"]
+            for k, i in enumerate(datos["idx_txt"]):
+                # Último elemento None para los códigos -1 (nulos)
+                unicos = np.append(datos[f"txt_{i}"].astype(object), None)
+                valores[int(i)] = unicos[codigos[:, k]]
+
+    df = pd.DataFrame({i: valores[i] for i in range(len(columnas))})
+    df.columns = columnas
+    return df
+
+
+def leer_features(ruta: str) -> pd.DataFrame:
+    """
+    Lee un archivo de features en cualquiera de los formatos soportados, con
+    sus partes (si tiene) concatenadas al final.
+    """
+    partes = buscar_partes(ruta)
+    if not partes:
+        return _leer_archivo(ruta)
+    return pd.concat([_leer_archivo(r) for r in [ruta] + partes], ignore_index=True)
+
+
+def _leer_archivo(ruta: str) -> pd.DataFrame:
+    formato = formato_de_ruta(ruta)
+    if formato == "npz":
+        return _leer_npz(ruta)
+    if formato == "feather":
+        if not FEATHER_DISPONIBLE:
+            raise ImportError(f"Se necesita pyarrow para leer {ruta}")
+        return pd.read_feather(ruta)
+    if formato == "csv":
+        return pd.read_csv(ruta)
+    raise ValueError(f"Extensión de features no soportada: {ruta}")
+
+
+def leer_columnas(ruta: str) -> list:
+    """Columnas de un archivo de features sin cargar los datos (si se puede)."""
+    formato = formato_de_ruta(ruta)
+    if formato == "npz":
+        with np.load(ruta, allow_pickle=False) as datos:
+            return datos["columnas"].tolist()
+    if formato == "csv":
+        return pd.read_csv(ruta, nrows=0).columns.tolist()
+    if formato == "feather" and FEATHER_DISPONIBLE:
+        import pyarrow.ipc
+        with pyarrow.ipc.open_file(ruta) as lector:
+            return lector.schema.names
+    return _leer_archivo(ruta).columns.tolist()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+almacen_modelos.py
+
+Modelos XGBoost en formato nativo (.ubj) con metadata en JSON, y carga
+perezosa de los modelos F1.
+
+Los .joblib guardan el XGBClassifier de sklearn serializado con pickle
+(los F1 como tupla (modelo, meta)). Convertirlos una sola vez deja junto a
+cada uno:
+  - <nombre>.ubj: el modelo en el formato binario nativo de XGBoost
+    (UBJSON), que se carga sin unpickling;
+  - <nombre>.meta.json: threshold y features del modelo (si es un F1), más
+    el nombre y sha256 del .joblib de origen.
+
+Al cargar se usa el .ubj si existe y su .joblib de origen no cambió desde la
+conversión (mismo sha256); si no, se usa el .joblib como siempre.
+
+Uso (conversión):
+    python almacen_modelos.py --models-dir ../models
+"""
+
+import os
+import sys
+import json
+import glob
+import hashlib
+import argparse
+
+import joblib
+
+
+EXT_NATIVA = ".ubj"
+EXT_META = ".meta.json"
+
+
+def rutas_nativas(ruta_joblib: str):
+    """(ruta .ubj, ruta .meta.json) que corresponden a un .joblib."""
+    base = os.path.splitext(ruta_joblib)[0]
+    return base + EXT_NATIVA, base + EXT_META
+
+
+def _sha256(ruta: str) -> str:
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def convertir_modelo(ruta_joblib: str) -> str:
+    """
+    Escribe el .ubj y el .meta.json de un .joblib (modelo o (modelo, meta)).
+
+    Returns:
+        Ruta del .ubj escrito
+    """
+    objeto = joblib.load(ruta_joblib)
+    modelo, meta = objeto if isinstance(objeto, tuple) else (objeto, {})
+    if not hasattr(modelo, "save_model"):
+        raise ValueError(f"{ruta_joblib} no contiene un modelo XGBoost")
+
+    ruta_ubj, ruta_meta = rutas_nativas(ruta_joblib)
+    sidecar = {
+        "origen": os.path.basename(ruta_joblib),
+        "sha256_origen": _sha256(ruta_joblib),
+    }
+    for clave in ("fecha", "threshold", "features"):
+        if clave in meta:
+            valor = meta[clave]
+            sidecar[clave] = float(valor) if clave == "threshold" else valor
+    if "features" in sidecar:
+        sidecar["features"] = [str(f) for f in sidecar["features"]]
+
+    # Escritura atómica; save_model elige el formato por la extensión, así
+    # que el temporal la conserva
+    ruta_tmp = ruta_ubj[:-len(EXT_NATIVA)] + ".tmp" + EXT_NATIVA
+    modelo.save_model(ruta_tmp)
+    os.replace(ruta_tmp, ruta_ubj)
+
+    with open(ruta_meta + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(sidecar, f, ensure_ascii=False, indent=1)
+    os.replace(ruta_meta + ".tmp", ruta_meta)
+    return ruta_ubj
+
+
+def leer_meta_nativa(ruta_joblib: str):
+    """
+    Metadata del modelo nativo de un .joblib, o None si no hay conversión
+    vigente (falta el .ubj / .meta.json o el .joblib cambió desde entonces).
+    """
+    ruta_ubj, ruta_meta = rutas_nativas(ruta_joblib)
+    if not (os.path.exists(ruta_ubj) and os.path.exists(ruta_meta)):
+        return None
+    with open(ruta_meta, encoding="utf-8") as f:
+        meta = json.load(f)
+    if os.path.exists(ruta_joblib) and _sha256(ruta_joblib) != meta.get("sha256_origen"):
+        print(f"[WARN] {os.path.basename(ruta_joblib)} cambió desde su conversión, "
+              f"se ignora {os.path.basename(ruta_ubj)}", file=sys.stderr)
+        return None
+    return meta
+
+
+def cargar_nativo(ruta_joblib: str):
+    """Carga el XGBClassifier del .ubj que corresponde a un .joblib."""
+    from xgboost import XGBClassifier
+
+    modelo = XGBClassifier()
+    modelo.load_model(rutas_nativas(ruta_joblib)[0])
+    return modelo
+
+
+def cargar_modelo(ruta_joblib: str):
+    """
+    Carga un modelo desde su conversión nativa si está vigente; si no, desde
+    el .joblib.
+
+    Returns:
+        (modelo, meta): meta es la metadata del .meta.json o la del .joblib
+        ({} si el .joblib guarda solo el modelo)
+    """
+    meta = leer_meta_nativa(ruta_joblib)
+    if meta is not None:
+        return cargar_nativo(ruta_joblib), meta
+    objeto = joblib.load(ruta_joblib)
+    return objeto if isinstance(objeto, tuple) else (objeto, {})
+
+
+class EntradaPerezosa(dict):
+    """
+    Dict cuyo valor "model" se carga la primera vez que se pide
+    (entrada["model"]). Las demás claves están disponibles desde el inicio.
+    """
+
+    def __init__(self, cargar, **datos):
+        super().__init__(**datos)
+        self._cargar = cargar
+
+    def __missing__(self, clave):
+        if clave != "model":
+            raise KeyError(clave)
+        self["model"] = self._cargar()
+        return self["model"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convierte los modelos .joblib a formato nativo XGBoost (.ubj + .meta.json)")
+    parser.add_argument("--models-dir", type=str,
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                             "..", "models"),
+                        help="Carpeta con los modelos .joblib (default: ../models)")
+    parser.add_argument("modelos", nargs="*",
+                        help="Archivos .joblib a convertir (default: todos los de --models-dir)")
+    args = parser.parse_args()
+
+    rutas = args.modelos or sorted(glob.glob(os.path.join(args.models_dir, "*.joblib")))
+    errores = 0
+    for ruta in rutas:
+        try:
+            print(f"[INFO] {os.path.basename(ruta)} -> "
+                  f"{os.path.basename(convertir_modelo(ruta))}", file=sys.stderr)
+        except Exception as e:
+            errores += 1
+            print(f"[ERROR] No se pudo convertir {ruta}: {e}", file=sys.stderr)
+    sys.exit(1 if errores else 0)
+
+
+if __name__ == "__main__":
+    main()
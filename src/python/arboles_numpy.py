@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+arboles_numpy.py
+
+Evaluador de árboles XGBoost en NumPy puro, para puntuar pocas filas con
+baja latencia.
+
+Cada llamada a XGBoost tiene un costo fijo (configuración, DMatrix/proxy,
+hilos) que domina cuando se puntúa una vaca o una fila por horizonte C2.
+Aquí los árboles del booster se exportan una sola vez a arreglos planos de
+nodos (todos los árboles uno tras otro) y se recorren para todas las filas
+y todos los árboles a la vez, un nivel de profundidad por paso.
+
+Reglas de XGBoost que se respetan:
+  - se va a la izquierda si x < umbral (comparación en float32);
+  - los valores faltantes siguen default_left;
+  - margen = logit(base_score) más las hojas de cada árbol, sumadas en
+    float32 y en orden de árbol; probabilidad = sigmoide en float32.
+
+Solo se soportan modelos gbtree binary:logistic con splits numéricos (los
+modelos de este proyecto). El resultado coincide con predict_proba salvo
+diferencias de redondeo de exp (del orden de 1e-7).
+"""
+
+import json
+
+import numpy as np
+
+
+# Filas por bloque al recorrer los árboles (acota la memoria de (filas, árboles))
+FILAS_POR_BLOQUE = 4096
+
+
+class ArbolesNumpy:
+    """
+    Árboles de un booster como arreglos planos de nodos.
+
+    Las hojas apuntan a sí mismas como hijos, así que recorrer
+    `profundidad` pasos deja cada fila de cada árbol en su hoja.
+    """
+
+    def __init__(self, izquierdo, derecho, feature, umbral, por_defecto_izq,
+                 valor, raices, profundidad, margen_base, missing=np.nan):
+        self.izquierdo = izquierdo
+        self.derecho = derecho
+        self.feature = feature
+        self.umbral = umbral
+        self.por_defecto_izq = por_defecto_izq
+        self.valor = valor
+        self.raices = raices
+        self.profundidad = profundidad
+        self.margen_base = margen_base
+        self.missing = missing
+
+    def margen(self, X):
+        """Margen (log-odds) de cada fila de X (array 2D float32)."""
+        X = np.asarray(X, dtype=np.float32)
+        if not np.isnan(self.missing):
+            X = np.where(X == self.missing, np.float32(np.nan), X)
+
+        margenes = np.empty(len(X), dtype=np.float32)
+        for inicio in range(0, len(X), FILAS_POR_BLOQUE):
+            bloque = X[inicio:inicio + FILAS_POR_BLOQUE]
+            filas = np.arange(len(bloque))[:, None]
+            nodos = np.broadcast_to(self.raices, (len(bloque), len(self.raices)))
+            for _ in range(self.profundidad):
+                valores = bloque[filas, self.feature[nodos]]
+                izquierda = np.where(np.isnan(valores), self.por_defecto_izq[nodos],
+                                     valores < self.umbral[nodos])
+                nodos = np.where(izquierda, self.izquierdo[nodos], self.derecho[nodos])
+            # Suma secuencial desde el margen base, como acumula XGBoost
+            hojas = np.concatenate(
+                [np.full((len(bloque), 1), self.margen_base, dtype=np.float32),
+                 self.valor[nodos]], axis=1)
+            margenes[inicio:inicio + len(bloque)] = np.cumsum(
+                hojas, axis=1, dtype=np.float32)[:, -1]
+        return margenes
+
+    def predecir(self, X):
+        """Probabilidad de clase 1 (float32, como predict_proba)."""
+        uno = np.float32(1)
+        return uno / (uno + np.exp(-self.margen(X)))
+
+
+def _profundidad(izquierdo, derecho):
+    """Profundidad máxima de un árbol (número de splits de la raíz a la hoja)."""
+    profundidad, nivel = 0, [0]
+    while True:
+        hijos = [h for n in nivel for h in (izquierdo[n], derecho[n]) if h >= 0]
+        if not hijos:
+            return profundidad
+        profundidad += 1
+        nivel = hijos
+
+
+def exportar_arboles(booster, iteraciones=(0, 0), missing=np.nan):
+    """
+    Exporta los árboles de un booster XGBoost a un ArbolesNumpy.
+
+    Args:
+        booster: xgboost.Booster entrenado.
+        iteraciones: Rango de árboles (inicio, fin) como en iteration_range;
+            (0, 0) usa todos.
+        missing: Valor que el modelo trata como faltante.
+
+    Raises:
+        ValueError: si el modelo no es gbtree binary:logistic con splits
+            numéricos y un árbol por iteración.
+    """
+    modelo = json.loads(booster.save_raw("json"))["learner"]
+    objetivo = modelo["objective"]["name"]
+    if objetivo != "binary:logistic":
+        raise ValueError(f"Objetivo no soportado: {objetivo}")
+    gbm = modelo["gradient_booster"]
+    if gbm["name"] != "gbtree":
+        raise ValueError(f"Booster no soportado: {gbm['name']}")
+    param = gbm["model"]["gbtree_model_param"]
+    if int(param.get("num_parallel_tree", 1)) != 1:
+        raise ValueError("num_parallel_tree > 1 no soportado")
+
+    arboles = gbm["model"]["trees"]
+    inicio, fin = iteraciones
+    arboles = arboles[inicio:fin or len(arboles)]
+
+    izquierdo, derecho, feature, umbral, por_defecto_izq, valor = [], [], [], [], [], []
+    raices, profundidad, desplazamiento = [], 0, 0
+    for arbol in arboles:
+        if any(arbol["split_type"]):
+            raise ValueError("Splits categóricos no soportados")
+        izq = np.asarray(arbol["left_children"], dtype=np.int64)
+        der = np.asarray(arbol["right_children"], dtype=np.int64)
+        hoja = izq < 0
+        propios = np.arange(len(izq)) + desplazamiento
+
+        izquierdo.append(np.where(hoja, propios, izq + desplazamiento))
+        derecho.append(np.where(hoja, propios, der + desplazamiento))
+        feature.append(np.where(hoja, 0, arbol["split_indices"]))
+        # En las hojas split_conditions guarda el valor de la hoja
+        condiciones = np.asarray(arbol["split_conditions"], dtype=np.float32)
+        umbral.append(condiciones)
+        valor.append(np.where(hoja, condiciones, np.float32(0)))
+        por_defecto_izq.append(np.asarray(arbol["default_left"], dtype=bool))
+
+        raices.append(desplazamiento)
+        profundidad = max(profundidad, _profundidad(izq, der))
+        desplazamiento += len(izq)
+
+    base = float(modelo["learner_model_param"]["base_score"].strip("[]"))
+    return ArbolesNumpy(
+        izquierdo=np.concatenate(izquierdo).astype(np.int32),
+        derecho=np.concatenate(derecho).astype(np.int32),
+        feature=np.concatenate(feature).astype(np.int32),
+        umbral=np.concatenate(umbral),
+        por_defecto_izq=np.concatenate(por_defecto_izq),
+        valor=np.concatenate(valor),
+        raices=np.asarray(raices, dtype=np.int32),
+        profundidad=profundidad,
+        margen_base=np.float32(np.log(base / (1.0 - base))),
+        missing=missing,
+    )
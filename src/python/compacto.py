@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+compacto.py
+
+Modo de memoria compacta (predict_pipeline --compact): las features de cada
+vaca se guardan en float32 y las columnas de ID / texto como categóricas
+desde la ingesta, y así siguen por C2 y la predicción. Lo que se reporta
+sin pasar por los modelos (fechas, producción) sale de los valores
+originales y no cambia.
+
+XGBoost convierte la entrada a float32 de todos modos, así que prob_xgb no
+cambia. Las features C2 (promedios, deltas, tasas de cambio) se calculan en
+float32 y las probabilidades F1 pueden moverse en la última cifra: la
+diferencia con el modo normal se revisa con comparar_resultados (ver
+benchmarks/verificar_compacto.py) contra TOLERANCIA.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# Columnas de ID y texto con pocos valores distintos por vaca
+COLUMNAS_CATEGORICAS = ("vaca", "vaca_id", "EO/PO", "Destino Leche", "Archivo_origen")
+
+# Campos del resultado de cada vaca que no dependen de los modelos: el modo
+# compacto debe dejarlos idénticos
+CAMPOS_EXACTOS = ("registros", "fechas", "produccion_total", "produccion_promedio")
+
+# Diferencia máxima aceptada entre las probabilidades del modo compacto y
+# las del modo normal
+TOLERANCIA = 1e-3
+
+
+def compactar_df(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Copia de df con las columnas float64 en float32, las int64 en int32 (si
+    sus valores caben) y las COLUMNAS_CATEGORICAS de texto como categóricas
+    (las que tienen nulos se dejan igual: fillna(0) no puede agregar
+    categorías; las numéricas, como "vaca" en los CSV de features, siguen la
+    regla numérica). Las columnas de fecha y el resto del texto no cambian.
+    """
+    tipos = df.dtypes
+    limites = np.iinfo(np.int32)
+    flotantes = [c for c in df.columns if tipos[c] == np.float64]
+    enteras = [c for c in df.columns if tipos[c] == np.int64 and (
+        len(df) == 0 or (limites.min <= df[c].min() and df[c].max() <= limites.max))]
+    categoricas = [c for c in COLUMNAS_CATEGORICAS if c in df.columns
+                   and not pd.api.types.is_numeric_dtype(tipos[c])
+                   and not isinstance(tipos[c], pd.CategoricalDtype)
+                   and not df[c].isna().any()]
+    if not (flotantes or enteras or categoricas):
+        return df
+
+    # Una conversión por grupo de columnas (astype columna por columna es
+    # mucho más lento con ~80 columnas por vaca) y luego el orden original
+    partes = [df.drop(columns=flotantes + enteras + categoricas)]
+    for columnas, dtype in ((flotantes, np.float32), (enteras, np.int32)):
+        if columnas:
+            partes.append(pd.DataFrame(df[columnas].to_numpy(dtype=dtype),
+                                       columns=columnas, index=df.index))
+    if categoricas:
+        partes.append(df[categoricas].astype("category"))
+    return pd.concat(partes, axis=1)[list(df.columns)]
+
+
+def _probabilidades(resultado: dict):
+    """(vaca, clave, prob) de prob_xgb y de cada horizonte C2 de un resultado."""
+    for vaca_id, vaca in resultado.get("vacas", {}).items():
+        if "error" in vaca:
+            continue
+        for i, prob in enumerate(vaca["probabilidades"]):
+            yield vaca_id, f"prob_xgb[{i}]", prob
+        for horizonte, c2 in vaca.get("predicciones_c2", {}).items():
+            yield vaca_id, f"c2_{horizonte}", c2["prob"]
+
+
+def _iguales(a, b) -> bool:
+    """a == b, con NaN igual a NaN (promedios de vacas sin registros)."""
+    return a == b or (isinstance(a, float) and isinstance(b, float) and a != a and b != b)
+
+
+def comparar_resultados(base: dict, compacto: dict, tolerancia: float = TOLERANCIA) -> dict:
+    """
+    Compara dos salidas de predecir_vacas (modo normal y --compact).
+
+    Returns:
+        Dict con "max_diff", "peor" (vaca y probabilidad de la mayor
+        diferencia), "cambios_alarma" y "cambios_pred_c2" (vacas cuyo
+        nivel_alarma o pred C2 cambió), "cambios_exactos" (vaca:campo de
+        CAMPOS_EXACTOS que no coincide), "faltantes" (probabilidades que
+        están en uno y no en el otro) y "ok" (max_diff <= tolerancia, sin
+        cambios exactos ni faltantes).
+    """
+    probs_base = {(v, k): p for v, k, p in _probabilidades(base)}
+    probs_comp = {(v, k): p for v, k, p in _probabilidades(compacto)}
+
+    max_diff, peor = 0.0, None
+    for clave in probs_base.keys() & probs_comp.keys():
+        diff = abs(probs_base[clave] - probs_comp[clave])
+        if diff > max_diff:
+            max_diff, peor = diff, clave
+
+    cambios_alarma, cambios_pred, cambios_exactos = [], [], []
+    vacas_comp = compacto.get("vacas", {})
+    for vaca_id, vaca in base.get("vacas", {}).items():
+        otra = vacas_comp.get(vaca_id, {})
+        if "error" in vaca or "error" in otra:
+            continue
+        if vaca.get("nivel_alarma") != otra.get("nivel_alarma"):
+            cambios_alarma.append(vaca_id)
+        cambios_exactos += [f"{vaca_id}:{campo}" for campo in CAMPOS_EXACTOS
+                            if not _iguales(vaca.get(campo), otra.get(campo))]
+        for horizonte, c2 in vaca.get("predicciones_c2", {}).items():
+            if c2["pred"] != otra.get("predicciones_c2", {}).get(horizonte, {}).get("pred"):
+                cambios_pred.append(f"{vaca_id}:{horizonte}")
+
+    faltantes = len(probs_base.keys() ^ probs_comp.keys())
+    return {
+        "max_diff": max_diff,
+        "peor": {"vaca": peor[0], "probabilidad": peor[1]} if peor else None,
+        "cambios_alarma": cambios_alarma,
+        "cambios_pred_c2": cambios_pred,
+        "cambios_exactos": cambios_exactos,
+        "faltantes": faltantes,
+        "tolerancia": tolerancia,
+        "ok": max_diff <= tolerancia and not cambios_exactos and faltantes == 0,
+    }
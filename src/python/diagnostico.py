@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+diagnostico.py
+
+Mensajes de diagnóstico por nivel para pipeline_ordenos y predict_pipeline
+(opción --log-level o variable de entorno MASTITIS_LOG_NIVEL).
+
+Niveles, de menos a más detalle: error, warn, info, debug, detalle. Por
+defecto "debug": se ven los mismos mensajes de siempre salvo los resúmenes
+caros (columnas completas, head/describe de cada DataFrame), que quedan en
+"detalle".
+
+Los mensajes pueden ser una función sin argumentos que devuelve el texto:
+solo se llama si el nivel está habilitado, así que los resúmenes caros no se
+calculan si nadie los va a ver:
+
+    diagnostico.detalle(lambda: "Estadísticas:\\n" + df.describe().to_string())
+
+Todo va a stderr con el prefijo [ERROR]/[WARN]/[INFO]/[DEBUG] de siempre
+("detalle" usa [DEBUG]).
+"""
+
+import os
+import sys
+
+
+NIVELES = ("error", "warn", "info", "debug", "detalle")
+NIVEL_DEFECTO = "debug"
+# La variable de entorno también llega a los procesos worker (spawn en Windows)
+VARIABLE_ENTORNO = "MASTITIS_LOG_NIVEL"
+
+_ETIQUETAS = {"error": "ERROR", "warn": "WARN", "info": "INFO",
+              "debug": "DEBUG", "detalle": "DEBUG"}
+
+
+def _nivel_inicial():
+    nivel = os.environ.get(VARIABLE_ENTORNO, NIVEL_DEFECTO).lower()
+    return NIVELES.index(nivel) if nivel in NIVELES else NIVELES.index(NIVEL_DEFECTO)
+
+
+_nivel = _nivel_inicial()
+
+
+def configurar(nivel: str):
+    """Fija el nivel de este proceso y de los procesos que lance."""
+    global _nivel
+    if nivel not in NIVELES:
+        raise ValueError(f"Nivel de diagnóstico desconocido: {nivel} (opciones: {NIVELES})")
+    _nivel = NIVELES.index(nivel)
+    os.environ[VARIABLE_ENTORNO] = nivel
+
+
+def habilitado(nivel: str) -> bool:
+    return NIVELES.index(nivel) <= _nivel
+
+
+def mensaje(nivel: str, texto):
+    """Escribe texto (o el resultado de texto() si es una función) si el nivel está habilitado."""
+    if not habilitado(nivel):
+        return
+    if callable(texto):
+        texto = texto()
+    # Los saltos de línea iniciales van antes del prefijo
+    saltos = len(texto) - len(texto.lstrip("\n"))
+    print(f"{texto[:saltos]}[{_ETIQUETAS[nivel]}] {texto[saltos:]}", file=sys.stderr)
+
+
+def error(texto):
+    mensaje("error", texto)
+
+
+def warn(texto):
+    mensaje("warn", texto)
+
+
+def info(texto):
+    mensaje("info", texto)
+
+
+def debug(texto):
+    mensaje("debug", texto)
+
+
+def detalle(texto):
+    mensaje("detalle", texto)
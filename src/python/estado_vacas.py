@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+estado_vacas.py
+
+Estado guardado por vaca para el modo incremental (--append) de
+predict_pipeline.py.
+
+Por cada vaca se guarda en processed/ un archivo vaca_<id>_estado.json con:
+  - ultima_hora: "Hora de inicio" del último ordeño ya procesado
+  - temporal: último Produccion_promedio / Conductividad_promedio (para *_prev)
+  - mapa_eopo: mapeo EO/PO -> EOPO_ID usado hasta ahora
+  - cola_c2: últimos FILAS_COLA_C2 registros con prob_xgb (lags/rolling de C2)
+  - historial: fechas, probabilidades y producción de todos los registros,
+    para armar la respuesta completa sin recalcular nada
+
+Así una corrida diaria solo calcula features y predicciones de los ordeños
+nuevos y extiende el historial guardado.
+"""
+
+import os
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from C2_inference import FILAS_COLA_C2
+from fechas_ordeno import parsear_fechas_ordeno
+from pipeline_ordenos import VERSION_FEATURES, estado_temporal
+
+
+def ruta_estado_vaca(processed_dir, vaca_id):
+    """Ruta del archivo de estado de una vaca."""
+    return os.path.join(processed_dir, f"vaca_{vaca_id}_estado.json")
+
+
+def estado_vacio():
+    """Estado inicial de una vaca sin historial."""
+    return {
+        "version_features": VERSION_FEATURES,
+        "ultima_hora": None,
+        "temporal": {},
+        "mapa_eopo": {},
+        "cola_c2": {},
+        "historial": {"fechas": [], "probabilidades": [], "produccion": []},
+    }
+
+
+def cargar_estado_vaca(processed_dir, vaca_id):
+    """
+    Lee el estado de una vaca. Retorna None si no existe, está dañado o es de
+    otra versión de features (en ese caso la vaca se procesa desde cero).
+    """
+    ruta = ruta_estado_vaca(processed_dir, vaca_id)
+    if not os.path.exists(ruta):
+        return None
+
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            estado = json.load(f)
+    except Exception as e:
+        print(f"[WARN] Estado ilegible para vaca {vaca_id}, se ignora: {e}", file=sys.stderr)
+        return None
+
+    if estado.get("version_features") != VERSION_FEATURES:
+        print(
+            f"[INFO] Estado de vaca {vaca_id} es de otra versión de features, se ignora", file=sys.stderr)
+        return None
+
+    return estado
+
+
+def guardar_estado_vaca(processed_dir, vaca_id, estado):
+    """Escribe el estado de una vaca de forma atómica."""
+    os.makedirs(processed_dir, exist_ok=True)
+    ruta = ruta_estado_vaca(processed_dir, vaca_id)
+    ruta_tmp = ruta + ".tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump(estado, f, ensure_ascii=False)
+    os.replace(ruta_tmp, ruta)
+
+
+def filtrar_registros_nuevos(df, estado):
+    """
+    Quita los ordeños que ya estaban en el historial (hora de inicio menor o
+    igual a la última procesada). Las filas sin hora válida se conservan.
+    """
+    if not estado.get("ultima_hora") or "Hora de inicio" not in df.columns:
+        return df
+
+    horas = parsear_fechas_ordeno(df["Hora de inicio"])
+    nuevos = horas.isna() | (horas > pd.Timestamp(estado["ultima_hora"]))
+    descartados = int((~nuevos).sum())
+    if descartados:
+        print(
+            f"[INFO] {descartados} ordeños ya procesados se descartan", file=sys.stderr)
+    return df[nuevos.to_numpy()]
+
+
+def cola_c2(estado):
+    """DataFrame con los últimos registros guardados para C2 (puede estar vacío)."""
+    return pd.DataFrame(estado.get("cola_c2") or {})
+
+
+def cola_reciente(df):
+    """
+    Últimos FILAS_COLA_C2 registros de una vaca en orden cronológico (el mismo
+    orden en que C2 los ordena), lo único que C2 necesita de lo ya procesado.
+    """
+    if "Hora de inicio" in df.columns:
+        horas = parsear_fechas_ordeno(df["Hora de inicio"])
+        df = df.iloc[np.argsort(horas.to_numpy(dtype="datetime64[ns]"), kind="stable")]
+    return df.tail(FILAS_COLA_C2).reset_index(drop=True)
+
+
+def actualizar_estado(estado, df_nuevo, df_c2_entrada, fechas, probabilidades,
+                      produccion):
+    """
+    Estado nuevo tras procesar df_nuevo.
+
+    Args:
+        estado: Estado anterior (se modifica y se retorna)
+        df_nuevo: Features de los ordeños nuevos (ya con prob_xgb)
+        df_c2_entrada: Cola anterior + ordeños nuevos, en orden
+        fechas, probabilidades, produccion: Historial completo ya extendido
+    """
+    if "Hora de inicio" in df_nuevo.columns and len(df_nuevo):
+        horas = parsear_fechas_ordeno(df_nuevo["Hora de inicio"]).dropna()
+        if len(horas):
+            ultima = horas.max()
+            if estado["ultima_hora"] is None or ultima > pd.Timestamp(estado["ultima_hora"]):
+                estado["ultima_hora"] = ultima.isoformat()
+
+    estado["temporal"].update(estado_temporal(df_nuevo))
+
+    cola = cola_reciente(df_c2_entrada)
+    estado["cola_c2"] = {
+        col: [v.item() if isinstance(v, np.generic) else v for v in cola[col].tolist()]
+        for col in cola.columns
+    }
+
+    estado["historial"] = {
+        "fechas": list(fechas),
+        "probabilidades": [float(p) for p in probabilidades],
+        "produccion": [float(p) for p in produccion],
+    }
+    return estado
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+features_cuartos.py
+
+Kernel de estadísticas por cuarto de ubre (DI, DD, TI, TD).
+
+Las features V7 calculan una y otra vez media / std / max / min sobre las
+cuatro columnas de cada medición (flujo, conductividad, producción...). Aquí
+las mediciones se cargan una sola vez como un arreglo float64 de forma
+(n_filas, 5, 4) y cada reducción por fila se calcula una sola vez; las
+features se arman a partir de esos intermedios compartidos.
+
+Los resultados son idénticos bit a bit a los de pandas (mean/std/max/min/sum
+con skipna): mismas sumas en el mismo orden, mismo ddof=1 y mismo manejo de
+NaN (filas sin datos -> NaN, salvo las sumas que dan 0).
+"""
+
+import numpy as np
+import pandas as pd
+
+
+CUARTOS = ("DI", "DD", "TI", "TD")
+MEDICIONES = ("FlujoMedio", "Conductividad", "Produccion", "Sangre", "FlujoMax")
+
+# Posiciones de cada lado dentro de CUARTOS
+IZQ = [CUARTOS.index("DI"), CUARTOS.index("TI")]
+DER = [CUARTOS.index("DD"), CUARTOS.index("TD")]
+
+
+def columnas_medicion(medicion):
+    """Columnas de una medición en el orden de CUARTOS."""
+    return [f"{medicion}_{c}" for c in CUARTOS]
+
+
+def tensor_cuartos(df: pd.DataFrame):
+    """
+    Carga las mediciones por cuarto en un arreglo (n_filas, len(MEDICIONES), 4).
+
+    Returns:
+        (tensor, disponibles): las mediciones a las que les falta alguna de sus
+        cuatro columnas quedan en NaN y no aparecen en disponibles.
+    """
+    tensor = np.full((len(df), len(MEDICIONES), len(CUARTOS)), np.nan)
+    disponibles = []
+    for m, medicion in enumerate(MEDICIONES):
+        columnas = columnas_medicion(medicion)
+        if all(c in df.columns for c in columnas):
+            tensor[:, m, :] = df[columnas].to_numpy(dtype=np.float64, na_value=np.nan)
+            disponibles.append(medicion)
+    return tensor, disponibles
+
+
+def _suma(columnas):
+    """Suma por fila de varias columnas ya sin NaN, en orden (como pandas)."""
+    total = columnas[0]
+    for col in columnas[1:]:
+        total = total + col
+    return total
+
+
+def _media(suma, cuenta):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(cuenta > 0, suma / cuenta, np.nan)
+
+
+def reducir_cuartos(valores: np.ndarray) -> dict:
+    """
+    Reducciones por fila de un bloque (n_filas, 4) de una medición.
+
+    Las operaciones se hacen columna a columna (DI, DD, TI, TD) en el mismo
+    orden en que pandas acumula, para obtener exactamente los mismos valores.
+
+    Returns:
+        Dict con arrays de largo n_filas: "promedio", "std" (ddof=1), "max",
+        "min", "total", "promedio_izq", "promedio_der", "total_izq", "total_der".
+    """
+    columnas = [np.ascontiguousarray(valores[:, j]) for j in range(valores.shape[1])]
+    nulos = [np.isnan(col) for col in columnas]
+    hay_nulos = any(nulo.any() for nulo in nulos)
+
+    if hay_nulos:
+        limpias = [np.where(nulo, 0.0, col) for col, nulo in zip(columnas, nulos)]
+        presentes = [(~nulo).astype(np.int64) for nulo in nulos]
+        cuenta = _suma(presentes)
+    else:
+        limpias = columnas
+        cuenta = np.full(len(valores), len(columnas), dtype=np.int64)
+
+    total = _suma(limpias)
+    promedio = _media(total, cuenta)
+
+    # Varianza como en pandas: suma de (media - x)^2 sobre los presentes / (n - 1)
+    cuadrados = [(promedio - col) ** 2 for col in columnas]
+    if hay_nulos:
+        cuadrados = [np.where(nulo, 0.0, c) for c, nulo in zip(cuadrados, nulos)]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        varianza = np.where(cuenta > 1, _suma(cuadrados) / (cuenta - 1), np.nan)
+
+    # fmax/fmin saltan NaN; solo queda NaN si toda la fila es NaN
+    maximo, minimo = columnas[0], columnas[0]
+    for col in columnas[1:]:
+        maximo = np.fmax(maximo, col)
+        minimo = np.fmin(minimo, col)
+
+    total_izq = _suma([limpias[j] for j in IZQ])
+    total_der = _suma([limpias[j] for j in DER])
+    if hay_nulos:
+        cuenta_izq = _suma([presentes[j] for j in IZQ])
+        cuenta_der = _suma([presentes[j] for j in DER])
+    else:
+        cuenta_izq = cuenta_der = np.full(len(valores), len(IZQ), dtype=np.int64)
+
+    return {
+        "promedio": promedio,
+        "std": np.sqrt(varianza),
+        "max": maximo,
+        "min": minimo,
+        "total": total,
+        "promedio_izq": _media(total_izq, cuenta_izq),
+        "promedio_der": _media(total_der, cuenta_der),
+        "total_izq": total_izq,
+        "total_der": total_der,
+    }
+
+
+def estadisticas_cuartos(df: pd.DataFrame, mediciones=MEDICIONES) -> dict:
+    """
+    Carga el tensor de cuartos y reduce cada medición pedida una sola vez.
+
+    Returns:
+        {medicion: dict de reducir_cuartos} solo para las mediciones pedidas
+        con sus cuatro columnas presentes en df.
+    """
+    tensor, disponibles = tensor_cuartos(df)
+    return {medicion: reducir_cuartos(tensor[:, MEDICIONES.index(medicion), :])
+            for medicion in disponibles if medicion in mediciones}
+
+
+def max_min_pares(a: np.ndarray, b: np.ndarray):
+    """Máximo y mínimo fila a fila de dos columnas, saltando NaN (como pandas)."""
+    with np.errstate(invalid="ignore"):
+        return np.fmax(a, b), np.fmin(a, b)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+fechas_ordeno.py
+
+Parseo vectorizado de la columna "Hora de inicio" de las exportaciones de
+ordeños ("dd/mm/YYYY hh:mm a. m." / "p. m.").
+
+Reemplaza a las funciones fila por fila (parse_fecha_hora / parsear_hora):
+cada texto distinto se normaliza y se parsea una sola vez, y el resultado se
+reparte a todas las filas que lo comparten. Lo que no se puede interpretar
+queda en NaT, igual que antes.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+FORMATO_12H = "%d/%m/%Y %I:%M %p"
+FORMATO_24H = "%d/%m/%Y %H:%M"
+
+
+def normalizar_am_pm(textos: pd.Series) -> pd.Series:
+    """Convierte 'a. m.' / 'p. m.' a 'AM' / 'PM' y quita espacios extremos."""
+    return (
+        textos.astype(str)
+        .str.replace("a. m.", "AM", regex=False)
+        .str.replace("p. m.", "PM", regex=False)
+        .str.strip()
+    )
+
+
+def parsear_fechas_ordeno(valores, fallback_24h: bool = True) -> pd.Series:
+    """
+    Convierte una columna de fechas de ordeño a datetime64, o NaT si falla.
+
+    Args:
+        valores: Serie (o lista) con textos tipo 'dd/mm/YYYY hh:mm a. m.'
+        fallback_24h: Si es True, los textos que no cumplen el formato de 12h
+            se intentan con 'dd/mm/YYYY HH:MM' antes de quedar en NaT
+
+    Returns:
+        Serie datetime64 con el mismo índice y nombre que la entrada
+    """
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(valores)
+
+    # Cada texto distinto se parsea una sola vez (NaN -> código -1)
+    codigos, unicos = pd.factorize(serie)
+    textos = normalizar_am_pm(pd.Series(unicos, dtype=object))
+
+    fechas = pd.to_datetime(textos, format=FORMATO_12H, errors="coerce")
+    if fallback_24h:
+        faltantes = fechas.isna()
+        if faltantes.any():
+            fechas[faltantes] = pd.to_datetime(
+                textos[faltantes], format=FORMATO_24H, errors="coerce")
+
+    valores_fecha = np.append(
+        fechas.to_numpy(), np.array(["NaT"], dtype=fechas.dtype))
+    return pd.Series(valores_fecha[codigos], index=serie.index, name=serie.name)
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+metricas.py
+
+Tiempos y memoria por etapa para la opción --timings de pipeline_ordenos,
+predict_pipeline y predict_mastitis.
+
+Las funciones de cada etapa se envuelven en `with etapa("read") as m:` y
+anotan las filas procesadas en m["filas"]. Mientras no se llame a
+activar() el contexto no mide nada (costo despreciable).
+
+Etapas: read, clean, features, predict, c2, serialize. Por etapa:
+  - wall_s: tiempo real exclusivo (sin las etapas anidadas);
+  - cpu_s: tiempo de CPU del proceso, también exclusivo;
+  - filas y filas_por_s;
+  - llamadas;
+  - rss_pico_delta_mb: cuánto subió el pico de memoria residente del
+    proceso mientras corría la etapa (exclusivo y sumado entre llamadas; lo
+    que sube fuera de las etapas, p. ej. al cargar los modelos, no se asigna
+    a ninguna);
+  - rss_delta_mb: cambio neto de la memoria residente actual (lo que la
+    etapa dejó asignado, exclusivo y sumado; None si el sistema no permite
+    leerla).
+El pico de todo el proceso va en rss_max_mb, fuera de las etapas.
+
+Con procesos worker (pipeline_ordenos --workers) cada proceso acumula lo
+suyo; exportar() / combinar() juntan sus números en el proceso principal
+(los wall_s y las memorias de etapa se suman entre procesos).
+
+Con perfilar(directorio) (opción --profile) cada etapa corre además bajo
+cProfile y tracemalloc, y guardar_perfiles() escribe por etapa:
+  - <etapa>.prof: estadísticas de cProfile (pstats, snakeviz, ...), solo del
+    tiempo propio de la etapa;
+  - <etapa>.txt: el pico de memoria de Python dentro de la etapa (sobre lo
+    ya asignado al entrar), la memoria que dejó asignada y las funciones con
+    más tiempo acumulado.
+Los procesos worker escriben <etapa>.<pid>.prof / .txt. Perfilar no agrega
+el bloque "metrics" al JSON (eso sigue siendo --timings).
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+import multiprocessing
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+ETAPAS = ("read", "clean", "features", "predict", "c2", "serialize")
+# Vacas más lentas que se listan en el resumen
+N_VACAS_LENTAS = 10
+# Funciones que se listan en los .txt de --profile
+N_PERFIL = 30
+
+_activo = False
+# Si se puede leer la memoria residente actual (rss_delta_mb)
+_hay_rss_actual = False
+_inicio = None
+_etapas = {}
+_vacas = {}
+_pila = []
+# Estado de --profile: directorio, pid y por etapa su cProfile.Profile, pico
+# de memoria y memoria neta asignada
+_perfil = None
+
+
+def _contadores_windows():
+    """PROCESS_MEMORY_COUNTERS del proceso (None si la llamada falla)."""
+    import ctypes
+    from ctypes import wintypes
+
+    class Contadores(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (campo, ctypes.c_size_t) for campo in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+    contadores = Contadores()
+    contadores.cb = ctypes.sizeof(contadores)
+    proceso = ctypes.windll.kernel32.GetCurrentProcess()
+    if ctypes.windll.psapi.GetProcessMemoryInfo(
+            proceso, ctypes.byref(contadores), contadores.cb):
+        return contadores
+    return None
+
+
+def memoria_pico_mb() -> float:
+    """Pico de memoria residente del proceso en MB (None si no se puede medir)."""
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # KB en Linux, bytes en macOS
+        return pico / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    if sys.platform == "win32":
+        contadores = _contadores_windows()
+        if contadores is not None:
+            return contadores.PeakWorkingSetSize / (1024 * 1024)
+    return None
+
+
+def memoria_actual_mb() -> float:
+    """Memoria residente actual del proceso en MB (None si no se puede medir)."""
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/self/statm") as f:
+                paginas = int(f.read().split()[1])
+            return paginas * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        except (OSError, ValueError, IndexError):
+            return None
+    if sys.platform == "win32":
+        contadores = _contadores_windows()
+        if contadores is not None:
+            return contadores.WorkingSetSize / (1024 * 1024)
+    return None
+
+
+def activar():
+    """Empieza a medir (y descarta lo medido antes)."""
+    global _activo, _inicio, _hay_rss_actual
+    _activo = True
+    _hay_rss_actual = memoria_actual_mb() is not None
+    _inicio = (time.perf_counter(), time.process_time(), _cpu_hijos())
+    _etapas.clear()
+    _vacas.clear()
+    _pila.clear()
+
+
+def activo() -> bool:
+    return _activo
+
+
+def _cpu_hijos():
+    tiempos = os.times()
+    return tiempos.children_user + tiempos.children_system
+
+
+def _acumulador(nombre):
+    return _etapas.setdefault(nombre, {
+        "wall_s": 0.0, "cpu_s": 0.0, "filas": 0, "llamadas": 0,
+        "rss_pico_delta_mb": 0.0, "rss_delta_mb": 0.0})
+
+
+def _memoria():
+    """(pico, actual) de memoria residente en MB, 0.0 lo que no se pueda medir."""
+    actual = memoria_actual_mb() if _hay_rss_actual else None
+    return memoria_pico_mb() or 0.0, actual or 0.0
+
+
+@contextmanager
+def etapa(nombre: str):
+    """
+    Mide una etapa. Entrega un dict donde anotar las filas procesadas
+    (medicion["filas"] = n); sin activar() ni perfilar() solo entrega el dict.
+    """
+    medicion = {"filas": 0}
+    if not _activo and _perfil is None:
+        yield medicion
+        return
+
+    # Cada nivel de la pila acumula el tiempo y la memoria de sus etapas
+    # anidadas (wall, cpu, subida del pico, cambio de memoria actual)
+    _pila.append([0.0, 0.0, 0.0, 0.0])
+    if _perfil is not None:
+        _entrar_perfil(nombre)
+    pico0, actual0 = _memoria()
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    try:
+        yield medicion
+    finally:
+        wall = time.perf_counter() - wall0
+        cpu = time.process_time() - cpu0
+        if _perfil is not None:
+            _salir_perfil(nombre)
+        pico1, actual1 = _memoria()
+        medidas = (wall, cpu, pico1 - pico0, actual1 - actual0)
+        anidadas = _pila.pop()
+        if _pila:
+            for i, valor in enumerate(medidas):
+                _pila[-1][i] += valor
+
+        acumulado = _acumulador(nombre)
+        for i, clave in enumerate(("wall_s", "cpu_s", "rss_pico_delta_mb", "rss_delta_mb")):
+            acumulado[clave] += medidas[i] - anidadas[i]
+        acumulado["filas"] += int(medicion["filas"])
+        acumulado["llamadas"] += 1
+
+
+@contextmanager
+def por_vaca(vaca):
+    """Suma el tiempo real del bloque (con sus etapas) a la vaca indicada."""
+    if not _activo:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        clave = str(vaca)
+        _vacas[clave] = _vacas.get(clave, 0.0) + time.perf_counter() - inicio
+
+
+def exportar() -> dict:
+    """Lo medido en este proceso (para devolverlo desde un worker) y reinicia."""
+    datos = {"etapas": {k: dict(v) for k, v in _etapas.items()}, "vacas": dict(_vacas)}
+    _etapas.clear()
+    _vacas.clear()
+    return datos
+
+
+def combinar(datos: dict):
+    """Suma lo exportado por otro proceso a lo medido en este."""
+    if not _activo or not datos:
+        return
+    for nombre, otro in datos.get("etapas", {}).items():
+        acumulado = _acumulador(nombre)
+        # Cada proceso tiene su propia memoria: las subidas se suman
+        for clave in ("wall_s", "cpu_s", "filas", "llamadas",
+                      "rss_pico_delta_mb", "rss_delta_mb"):
+            acumulado[clave] += otro[clave]
+    for vaca, segundos in datos.get("vacas", {}).items():
+        _vacas[vaca] = _vacas.get(vaca, 0.0) + segundos
+
+
+def resumen() -> dict:
+    """Bloque "metrics" para el JSON de salida."""
+    wall = time.perf_counter() - _inicio[0]
+    cpu = time.process_time() - _inicio[1] + _cpu_hijos() - _inicio[2]
+    etapas = {}
+    for nombre in list(ETAPAS) + [e for e in _etapas if e not in ETAPAS]:
+        if nombre not in _etapas:
+            continue
+        acumulado = _etapas[nombre]
+        etapas[nombre] = {
+            "wall_s": round(acumulado["wall_s"], 4),
+            "cpu_s": round(acumulado["cpu_s"], 4),
+            "filas": acumulado["filas"],
+            "filas_por_s": (round(acumulado["filas"] / acumulado["wall_s"], 1)
+                            if acumulado["wall_s"] > 0 else None),
+            "llamadas": acumulado["llamadas"],
+            "rss_pico_delta_mb": round(acumulado["rss_pico_delta_mb"], 1),
+            "rss_delta_mb": (round(acumulado["rss_delta_mb"], 1)
+                             if _hay_rss_actual else None),
+        }
+    lentas = sorted(_vacas.items(), key=lambda item: item[1], reverse=True)[:N_VACAS_LENTAS]
+    pico = memoria_pico_mb()
+    return {
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "rss_max_mb": round(pico, 1) if pico is not None else None,
+        "etapas": etapas,
+        "vacas_lentas": [{"vaca": vaca, "wall_s": round(s, 4)} for vaca, s in lentas],
+    }
+
+
+def perfilando() -> bool:
+    return _perfil is not None
+
+
+def directorio_perfiles():
+    return _perfil["directorio"] if _perfil is not None else None
+
+
+def perfilar(directorio: str):
+    """
+    Activa --profile en este proceso: las etapas siguientes corren bajo
+    cProfile y tracemalloc. Un worker heredado por fork empieza de cero.
+    """
+    global _perfil
+    if _perfil is not None and _perfil["pid"] == os.getpid() \
+            and _perfil["directorio"] == directorio:
+        return
+    os.makedirs(directorio, exist_ok=True)
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _perfil = {"directorio": directorio, "pid": os.getpid(), "etapas": {}, "pila": []}
+
+
+def _datos_perfil(nombre):
+    return _perfil["etapas"].setdefault(nombre, {
+        "cprofile": cProfile.Profile(), "pico_bytes": 0, "neto_bytes": 0})
+
+
+def _entrar_perfil(nombre):
+    # Solo un perfilador puede estar activo: el de la etapa que envuelve a
+    # esta se pausa y se retoma al salir (perfiles exclusivos, como wall_s)
+    pila = _perfil["pila"]
+    actual, pico = tracemalloc.get_traced_memory()
+    if pila:
+        externa = pila[-1]
+        _datos_perfil(externa["nombre"])["cprofile"].disable()
+        externa["pico"] = max(externa["pico"], pico)
+    tracemalloc.reset_peak()
+    pila.append({"nombre": nombre, "inicial": actual, "pico": 0})
+    _datos_perfil(nombre)["cprofile"].enable()
+
+
+def _salir_perfil(nombre):
+    datos = _datos_perfil(nombre)
+    datos["cprofile"].disable()
+    marco = _perfil["pila"].pop()
+    actual, pico = tracemalloc.get_traced_memory()
+    datos["pico_bytes"] = max(datos["pico_bytes"], max(marco["pico"], pico) - marco["inicial"])
+    datos["neto_bytes"] += actual - marco["inicial"]
+    tracemalloc.reset_peak()
+    if _perfil["pila"]:
+        externa = _perfil["pila"][-1]
+        externa["pico"] = max(externa["pico"], pico)
+        _datos_perfil(externa["nombre"])["cprofile"].enable()
+
+
+def guardar_perfiles():
+    """
+    Escribe los archivos de --profile con lo acumulado hasta ahora (se
+    pueden reescribir, p. ej. tras cada trabajo del modo worker).
+
+    Returns:
+        Lista de rutas escritas
+    """
+    if _perfil is None:
+        return []
+    # Los workers agregan su pid para no pisar los archivos del proceso principal
+    sufijo = "" if multiprocessing.parent_process() is None else f".{_perfil['pid']}"
+    escritas = []
+    for nombre, datos in _perfil["etapas"].items():
+        base = os.path.join(_perfil["directorio"], nombre + sufijo)
+        try:
+            estadisticas = pstats.Stats(datos["cprofile"])
+        except TypeError:  # la etapa no llegó a ejecutar código Python
+            continue
+        estadisticas.dump_stats(base + ".prof")
+
+        texto = io.StringIO()
+        estadisticas.stream = texto
+        estadisticas.sort_stats("cumulative").print_stats(N_PERFIL)
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(f"Etapa: {nombre}\n")
+            f.write(f"Pico de memoria Python (tracemalloc): "
+                    f"{datos['pico_bytes'] / (1024 * 1024):.1f} MB\n")
+            f.write(f"Memoria que la etapa dejó asignada: "
+                    f"{datos['neto_bytes'] / (1024 * 1024):.1f} MB\n\n")
+            f.write(texto.getvalue())
+        escritas += [base + ".prof", base + ".txt"]
+    return escritas
+
+
+def serializar(resultado: dict, filas: int = 0, **kwargs) -> str:
+    """
+    json.dumps(resultado, **kwargs) medido como etapa "serialize" (filas:
+    registros que contiene el resultado). Si las métricas están activas se
+    agrega al final la clave "metrics" (sin volver a serializar el resultado).
+    """
+    with etapa("serialize") as medicion:
+        texto = json.dumps(resultado, **kwargs)
+        medicion["filas"] = filas
+    if not _activo or not isinstance(resultado, dict):
+        return texto
+    bloque = '"metrics": ' + json.dumps(resumen(), **kwargs)
+    return texto[:-1] + (", " if resultado else "") + bloque + "}"
@@ -6,42 +6,110 @@
 #   2) Limpiar datos y renombrar columnas técnicas
 #   3) Generar features (básicas + asimetría/variabilidad/temporalidad)
 #   4) Guardar un archivo de features POR CADA vaca en processed/
+#      (--format npz por defecto, feather o csv; ver almacen_features.py)
 #   5) Devolver JSON con resultados
 #
+# Con --workers N los archivos se reparten en un pool de procesos; con
+# --timeout cada archivo tiene un tiempo máximo y sus fallos quedan aislados.
+#
+# En la carpeta de salida se guarda un manifiesto (manifest.json) con el hash
+# de cada CSV de entrada, la versión del código de features (hash de su
+# fuente, ver CODIGO_FEATURES) y el tamaño / fecha de cada archivo de salida:
+# los archivos que no cambiaron desde la última corrida no se reprocesan (se
+# reportan "cached").
+#
+# --log-level elige el detalle de los mensajes de stderr (ver diagnostico.py);
+# --timings y --profile miden / perfilan cada etapa (ver metricas.py).
+#
 import argparse
 import os
 import glob
 import re
 import sys
 import json
-from datetime import datetime
+import time
+import marshal
+import hashlib
+import inspect
+import multiprocessing
+import multiprocessing.connection
 
 import pandas as pd
 import numpy as np
 
+import metricas
+import diagnostico
+import fechas_ordeno
+import features_cuartos
+import registro_features
+from registro_features import calcular_features, nombres_features, filtrar_features
+from almacen_features import (FORMATOS, FORMATO_DEFECTO, resolver_formato,
+                              nombre_features, formato_de_ruta,
+                              buscar_archivos_features, escribir_features,
+                              leer_features, leer_columnas, ruta_parte,
+                              numero_parte, buscar_partes, PARTES_MAXIMAS)
+
+
+# Nombre del manifiesto de archivos procesados dentro de la carpeta de salida
+MANIFIESTO = "manifest.json"
+
 
 # -------------------------------------------------------------------
 # 1. Leer UN solo CSV de ordeños
 # -------------------------------------------------------------------
+def vaca_id_de_archivo(ruta_csv: str) -> str:
+    """ID numérico de la vaca a partir del nombre del archivo."""
+    nombre_archivo = os.path.basename(ruta_csv).replace(".csv", "")
+    match = re.search(r"(\d+)", nombre_archivo)
+    return match.group(1) if match else nombre_archivo
+
+
 def leer_csv_individual(ruta_csv: str) -> pd.DataFrame:
     """Lee un archivo CSV individual y agrega el ID de la vaca."""
-    print(f"[INFO] Leyendo archivo: {ruta_csv}", file=sys.stderr)
+    diagnostico.info(f"Leyendo archivo: {ruta_csv}")
 
     # header=1 porque la primera fila es un encabezado de grupo
-    df = pd.read_csv(ruta_csv, header=1)
+    with metricas.etapa("read") as medicion:
+        df = pd.read_csv(ruta_csv, header=1)
+        medicion["filas"] = len(df)
 
     # Extraer ID de vaca del nombre del archivo
     nombre_archivo = os.path.basename(ruta_csv).replace(".csv", "")
     df["Archivo_origen"] = nombre_archivo
+    vaca_id = vaca_id_de_archivo(ruta_csv)
 
-    # Extraer el ID numérico de la vaca
-    match = re.search(r"(\d+)", nombre_archivo)
-    vaca_id = match.group(1) if match else nombre_archivo
-
-    print(f"[INFO] Vaca ID: {vaca_id}, Filas: {len(df)}", file=sys.stderr)
+    diagnostico.info(f"Vaca ID: {vaca_id}, Filas: {len(df)}")
     return df, vaca_id
 
 
+def leer_csv_por_bloques(ruta_csv: str, filas_por_bloque: int):
+    """
+    Lee un CSV individual en bloques de a lo sumo filas_por_bloque filas.
+    Genera (df, vaca_id) por bloque, con las mismas columnas que
+    leer_csv_individual; en memoria nunca hay más de un bloque.
+    """
+    diagnostico.info(
+        f"Leyendo archivo en bloques de {filas_por_bloque} filas: {ruta_csv}")
+
+    nombre_archivo = os.path.basename(ruta_csv).replace(".csv", "")
+    vaca_id = vaca_id_de_archivo(ruta_csv)
+
+    # header=1 porque la primera fila es un encabezado de grupo
+    with pd.read_csv(ruta_csv, header=1, chunksize=filas_por_bloque) as lector:
+        while True:
+            with metricas.etapa("read") as medicion:
+                df = next(lector, None)
+                if df is None:
+                    break
+                # El tipo se infiere por bloque: una columna entera en un bloque sin
+                # vacíos es float en el archivo completo si en algún otro lo hay
+                enteras = df.select_dtypes(include="integer").columns
+                df[enteras] = df[enteras].astype(np.float64)
+                df["Archivo_origen"] = nombre_archivo
+                medicion["filas"] = len(df)
+            yield df, vaca_id
+
+
 # -------------------------------------------------------------------
 # 1b. Combinar CSV (para compatibilidad, si se necesita)
 # -------------------------------------------------------------------
@@ -52,8 +120,8 @@ def combinar_csvs(input_dir: str) -> pd.DataFrame:
     if not archivos:
         raise FileNotFoundError(f"No se encontraron CSV en: {patron}")
 
-    print(
-        f"[INFO] Se encontraron {len(archivos)} archivos CSV.", file=sys.stderr)
+    diagnostico.info(
+        f"Se encontraron {len(archivos)} archivos CSV.")
 
     dfs = []
     for ruta in archivos:
@@ -65,34 +133,22 @@ def combinar_csvs(input_dir: str) -> pd.DataFrame:
         dfs.append(df)
 
     df_final = pd.concat(dfs, ignore_index=True)
-    print(
-        f"[INFO] DataFrame combinado con forma: {df_final.shape}", file=sys.stderr)
+    diagnostico.info(
+        f"DataFrame combinado con forma: {df_final.shape}")
     return df_final
 
 
 # -------------------------------------------------------------------
-# 2. Parsear hora (utilidad)
+# 2. Limpieza de datos (columnas, NaN, IDs, etc.)
 # -------------------------------------------------------------------
-def parsear_hora(fecha_str: str):
-    """Convierte 'dd/mm/YYYY hh:mm AM/PM' a datetime, o NaT si falla."""
-    if pd.isna(fecha_str):
-        return pd.NaT
-    fecha_str = str(fecha_str).strip()
-    # Normalizar a. m. / p. m.
-    fecha_str = fecha_str.replace("a. m.", "AM").replace("p. m.", "PM")
-    try:
-        return datetime.strptime(fecha_str, "%d/%m/%Y %I:%M %p")
-    except Exception:
-        try:
-            return datetime.strptime(fecha_str, "%d/%m/%Y %H:%M")
-        except Exception:
-            return pd.NaT
-
+def limpiar_datos(df: pd.DataFrame, mapa_eopo: dict = None) -> pd.DataFrame:
+    """
+    Elimina columnas y filas no útiles, crea EOPO_ID y el ID de vaca.
 
-# -------------------------------------------------------------------
-# 3. Limpieza de datos (columnas, NaN, IDs, etc.)
-# -------------------------------------------------------------------
-def limpiar_datos(df: pd.DataFrame) -> pd.DataFrame:
+    mapa_eopo: mapeo EO/PO -> EOPO_ID de corridas anteriores (modo incremental).
+    Si se pasa, se reutiliza y se extiende en el mismo dict con los valores
+    nuevos, para que los IDs no cambien entre corridas.
+    """
     # Columnas a eliminar (si existen)
     columnas_a_eliminar = [
         "Patada",
@@ -107,43 +163,45 @@ def limpiar_datos(df: pd.DataFrame) -> pd.DataFrame:
     cols_existentes = [c for c in columnas_a_eliminar if c in df.columns]
     if cols_existentes:
         df = df.drop(columns=cols_existentes)
-        print(
-            f"[INFO] Columnas eliminadas: {cols_existentes}", file=sys.stderr)
+        diagnostico.detalle(lambda: f"Columnas eliminadas: {cols_existentes}")
 
     filas_antes = len(df)
     df = df.dropna()
     filas_despues = len(df)
-    print(
-        f"[INFO] Filas eliminadas por NaN: {filas_antes - filas_despues} "
-        f"(antes: {filas_antes}, después: {filas_despues})",
-        file=sys.stderr
-    )
+    diagnostico.info(
+        f"Filas eliminadas por NaN: {filas_antes - filas_despues} "
+        f"(antes: {filas_antes}, después: {filas_despues})")
 
     # Eliminar 'Acción' si existe
     if "Acción" in df.columns:
         df = df.drop(columns=["Acción"])
-        print("[INFO] Columna 'Acción' eliminada.", file=sys.stderr)
+        diagnostico.info("Columna 'Acción' eliminada.")
 
     # Crear EOPO_ID a partir de 'EO/PO'
     if "EO/PO" in df.columns:
-        mapping_eopo = {val: idx for idx, val in enumerate(
-            df["EO/PO"].unique(), start=1)}
+        if mapa_eopo is None:
+            mapping_eopo = {val: idx for idx, val in enumerate(
+                df["EO/PO"].unique(), start=1)}
+        else:
+            for val in df["EO/PO"].unique():
+                mapa_eopo.setdefault(val, len(mapa_eopo) + 1)
+            mapping_eopo = mapa_eopo
         df["EOPO_ID"] = df["EO/PO"].map(mapping_eopo)
-        print(
-            f"[INFO] Se asignaron {len(mapping_eopo)} valores únicos a 'EOPO_ID'.", file=sys.stderr)
+        diagnostico.info(
+            f"Se asignaron {len(mapping_eopo)} valores únicos a 'EOPO_ID'.")
 
     # Renombrar Archivo_origen → vaca y limpiar ID numérico
     if "Archivo_origen" in df.columns:
         df = df.rename(columns={"Archivo_origen": "vaca"})
         df["vaca"] = df["vaca"].astype(str).str.extract(r"(\d+)")
-        print(
-            "[INFO] Columna 'Archivo_origen' renombrada a 'vaca' y limpiada.", file=sys.stderr)
+        diagnostico.info(
+            "Columna 'Archivo_origen' renombrada a 'vaca' y limpiada.")
 
     return df
 
 
 # -------------------------------------------------------------------
-# 4. Renombrar columnas técnicas (DI, DI.1, etc.)
+# 3. Renombrar columnas técnicas (DI, DI.1, etc.)
 # -------------------------------------------------------------------
 def renombrar_columnas_basicas(df: pd.DataFrame) -> pd.DataFrame:
     renombrar_columnas = {
@@ -185,24 +243,23 @@ def renombrar_columnas_basicas(df: pd.DataFrame) -> pd.DataFrame:
                         v in renombrar_columnas.items() if k in df.columns}
     df = df.rename(columns=cols_a_renombrar)
     if cols_a_renombrar:
-        print(
-            f"[INFO] Columnas renombradas: {list(cols_a_renombrar.values())}", file=sys.stderr)
+        diagnostico.detalle(
+            lambda: f"Columnas renombradas: {list(cols_a_renombrar.values())}")
     return df
 
 
 # -------------------------------------------------------------------
-# 5. Features básicas (flujo, conductividad, producción)
+# 4. Features básicas (flujo, conductividad, producción)
 # -------------------------------------------------------------------
-def crear_features_basicas(df: pd.DataFrame) -> pd.DataFrame:
+def crear_features_basicas(df: pd.DataFrame, features=None) -> pd.DataFrame:
     """
     Añade columnas de promedios, std, rangos y producción.
+    Las fórmulas están en registro_features.
+
+    features: si se indica, solo se calculan esas (y las que necesitan).
     """
     flujo_cols = ["FlujoMedio_DI", "FlujoMedio_DD",
                   "FlujoMedio_TI", "FlujoMedio_TD"]
-    conduct_cols = ["Conductividad_DI", "Conductividad_DD",
-                    "Conductividad_TI", "Conductividad_TD"]
-    prod_cols = ["Produccion_DI", "Produccion_DD",
-                 "Produccion_TI", "Produccion_TD"]
 
     # Verificar que existen las columnas necesarias
     if not all(c in df.columns for c in flujo_cols):
@@ -210,133 +267,31 @@ def crear_features_basicas(df: pd.DataFrame) -> pd.DataFrame:
               file=sys.stderr)
         return df
 
-    # --- Promedios de flujo y conductividad ---
-    df["FlujoMedio_promedio"] = df[flujo_cols].mean(axis=1)
-
-    if all(c in df.columns for c in conduct_cols):
-        df["Conductividad_promedio"] = df[conduct_cols].mean(axis=1)
-        df["Conductividad_std"] = df[conduct_cols].std(axis=1)
-        df["Conductividad_rango"] = df[conduct_cols].max(
-            axis=1) - df[conduct_cols].min(axis=1)
-        df["Conductividad_diff_max_prom"] = df[conduct_cols].max(
-            axis=1) - df[conduct_cols].mean(axis=1)
-        df["Conductividad_diff_min_prom"] = df[conduct_cols].mean(
-            axis=1) - df[conduct_cols].min(axis=1)
-        df["Conductividad_izq"] = df[[
-            "Conductividad_DI", "Conductividad_TI"]].mean(axis=1)
-        df["Conductividad_der"] = df[[
-            "Conductividad_DD", "Conductividad_TD"]].mean(axis=1)
-
-    # --- Desviación estándar de flujo ---
-    df["FlujoMedio_std"] = df[flujo_cols].std(axis=1)
-
-    # --- Promedios por lado (izquierdo vs derecho) ---
-    df["FlujoMedio_izq"] = df[["FlujoMedio_DI", "FlujoMedio_TI"]].mean(axis=1)
-    df["FlujoMedio_der"] = df[["FlujoMedio_DD", "FlujoMedio_TD"]].mean(axis=1)
-
-    # --- Relación flujo/conductividad promedio ---
-    if "Conductividad_promedio" in df.columns:
-        df["FlujoConductividad_ratio"] = df["FlujoMedio_promedio"] / \
-            (df["Conductividad_promedio"] + 1e-6)
-
-    # --- Producción: promedios, totales y diferencias ---
-    if all(c in df.columns for c in prod_cols):
-        df["Produccion_promedio"] = df[prod_cols].mean(axis=1)
-        df["Produccion_total"] = df[prod_cols].sum(axis=1)
-        df["Produccion_izq"] = df[[
-            "Produccion_DI", "Produccion_TI"]].sum(axis=1)
-        df["Produccion_der"] = df[[
-            "Produccion_DD", "Produccion_TD"]].sum(axis=1)
-        df["Produccion_diff_lados"] = (
-            df["Produccion_izq"] - df["Produccion_der"]).abs()
-        df["Produccion_std"] = df[prod_cols].std(axis=1)
-        df["Produccion_ratio_lados"] = (
-            df[["Produccion_izq", "Produccion_der"]].max(axis=1)
-            / (df[["Produccion_izq", "Produccion_der"]].min(axis=1) + 1e-6)
-        )
-        df["Produccion_rango"] = df[prod_cols].max(
-            axis=1) - df[prod_cols].min(axis=1)
-        df["Eficiencia_flujo_produccion"] = df["FlujoMedio_promedio"] / \
-            (df["Produccion_promedio"] + 1e-6)
+    # Fórmulas en registro_features (compartidas con los demás pipelines)
+    calcular_features(df, filtrar_features(nombres_features("basicas"), features))
 
     return df
 
 
 # -------------------------------------------------------------------
-# 6. Features de asimetría, variabilidad y temporalidad
+# 5. Features de asimetría, variabilidad y temporalidad
 # -------------------------------------------------------------------
-def crear_features_asimetria_temporalidad(df: pd.DataFrame) -> pd.DataFrame:
-    flujo_cols = ["FlujoMedio_DI", "FlujoMedio_DD",
-                  "FlujoMedio_TI", "FlujoMedio_TD"]
+def crear_features_asimetria_temporalidad(df: pd.DataFrame, estado_previo: dict = None,
+                                          features=None) -> pd.DataFrame:
+    """
+    Añade features de asimetría, variabilidad y las temporales (prev/delta).
 
-    # Diferencias entre lados
-    if "FlujoMedio_izq" in df.columns and "FlujoMedio_der" in df.columns:
-        df["Flujo_diff_lados"] = (
-            df["FlujoMedio_izq"] - df["FlujoMedio_der"]).abs()
-
-    if "Conductividad_izq" in df.columns and "Conductividad_der" in df.columns:
-        df["Conductividad_diff_lados"] = (
-            df["Conductividad_izq"] - df["Conductividad_der"]).abs()
-
-    # Índices de asimetría
-    if "FlujoMedio_std" in df.columns and "FlujoMedio_promedio" in df.columns:
-        df["Indice_asimetria_flujo"] = df["FlujoMedio_std"] / \
-            (df["FlujoMedio_promedio"] + 1e-6)
-
-    if "Conductividad_std" in df.columns and "Conductividad_promedio" in df.columns:
-        df["Indice_asimetria_conductividad"] = df["Conductividad_std"] / \
-            (df["Conductividad_promedio"] + 1e-6)
-
-    # Ratio flujo máximo / mínimo entre los cuatro cuartos
-    if all(c in df.columns for c in flujo_cols):
-        df["Flujo_ratio_max_min"] = df[flujo_cols].max(
-            axis=1) / (df[flujo_cols].min(axis=1) + 1e-6)
-
-    # Eficiencia fisiológica
-    if "Produccion_promedio" in df.columns and "Conductividad_promedio" in df.columns:
-        df["Eficiencia_conductividad"] = df["Produccion_promedio"] / \
-            (df["Conductividad_promedio"] + 1e-6)
-        df["Flujo_conductividad_balance"] = df["FlujoMedio_promedio"] / \
-            (df["Conductividad_promedio"] + 1e-6)
-
-    if "Produccion_total" in df.columns:
-        df["Flujo_por_kg"] = df["FlujoMedio_promedio"] / \
-            (df["Produccion_total"] + 1e-6)
-        if "Conductividad_promedio" in df.columns:
-            df["Conductividad_por_kg"] = df["Conductividad_promedio"] / \
-                (df["Produccion_total"] + 1e-6)
-
-    if "Conductividad_promedio" in df.columns and "FlujoMedio_promedio" in df.columns:
-        df["Conductividad_sobre_flujo"] = df["Conductividad_promedio"] / \
-            (df["FlujoMedio_promedio"] + 1e-6)
-
-    # Indicadores de variabilidad
-    if "FlujoMedio_std" in df.columns and "FlujoMedio_promedio" in df.columns:
-        df["CV_flujo"] = df["FlujoMedio_std"] / \
-            (df["FlujoMedio_promedio"] + 1e-6)
-
-    if "Conductividad_std" in df.columns and "Conductividad_promedio" in df.columns:
-        df["CV_conductividad"] = df["Conductividad_std"] / \
-            (df["Conductividad_promedio"] + 1e-6)
-
-    if "Conductividad_rango" in df.columns and "Conductividad_promedio" in df.columns:
-        df["Conductividad_rango_relativo"] = df["Conductividad_rango"] / \
-            (df["Conductividad_promedio"] + 1e-6)
-
-    if "FlujoMedio_std" in df.columns and "Conductividad_std" in df.columns:
-        df["Indice_variabilidad_total"] = (
-            df["FlujoMedio_std"] + df["Conductividad_std"]) / 2
-
-    # Score de anomalía simple
-    score_cols = []
-    if "Conductividad_rango_relativo" in df.columns:
-        score_cols.append("Conductividad_rango_relativo")
-    if "Indice_asimetria_flujo" in df.columns:
-        score_cols.append("Indice_asimetria_flujo")
-    if "Indice_asimetria_conductividad" in df.columns:
-        score_cols.append("Indice_asimetria_conductividad")
-    if score_cols:
-        df["Score_anomalia_simple"] = df[score_cols].sum(axis=1)
+    estado_previo: {vaca: {"Produccion_promedio": x, "Conductividad_promedio": y}}
+    con el último registro ya procesado de cada vaca (modo incremental). Si se
+    pasa, el primer registro nuevo de cada vaca toma su *_prev de ahí en vez de
+    quedar vacío. Ver estado_temporal.
+
+    features: si se indica, solo se calculan esas de asimetría/variabilidad
+    (y las que necesitan); las temporales se calculan siempre.
+    """
+    # Asimetría y variabilidad (registro_features)
+    calcular_features(df, filtrar_features(nombres_features("asimetria"), features),
+                      variante="ordenos")
 
     # Variables temporales (orden por vaca y fecha)
     if "fecha" in df.columns and "vaca" in df.columns:
@@ -346,6 +301,8 @@ def crear_features_asimetria_temporalidad(df: pd.DataFrame) -> pd.DataFrame:
         if "Produccion_promedio" in df.columns:
             df["Produccion_promedio_prev"] = df.groupby(
                 "vaca")["Produccion_promedio"].shift(1)
+            sembrar_prev(df, "Produccion_promedio_prev",
+                         "Produccion_promedio", estado_previo)
             df["delta_produccion_promedio"] = df["Produccion_promedio"] - \
                 df["Produccion_promedio_prev"]
             df["tasa_cambio_produccion"] = df["delta_produccion_promedio"] / \
@@ -354,6 +311,8 @@ def crear_features_asimetria_temporalidad(df: pd.DataFrame) -> pd.DataFrame:
         if "Conductividad_promedio" in df.columns:
             df["Conductividad_promedio_prev"] = df.groupby(
                 "vaca")["Conductividad_promedio"].shift(1)
+            sembrar_prev(df, "Conductividad_promedio_prev",
+                         "Conductividad_promedio", estado_previo)
             df["delta_conductividad_promedio"] = df["Conductividad_promedio"] - \
                 df["Conductividad_promedio_prev"]
             df["tasa_cambio_conductividad"] = df["delta_conductividad_promedio"] / \
@@ -366,36 +325,213 @@ def crear_features_asimetria_temporalidad(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def sembrar_prev(df: pd.DataFrame, col_prev: str, col_base: str,
+                 estado_previo: dict = None):
+    """
+    Rellena col_prev del primer registro de cada vaca con el valor de col_base
+    guardado en estado_previo (in place). df debe estar ordenado por vaca.
+    """
+    if not estado_previo:
+        return
+
+    primeras = ~df["vaca"].duplicated(keep="first")
+    semillas = df.loc[primeras, "vaca"].astype(str).map(
+        lambda v: estado_previo.get(v, {}).get(col_base, np.nan))
+    df.loc[primeras, col_prev] = semillas.astype(float)
+
+
+def estado_temporal(df: pd.DataFrame) -> dict:
+    """
+    Último Produccion_promedio / Conductividad_promedio de cada vaca, en el
+    formato que espera crear_features_asimetria_temporalidad(estado_previo=...).
+    """
+    columnas = [c for c in ["Produccion_promedio", "Conductividad_promedio"]
+                if c in df.columns]
+    if "vaca" not in df.columns or not columnas or df.empty:
+        return {}
+
+    ultimos = df.groupby("vaca", sort=False)[columnas].last()
+    return {str(vaca): {c: float(fila[c]) for c in columnas}
+            for vaca, fila in ultimos.iterrows()}
+
+
 # -------------------------------------------------------------------
-# 7. Procesar UN archivo individual completo
+# 6. Procesar UN archivo individual completo
 # -------------------------------------------------------------------
-def procesar_archivo_individual(ruta_csv: str, output_dir: str) -> dict:
+def generar_features_archivo(ruta_csv: str, estado_previo: dict = None,
+                             mapa_eopo: dict = None, features=None):
     """
-    Procesa un archivo CSV individual y guarda el resultado con features.
-    Retorna un dict con información del procesamiento.
+    Lee, limpia y genera las features de un CSV individual en memoria.
+    Retorna (df_features, vaca_id) sin escribir nada a disco.
+
+    estado_previo y mapa_eopo son para el modo incremental, ver
+    crear_features_asimetria_temporalidad y limpiar_datos. features limita
+    las features del registro que se calculan (por defecto todas).
     """
-    try:
-        # 1) Leer CSV individual
-        df, vaca_id = leer_csv_individual(ruta_csv)
+    # 1) Leer CSV individual
+    df, vaca_id = leer_csv_individual(ruta_csv)
+
+    # 2-4) Limpiar, renombrar y generar features
+    df_features = features_de_ordenos(
+        df, estado_previo=estado_previo, mapa_eopo=mapa_eopo, features=features)
+
+    return df_features, vaca_id
 
+
+def generar_features_por_bloques(ruta_csv: str, filas_por_bloque: int,
+                                 estado_previo: dict = None, mapa_eopo: dict = None,
+                                 features=None):
+    """
+    Como generar_features_archivo, pero leyendo el CSV por bloques: genera
+    (df_features, vaca_id) por bloque y la memoria queda acotada por el tamaño
+    del bloque, no del archivo.
+
+    Entre bloques se arrastra el mismo estado que en el modo incremental: el
+    mapeo EO/PO -> EOPO_ID y el último registro de cada vaca (para *_prev),
+    así que los bloques concatenados dan lo mismo que el archivo completo
+    (los ordeños vienen en orden cronológico en los exportes).
+    """
+    estado = dict(estado_previo or {})
+    mapa_eopo = {} if mapa_eopo is None else mapa_eopo
+
+    for df, vaca_id in leer_csv_por_bloques(ruta_csv, filas_por_bloque):
+        df_features = features_de_ordenos(
+            df, estado_previo=estado, mapa_eopo=mapa_eopo, features=features)
+        estado.update(estado_temporal(df_features))
+        yield df_features, vaca_id
+
+
+def formato_por_bloques(formato: str) -> str:
+    """
+    Formato de salida al procesar por bloques. npz/feather guardan arreglos
+    completos y agregar un bloque obliga a reescribir el archivo, así que se
+    usa csv, al que se le agregan filas al final.
+    """
+    if formato != "csv":
+        print(
+            f"[WARN] Procesando por bloques las features se guardan en csv (no {formato})",
+            file=sys.stderr)
+    return "csv"
+
+
+def features_de_ordenos(df: pd.DataFrame, estado_previo: dict = None,
+                        mapa_eopo: dict = None, features=None) -> pd.DataFrame:
+    """Limpia, renombra y genera las features de ordeños ya leídos."""
+    with metricas.etapa("clean") as medicion:
         # 2) Limpiar datos
-        df_limpio = limpiar_datos(df)
+        df_limpio = limpiar_datos(df, mapa_eopo=mapa_eopo)
 
         # 3) Renombrar columnas básicas
         df_limpio = renombrar_columnas_basicas(df_limpio)
+        medicion["filas"] = len(df_limpio)
 
-        # 4) Generar features
-        df_features = crear_features_basicas(df_limpio.copy())
-        df_features = crear_features_asimetria_temporalidad(df_features)
+    # 4) Generar features
+    with metricas.etapa("features") as medicion:
+        df_features = crear_features_basicas(df_limpio.copy(), features=features)
+        df_features = crear_features_asimetria_temporalidad(
+            df_features, estado_previo=estado_previo, features=features)
+        medicion["filas"] = len(df_features)
+    return df_features
 
-        # 5) Guardar archivo procesado
-        os.makedirs(output_dir, exist_ok=True)
-        output_filename = f"vaca_{vaca_id}_features.csv"
-        output_path = os.path.join(output_dir, output_filename)
-        df_features.to_csv(output_path, index=False)
 
-        print(
-            f"[OK] Archivo procesado guardado: {output_path}", file=sys.stderr)
+def guardar_features_vaca(df_features: pd.DataFrame, vaca_id: str, output_dir: str,
+                          formato: str = FORMATO_DEFECTO, comprimir: bool = False):
+    """
+    Guarda las features de una vaca en output_dir con el formato indicado y
+    borra los archivos de la misma vaca en otros formatos y las partes (ver
+    anexar_features_vaca). Retorna (nombre, ruta).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    output_filename = nombre_features(vaca_id, formato)
+    output_path = os.path.join(output_dir, output_filename)
+    with metricas.etapa("serialize") as medicion:
+        escribir_features(df_features, output_path, comprimir=comprimir)
+        medicion["filas"] = len(df_features)
+
+    for ruta in buscar_archivos_features(output_dir, vaca_id):
+        for parte in buscar_partes(ruta):
+            os.remove(parte)
+        if os.path.basename(ruta) != output_filename:
+            os.remove(ruta)
+
+    print(
+        f"[OK] Archivo procesado guardado: {output_path}", file=sys.stderr)
+    return output_filename, output_path
+
+
+def anexar_features_vaca(df_features: pd.DataFrame, vaca_id: str, output_dir: str,
+                         formato: str = FORMATO_DEFECTO, comprimir: bool = False):
+    """
+    Agrega filas nuevas al archivo de features de una vaca (modo incremental),
+    respetando el orden de columnas del archivo existente. Si no existe, lo crea.
+    Retorna (nombre, ruta).
+
+    En csv las filas se agregan al final del archivo. En npz/feather van a una
+    parte nueva (vaca_<id>_features.<n>.<ext>, ver almacen_features), así que
+    cada corrida escribe solo sus filas; al llegar a PARTES_MAXIMAS partes se
+    compactan en el principal, que se reescribe con todo el historial.
+    """
+    output_filename = nombre_features(vaca_id, formato)
+    output_path = os.path.join(output_dir, output_filename)
+    existentes = buscar_archivos_features(output_dir, vaca_id)
+    if not existentes:
+        return guardar_features_vaca(
+            df_features, vaca_id, output_dir, formato, comprimir)
+
+    partes = buscar_partes(output_path) if existentes == [output_path] else []
+    if existentes == [output_path] and formato_de_ruta(output_path) == "csv":
+        # CSV: se agregan las filas al final sin reescribir el archivo
+        with metricas.etapa("serialize") as medicion:
+            columnas = leer_columnas(output_path)
+            df_features.reindex(columns=columnas).to_csv(
+                output_path, mode="a", header=False, index=False)
+            medicion["filas"] = len(df_features)
+    elif existentes == [output_path] and len(partes) < PARTES_MAXIMAS:
+        # Formatos binarios: las filas nuevas van a una parte aparte
+        numero = numero_parte(partes[-1]) + 1 if partes else 1
+        output_path = ruta_parte(output_path, numero)
+        output_filename = os.path.basename(output_path)
+        with metricas.etapa("serialize") as medicion:
+            columnas = leer_columnas(existentes[0])
+            escribir_features(df_features.reindex(columns=columnas), output_path,
+                              comprimir=comprimir)
+            medicion["filas"] = len(df_features)
+    else:
+        # Compactar las partes (o cambio de formato): leer, concatenar y reescribir
+        df_previo = leer_features(existentes[0])
+        df_nuevo = df_features.reindex(columns=df_previo.columns)
+        df_total = (pd.concat([df_previo, df_nuevo], ignore_index=True)
+                    if len(df_previo) else df_nuevo)
+        guardar_features_vaca(df_total, vaca_id, output_dir, formato, comprimir)
+
+    print(
+        f"[OK] {len(df_features)} filas agregadas a: {output_path}", file=sys.stderr)
+    return output_filename, output_path
+
+
+def procesar_archivo_individual(ruta_csv: str, output_dir: str,
+                                formato: str = FORMATO_DEFECTO,
+                                comprimir: bool = False,
+                                filas_por_bloque: int = None) -> dict:
+    """
+    Procesa un archivo CSV individual y guarda el resultado con features.
+    Retorna un dict con información del procesamiento.
+
+    Con filas_por_bloque el archivo se procesa por bloques (ver
+    generar_features_por_bloques) y cada bloque se agrega al archivo de salida.
+    """
+    try:
+        if filas_por_bloque:
+            with metricas.por_vaca(vaca_id_de_archivo(ruta_csv)):
+                return procesar_archivo_por_bloques(
+                    ruta_csv, output_dir, filas_por_bloque, formato, comprimir)
+
+        with metricas.por_vaca(vaca_id_de_archivo(ruta_csv)):
+            df_features, vaca_id = generar_features_archivo(ruta_csv)
+
+            # 5) Guardar archivo procesado
+            output_filename, output_path = guardar_features_vaca(
+                df_features, vaca_id, output_dir, formato, comprimir)
 
         return {
             "success": True,
@@ -408,11 +544,368 @@ def procesar_archivo_individual(ruta_csv: str, output_dir: str) -> dict:
         }
     except Exception as e:
         print(f"[ERROR] Error procesando {ruta_csv}: {e}", file=sys.stderr)
-        return {
-            "success": False,
-            "input_file": os.path.basename(ruta_csv),
-            "error": str(e),
-        }
+        return resultado_fallido(ruta_csv, str(e))
+
+
+def procesar_archivo_por_bloques(ruta_csv: str, output_dir: str, filas_por_bloque: int,
+                                 formato: str = FORMATO_DEFECTO,
+                                 comprimir: bool = False) -> dict:
+    """
+    procesar_archivo_individual por bloques: el primer bloque crea el archivo
+    de features y los siguientes se le agregan (para csv sin reescribirlo).
+    """
+    filas = 0
+    for i, (df_features, vaca_id) in enumerate(
+            generar_features_por_bloques(ruta_csv, filas_por_bloque)):
+        if i == 0:
+            output_filename, output_path = guardar_features_vaca(
+                df_features, vaca_id, output_dir, formato, comprimir)
+            columnas = len(df_features.columns)
+        elif len(df_features):
+            anexar_features_vaca(
+                df_features, vaca_id, output_dir, formato, comprimir)
+        filas += len(df_features)
+
+    return {
+        "success": True,
+        "vaca_id": vaca_id,
+        "input_file": os.path.basename(ruta_csv),
+        "output_file": output_filename,
+        "output_path": output_path,
+        "rows": filas,
+        "columns": columnas,
+    }
+
+
+def procesar_archivo_medido(ruta_csv: str, output_dir: str,
+                            formato: str = FORMATO_DEFECTO, comprimir: bool = False,
+                            filas_por_bloque: int = None, perfil_dir: str = None) -> dict:
+    """
+    procesar_archivo_individual en un proceso worker con --timings/--profile:
+    mide en el worker y devuelve lo medido en "_metricas" (ver
+    procesar_archivos); con perfil_dir el worker escribe sus propios perfiles.
+    """
+    if perfil_dir:
+        metricas.perfilar(perfil_dir)
+    metricas.activar()
+    resultado = procesar_archivo_individual(
+        ruta_csv, output_dir, formato, comprimir, filas_por_bloque)
+    resultado["_metricas"] = metricas.exportar()
+    if perfil_dir:
+        metricas.guardar_perfiles()
+    return resultado
+
+
+def resultado_fallido(ruta_csv: str, error: str) -> dict:
+    """Dict de resultado para un archivo que no se pudo procesar."""
+    return {
+        "success": False,
+        "input_file": os.path.basename(ruta_csv),
+        "error": error,
+    }
+
+
+def _worker_archivos(conexion, procesar, extra):
+    """
+    Bucle de un proceso worker de procesar_archivos: recibe (índice, ruta) por
+    conexion, procesa el archivo y devuelve (índice, resultado); None termina.
+    """
+    while True:
+        tarea = conexion.recv()
+        if tarea is None:
+            break
+        indice, args = tarea
+        try:
+            resultado = procesar(*args, *extra)
+        except Exception as e:
+            resultado = resultado_fallido(args[0], str(e))
+        conexion.send((indice, resultado))
+
+
+class _Worker:
+    """Proceso worker de procesar_archivos con su conexión y su tarea actual."""
+
+    def __init__(self, procesar, extra):
+        self.conexion, extremo = multiprocessing.Pipe()
+        self.proceso = multiprocessing.Process(
+            target=_worker_archivos, args=(extremo, procesar, extra), daemon=True)
+        self.proceso.start()
+        extremo.close()
+        self.indice = None
+        self.limite = None
+
+    def asignar(self, indice, args, timeout):
+        # El worker está libre: el archivo empieza ahora y su plazo cuenta desde aquí
+        self.conexion.send((indice, args))
+        self.indice = indice
+        self.limite = None if timeout is None else time.monotonic() + timeout
+
+    def terminar(self):
+        if self.proceso.is_alive():
+            self.proceso.terminate()
+        self.proceso.join()
+        self.conexion.close()
+
+
+def procesar_archivos(archivos: list, output_dir: str, workers: int = 1,
+                      timeout: float = None, formato: str = FORMATO_DEFECTO,
+                      comprimir: bool = False, filas_por_bloque: int = None) -> list:
+    """
+    Procesa varios archivos y retorna sus dicts de resultado en el mismo orden.
+
+    Con workers > 1 (o con timeout) cada archivo se procesa en un proceso
+    worker. timeout es el tiempo máximo por archivo en segundos, contado desde
+    que un worker lo empieza (no desde que se encoló). Un archivo que lo
+    excede se reporta como fallido y solo su worker se termina y se reemplaza;
+    si un worker muere (memoria, segfault) su archivo se reporta como fallido
+    y también se reemplaza. El resto de los archivos no se ve afectado.
+    """
+    if workers <= 1 and timeout is None:
+        return [procesar_archivo_individual(ruta_csv, output_dir, formato, comprimir,
+                                            filas_por_bloque)
+                for ruta_csv in archivos]
+
+    procesos = max(1, min(workers, len(archivos)))
+    diagnostico.info(
+        f"Procesando con {procesos} procesos (timeout por archivo: {timeout})")
+
+    # Con --timings / --profile cada worker mide lo suyo y se junta aquí
+    procesar, extra = procesar_archivo_individual, ()
+    if metricas.activo() or metricas.perfilando():
+        procesar, extra = procesar_archivo_medido, (metricas.directorio_perfiles(),)
+
+    resultados = [None] * len(archivos)
+    cola = list(enumerate(archivos))
+    cola.reverse()
+    activos = []
+
+    def reemplazar(worker, error):
+        ruta_csv = archivos[worker.indice]
+        print(f"[ERROR] {error} procesando {ruta_csv}", file=sys.stderr)
+        resultados[worker.indice] = resultado_fallido(ruta_csv, error)
+        worker.terminar()
+        activos.remove(worker)
+
+    try:
+        while cola or any(w.indice is not None for w in activos):
+            # Repartir archivos a los workers libres (y crear los que falten)
+            while cola and len(activos) < procesos:
+                activos.append(_Worker(procesar, extra))
+            for worker in activos:
+                if worker.indice is None and cola:
+                    indice, ruta_csv = cola.pop()
+                    worker.asignar(
+                        indice, (ruta_csv, output_dir, formato, comprimir, filas_por_bloque),
+                        timeout)
+
+            ocupados = [w for w in activos if w.indice is not None]
+            limites = [w.limite for w in ocupados if w.limite is not None]
+            espera = max(0.0, min(limites) - time.monotonic()) if limites else None
+            listos = multiprocessing.connection.wait(
+                [w.conexion for w in ocupados] + [w.proceso.sentinel for w in ocupados],
+                espera)
+
+            for worker in ocupados:
+                if worker.conexion in listos or worker.conexion.poll():
+                    try:
+                        indice, resultado = worker.conexion.recv()
+                    except EOFError:
+                        reemplazar(worker, f"El proceso worker terminó inesperadamente "
+                                           f"(código {worker.proceso.exitcode})")
+                        continue
+                    metricas.combinar(resultado.pop("_metricas", None))
+                    resultados[indice] = resultado
+                    worker.indice = worker.limite = None
+                elif worker.proceso.sentinel in listos:
+                    worker.proceso.join()
+                    reemplazar(worker, f"El proceso worker terminó inesperadamente "
+                                       f"(código {worker.proceso.exitcode})")
+                elif worker.limite is not None and time.monotonic() >= worker.limite:
+                    reemplazar(worker, f"Tiempo límite excedido ({timeout} s)")
+    finally:
+        for worker in activos:
+            if worker.indice is None and worker.proceso.is_alive():
+                try:
+                    worker.conexion.send(None)
+                except OSError:
+                    pass
+                worker.proceso.join(1)
+            worker.terminar()
+
+    return resultados
+
+
+# -------------------------------------------------------------------
+# 7. Manifiesto de archivos ya procesados (hash de contenido)
+# -------------------------------------------------------------------
+# Código del que dependen las features que se guardan: la versión de
+# features es un hash de su fuente, así que cualquier cambio en él invalida
+# el manifiesto (y los estados de --append) sin tocar nada a mano
+CODIGO_FEATURES = (fechas_ordeno, features_cuartos, registro_features,
+                   leer_csv_individual, leer_csv_por_bloques, limpiar_datos,
+                   renombrar_columnas_basicas, crear_features_basicas,
+                   crear_features_asimetria_temporalidad, sembrar_prev,
+                   estado_temporal, features_de_ordenos)
+
+
+def _codigo(objeto) -> bytes:
+    """Fuente de un módulo o función; en el ejecutable empaquetado, su bytecode."""
+    try:
+        return inspect.getsource(objeto).encode("utf-8")
+    except (OSError, TypeError):
+        # PyInstaller no incluye los .py: el bytecode cambia con cada build
+        # que cambie el código
+        if inspect.ismodule(objeto):
+            return marshal.dumps(objeto.__loader__.get_code(objeto.__name__))
+        return marshal.dumps(objeto.__code__)
+
+
+def version_features() -> str:
+    """Versión del código de features: "v7.1+" y el hash de CODIGO_FEATURES."""
+    h = hashlib.sha256()
+    for objeto in CODIGO_FEATURES:
+        h.update(_codigo(objeto))
+    return "v7.1+" + h.hexdigest()[:12]
+
+
+VERSION_FEATURES = version_features()
+
+
+def hash_archivo(ruta: str) -> str:
+    """SHA-256 del contenido de un archivo."""
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def cargar_manifiesto(output_dir: str) -> dict:
+    """
+    Lee el manifiesto de output_dir. Si no existe, está dañado o es de otra
+    versión de features, retorna uno vacío (todo se reprocesa).
+    """
+    vacio = {"version_features": VERSION_FEATURES, "archivos": {}}
+    ruta = os.path.join(output_dir, MANIFIESTO)
+    if not os.path.exists(ruta):
+        return vacio
+
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            manifiesto = json.load(f)
+    except Exception as e:
+        print(f"[WARN] Manifiesto ilegible, se ignora: {e}", file=sys.stderr)
+        return vacio
+
+    if manifiesto.get("version_features") != VERSION_FEATURES:
+        diagnostico.info(
+            f"Versión de features cambió ({manifiesto.get('version_features')} -> "
+            f"{VERSION_FEATURES}), se reprocesan todos los archivos")
+        return vacio
+
+    manifiesto.setdefault("archivos", {})
+    return manifiesto
+
+
+def guardar_manifiesto(output_dir: str, manifiesto: dict):
+    """Escribe el manifiesto de forma atómica (archivo temporal + reemplazo)."""
+    os.makedirs(output_dir, exist_ok=True)
+    ruta = os.path.join(output_dir, MANIFIESTO)
+    ruta_tmp = ruta + ".tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+    os.replace(ruta_tmp, ruta)
+
+
+def sello_archivo(ruta: str) -> dict:
+    """Tamaño y fecha de modificación de un archivo de features."""
+    info = os.stat(ruta)
+    return {"output_bytes": info.st_size, "output_mtime_ns": info.st_mtime_ns}
+
+
+def resultado_en_cache(ruta_csv: str, hash_csv: str, manifiesto: dict,
+                       output_dir: str, formato: str = FORMATO_DEFECTO,
+                       comprimir: bool = False):
+    """
+    Retorna el dict de resultado guardado si el CSV no cambió, se guardó con
+    el mismo formato y su archivo de features sigue siendo el que se
+    escribió (mismo tamaño y fecha de modificación: predict_pipeline
+    --save-features / --append lo reescriben por fuera del manifiesto); si
+    no, None.
+    """
+    entrada = manifiesto["archivos"].get(os.path.basename(ruta_csv))
+    if not entrada or entrada.get("sha256") != hash_csv:
+        return None
+    if (entrada.get("formato", "csv") != formato
+            or entrada.get("comprimido", False) != comprimir):
+        return None
+
+    output_path = os.path.join(output_dir, entrada["output_file"])
+    if not os.path.exists(output_path):
+        return None
+    sello = sello_archivo(output_path)
+    if any(entrada.get(clave) != valor for clave, valor in sello.items()):
+        return None
+
+    return {
+        "success": True,
+        "cached": True,
+        "vaca_id": entrada["vaca_id"],
+        "input_file": os.path.basename(ruta_csv),
+        "output_file": entrada["output_file"],
+        "output_path": output_path,
+        "rows": entrada["rows"],
+        "columns": entrada["columns"],
+    }
+
+
+def procesar_con_manifiesto(archivos: list, output_dir: str, workers: int = 1,
+                            timeout: float = None, formato: str = FORMATO_DEFECTO,
+                            comprimir: bool = False, filas_por_bloque: int = None) -> list:
+    """
+    Como procesar_archivos, pero salta los archivos cuyo contenido y versión
+    de features no cambiaron según el manifiesto, y lo actualiza al final.
+    """
+    manifiesto = cargar_manifiesto(output_dir)
+
+    hashes = {}
+    en_cache = {}
+    pendientes = []
+    for ruta_csv in archivos:
+        hashes[ruta_csv] = hash_archivo(ruta_csv)
+        cache = resultado_en_cache(
+            ruta_csv, hashes[ruta_csv], manifiesto, output_dir, formato, comprimir)
+        if cache is not None:
+            en_cache[ruta_csv] = cache
+        else:
+            pendientes.append(ruta_csv)
+
+    diagnostico.info(
+        f"Archivos sin cambios (cache): {len(en_cache)}, a procesar: {len(pendientes)}")
+
+    procesados = dict(zip(pendientes, procesar_archivos(
+        pendientes, output_dir, workers=workers, timeout=timeout,
+        formato=formato, comprimir=comprimir, filas_por_bloque=filas_por_bloque)))
+
+    # Actualizar manifiesto con lo que se procesó bien
+    for ruta_csv, resultado in procesados.items():
+        nombre = os.path.basename(ruta_csv)
+        if resultado.get("success"):
+            manifiesto["archivos"][nombre] = {
+                "sha256": hashes[ruta_csv],
+                "vaca_id": resultado["vaca_id"],
+                "output_file": resultado["output_file"],
+                "formato": formato,
+                "comprimido": comprimir,
+                "rows": resultado["rows"],
+                "columns": resultado["columns"],
+                **sello_archivo(resultado["output_path"]),
+            }
+        else:
+            manifiesto["archivos"].pop(nombre, None)
+    guardar_manifiesto(output_dir, manifiesto)
+
+    return [en_cache.get(ruta_csv) or procesados[ruta_csv] for ruta_csv in archivos]
 
 
 # -------------------------------------------------------------------
@@ -447,7 +940,75 @@ def main():
         default=True,
         help="Procesar cada archivo individualmente (default: True).",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Número de procesos para procesar archivos en paralelo "
+             "(default: 1, 0 = todos los núcleos).",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Tiempo máximo en segundos por archivo (default: sin límite).",
+    )
+    parser.add_argument(
+        "--format",
+        choices=FORMATOS,
+        default=FORMATO_DEFECTO,
+        help="Formato de los archivos de features (default: npz; feather requiere pyarrow).",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Comprimir los archivos de features (npz/feather).",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=0,
+        help="Leer cada CSV en bloques de este número de filas para acotar la memoria "
+             "(default: 0, archivo completo). Los bloques se agregan a un archivo csv.",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Agregar al JSON un bloque 'metrics' con tiempo, CPU, filas/s y memoria "
+             "por etapa (con --json-output; si no, se imprime en stderr).",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=diagnostico.NIVELES,
+        default=None,
+        help="Nivel de los mensajes de diagnóstico (default: debug; 'detalle' agrega "
+             "listas de columnas completas).",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        metavar="DIR",
+        help="Perfilar cada etapa con cProfile y tracemalloc y escribir en DIR un "
+             ".prof y un .txt por etapa.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Reprocesar todos los archivos aunque el manifiesto indique que no cambiaron.",
+    )
     args = parser.parse_args()
+    if args.log_level:
+        diagnostico.configurar(args.log_level)
+    if args.timings:
+        metricas.activar()
+    if args.profile:
+        metricas.perfilar(args.profile)
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    formato = resolver_formato(args.format)
+    if args.chunk_size > 0:
+        formato = formato_por_bloques(formato)
+    filas_por_bloque = args.chunk_size if args.chunk_size > 0 else None
 
     # Determinar carpeta de salida
     if args.output_dir:
@@ -465,22 +1026,30 @@ def main():
         if not archivos:
             raise FileNotFoundError(f"No se encontraron CSV en: {patron}")
 
-        print(
-            f"[INFO] Encontrados {len(archivos)} archivos CSV", file=sys.stderr)
-        print(f"[INFO] Carpeta de salida: {output_dir}", file=sys.stderr)
+        diagnostico.info(
+            f"Encontrados {len(archivos)} archivos CSV")
+        diagnostico.info(f"Carpeta de salida: {output_dir}")
 
-        # Procesar cada archivo individualmente
-        resultados = []
-        for ruta_csv in archivos:
-            resultado = procesar_archivo_individual(ruta_csv, output_dir)
-            resultados.append(resultado)
+        # Procesar cada archivo individualmente (saltando los que no cambiaron)
+        if args.no_cache:
+            resultados = procesar_archivos(
+                archivos, output_dir, workers=workers, timeout=args.timeout,
+                formato=formato, comprimir=args.compress,
+                filas_por_bloque=filas_por_bloque)
+        else:
+            resultados = procesar_con_manifiesto(
+                archivos, output_dir, workers=workers, timeout=args.timeout,
+                formato=formato, comprimir=args.compress,
+                filas_por_bloque=filas_por_bloque)
 
         # Resumen
         exitosos = sum(1 for r in resultados if r.get("success"))
         fallidos = len(resultados) - exitosos
+        en_cache = sum(1 for r in resultados if r.get("cached"))
 
-        print(
-            f"[INFO] Procesamiento completado: {exitosos} exitosos, {fallidos} fallidos", file=sys.stderr)
+        diagnostico.info(
+            f"Procesamiento completado: {exitosos} exitosos ({en_cache} en cache), "
+            f"{fallidos} fallidos")
 
         if args.json_output:
             # Convertir a JSON para el backend
@@ -488,14 +1057,23 @@ def main():
                 "success": fallidos == 0,
                 "total_files": len(archivos),
                 "successful": exitosos,
+                "cached": en_cache,
                 "failed": fallidos,
                 "output_dir": output_dir,
                 "files": resultados,
             }
-            print(json.dumps(result, ensure_ascii=False, default=str))
+            filas = sum(r.get("rows", 0) for r in resultados if r.get("success"))
+            print(metricas.serializar(result, filas, ensure_ascii=False, default=str))
         else:
             print(
                 f"[OK] Procesamiento completado. {exitosos}/{len(archivos)} archivos procesados.", file=sys.stderr)
+            if args.timings:
+                print(f"[INFO] Métricas: {json.dumps(metricas.resumen(), ensure_ascii=False)}",
+                      file=sys.stderr)
+
+        if args.profile:
+            rutas = metricas.guardar_perfiles()
+            diagnostico.info(f"Perfiles por etapa guardados en {args.profile} ({len(rutas)} archivos)")
 
     except Exception as e:
         error_result = {"success": False, "error": str(e)}
@@ -14,11 +14,15 @@ import glob
 import json
 import argparse
 from pathlib import Path
-from datetime import datetime
 
 import pandas as pd
 import numpy as np
-import joblib
+
+from fechas_ordeno import parsear_fechas_ordeno
+from registro_features import calcular_features, nombres_features
+from predictor_xgb import PredictorXGB
+from almacen_modelos import cargar_modelo
+import metricas
 
 
 # ======================================================
@@ -50,199 +54,90 @@ COLUMNAS_MODELO = [
 ]
 
 
-# ======================================================
-# PARSEO SEGURO DE FECHAS
-# ======================================================
-def parse_fecha_hora(txt):
-    if pd.isna(txt):
-        return pd.NaT
-    txt = str(txt).replace("a. m.", "AM").replace("p. m.", "PM").strip()
-    try:
-        return datetime.strptime(txt, "%d/%m/%Y %I:%M %p")
-    except:
-        try:
-            return datetime.strptime(txt, "%d/%m/%Y %H:%M")
-        except:
-            return pd.NaT
-
-
 # ======================================================
 # CONSTRUCCIÓN COMPLETA DE FEATURES (exacto a maxime.py)
 # ======================================================
 def construir_features(archivos_csv):
-    dfs = []
-    for f in archivos_csv:
-        df = pd.read_csv(f, header=1)
-        df["Archivo_origen"] = Path(f).stem
-        dfs.append(df)
-
-    if len(dfs) == 0:
-        raise ValueError("No se cargaron archivos válidos")
-
-    df = pd.concat(dfs, ignore_index=True)
-
-    # ---- ID vaca
-    df["vaca_id"] = df["Archivo_origen"].str.extract(r"(\d+)")
-    df["vaca"] = df["vaca_id"]
-
-    # ---- Fecha
-    df["Hora de inicio"] = df["Hora de inicio"].apply(parse_fecha_hora)
-    df["fecha"] = df["Hora de inicio"].dt.date
-
-    # ---- Renombrar columnas crudas
-    ren = {
-        "DI": "FlujoMedio_DI", "DD": "FlujoMedio_DD", "TI": "FlujoMedio_TI", "TD": "FlujoMedio_TD",
-        "DI.1": "Sangre_DI", "DD.1": "Sangre_DD", "TI.1": "Sangre_TI", "TD.1": "Sangre_TD",
-        "DI.2": "Conductividad_DI", "DD.2": "Conductividad_DD", "TI.2": "Conductividad_TI", "TD.2": "Conductividad_TD",
-        "DI.3": "FlujoMax_DI", "DD.3": "FlujoMax_DD", "TI.3": "FlujoMax_TI", "TD.3": "FlujoMax_TD",
-        "DI.4": "Produccion_DI", "DD.4": "Produccion_DD", "TI.4": "Produccion_TI", "TD.4": "Produccion_TD",
-        "Ubre": "Estado_Ubre"
-    }
-    df = df.rename(columns=ren)
-
-    # ---- Eliminar columnas no útiles
-    drop_cols = [
-        "Patada", "Pezones no encontrados", "Incompleto", "Pezón",
-        "Razón de la desviación", "RCS (* 1000 células / ml)", "Usuario", "Acción"
-    ]
-    df = df.drop(
-        columns=[c for c in drop_cols if c in df.columns], errors="ignore")
-
-    # ---- EO/PO → EOPO_ID
-    if "EO/PO" in df.columns:
-        mapping = {v: i+1 for i, v in enumerate(df["EO/PO"].unique())}
-        df["EOPO_ID"] = df["EO/PO"].map(mapping)
-    else:
-        df["EOPO_ID"] = 0
+    with metricas.etapa("read") as medicion:
+        dfs = []
+        for f in archivos_csv:
+            df = pd.read_csv(f, header=1)
+            df["Archivo_origen"] = Path(f).stem
+            dfs.append(df)
+
+        if len(dfs) == 0:
+            raise ValueError("No se cargaron archivos válidos")
+
+        df = pd.concat(dfs, ignore_index=True)
+        medicion["filas"] = len(df)
+
+    with metricas.etapa("clean") as medicion:
+        # ---- ID vaca
+        df["vaca_id"] = df["Archivo_origen"].str.extract(r"(\d+)")
+        df["vaca"] = df["vaca_id"]
+
+        # ---- Fecha
+        df["Hora de inicio"] = parsear_fechas_ordeno(df["Hora de inicio"])
+        df["fecha"] = df["Hora de inicio"].dt.date
+
+        # ---- Renombrar columnas crudas
+        ren = {
+            "DI": "FlujoMedio_DI", "DD": "FlujoMedio_DD", "TI": "FlujoMedio_TI", "TD": "FlujoMedio_TD",
+            "DI.1": "Sangre_DI", "DD.1": "Sangre_DD", "TI.1": "Sangre_TI", "TD.1": "Sangre_TD",
+            "DI.2": "Conductividad_DI", "DD.2": "Conductividad_DD", "TI.2": "Conductividad_TI", "TD.2": "Conductividad_TD",
+            "DI.3": "FlujoMax_DI", "DD.3": "FlujoMax_DD", "TI.3": "FlujoMax_TI", "TD.3": "FlujoMax_TD",
+            "DI.4": "Produccion_DI", "DD.4": "Produccion_DD", "TI.4": "Produccion_TI", "TD.4": "Produccion_TD",
+            "Ubre": "Estado_Ubre"
+        }
+        df = df.rename(columns=ren)
+
+        # ---- Eliminar columnas no útiles
+        drop_cols = [
+            "Patada", "Pezones no encontrados", "Incompleto", "Pezón",
+            "Razón de la desviación", "RCS (* 1000 células / ml)", "Usuario", "Acción"
+        ]
+        df = df.drop(
+            columns=[c for c in drop_cols if c in df.columns], errors="ignore")
+
+        # ---- EO/PO → EOPO_ID
+        if "EO/PO" in df.columns:
+            mapping = {v: i+1 for i, v in enumerate(df["EO/PO"].unique())}
+            df["EOPO_ID"] = df["EO/PO"].map(mapping)
+        else:
+            df["EOPO_ID"] = 0
 
-    df = df.dropna()
+        df = df.dropna()
+        medicion["filas"] = len(df)
 
     # ============================================================
     # ===================== FEATURES V5–V7 ========================
     # ============================================================
-    # Promedios y std flujo/conductividad
-    df["FlujoMedio_promedio"] = df[["FlujoMedio_DI", "FlujoMedio_DD",
-                                    "FlujoMedio_TI", "FlujoMedio_TD"]].mean(axis=1)
-    df["Conductividad_promedio"] = df[["Conductividad_DI", "Conductividad_DD",
-                                       "Conductividad_TI", "Conductividad_TD"]].mean(axis=1)
-
-    df["FlujoMedio_std"] = df[["FlujoMedio_DI", "FlujoMedio_DD",
-                               "FlujoMedio_TI", "FlujoMedio_TD"]].std(axis=1)
-    df["Conductividad_std"] = df[["Conductividad_DI", "Conductividad_DD",
-                                  "Conductividad_TI", "Conductividad_TD"]].std(axis=1)
-
-    df["Conductividad_rango"] = (
-        df[["Conductividad_DI", "Conductividad_DD",
-            "Conductividad_TI", "Conductividad_TD"]].max(axis=1)
-        - df[["Conductividad_DI", "Conductividad_DD",
-              "Conductividad_TI", "Conductividad_TD"]].min(axis=1)
-    )
+    with metricas.etapa("features") as medicion:
+        # Fórmulas compartidas con el entrenamiento (registro_features)
+        calcular_features(df, nombres_features())
 
-    conduct = ["Conductividad_DI", "Conductividad_DD",
-               "Conductividad_TI", "Conductividad_TD"]
-    df["Conductividad_diff_max_prom"] = df[conduct].max(
-        axis=1) - df[conduct].mean(axis=1)
-    df["Conductividad_diff_min_prom"] = df[conduct].mean(
-        axis=1) - df[conduct].min(axis=1)
-
-    # Lados
-    df["FlujoMedio_izq"] = df[["FlujoMedio_DI", "FlujoMedio_TI"]].mean(axis=1)
-    df["FlujoMedio_der"] = df[["FlujoMedio_DD", "FlujoMedio_TD"]].mean(axis=1)
-    df["Conductividad_izq"] = df[[
-        "Conductividad_DI", "Conductividad_TI"]].mean(axis=1)
-    df["Conductividad_der"] = df[[
-        "Conductividad_DD", "Conductividad_TD"]].mean(axis=1)
-
-    df["FlujoConductividad_ratio"] = df["FlujoMedio_promedio"] / \
-        (df["Conductividad_promedio"] + 1e-6)
-
-    # Producción
-    df["Produccion_promedio"] = df[["Produccion_DI", "Produccion_DD",
-                                    "Produccion_TI", "Produccion_TD"]].mean(axis=1)
-    df["Produccion_total"] = df[["Produccion_DI", "Produccion_DD",
-                                 "Produccion_TI", "Produccion_TD"]].sum(axis=1)
-    df["Produccion_izq"] = df[["Produccion_DI", "Produccion_TI"]].sum(axis=1)
-    df["Produccion_der"] = df[["Produccion_DD", "Produccion_TD"]].sum(axis=1)
-    df["Produccion_diff_lados"] = abs(
-        df["Produccion_izq"] - df["Produccion_der"])
-    df["Produccion_std"] = df[["Produccion_DI", "Produccion_DD",
-                               "Produccion_TI", "Produccion_TD"]].std(axis=1)
-    df["Produccion_ratio_lados"] = (
-        df[["Produccion_izq", "Produccion_der"]].max(axis=1) /
-        (df[["Produccion_izq", "Produccion_der"]].min(axis=1) + 1e-6)
-    )
-    df["Produccion_rango"] = (
-        df[["Produccion_DI", "Produccion_DD", "Produccion_TI", "Produccion_TD"]].max(axis=1) -
-        df[["Produccion_DI", "Produccion_DD",
-            "Produccion_TI", "Produccion_TD"]].min(axis=1)
-    )
+        # ---- Temporales
+        df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
+        df = df.sort_values(["vaca_id", "fecha"])
 
-    df["Eficiencia_flujo_produccion"] = df["FlujoMedio_promedio"] / \
-        (df["Produccion_promedio"] + 1e-6)
-
-    # Asimetrías
-    df["Flujo_diff_lados"] = abs(df["FlujoMedio_DI"] - df["FlujoMedio_DD"])
-    df["Conductividad_diff_lados"] = abs(
-        df["Conductividad_DI"] - df["Conductividad_DD"])
-
-    df["Indice_asimetria_flujo"] = df["FlujoMedio_std"] / \
-        (df["FlujoMedio_promedio"] + 1e-6)
-    df["Indice_asimetria_conductividad"] = df["Conductividad_std"] / \
-        (df["Conductividad_promedio"] + 1e-6)
-
-    flujo_cols = ["FlujoMedio_DI", "FlujoMedio_DD",
-                  "FlujoMedio_TI", "FlujoMedio_TD"]
-    df["Flujo_ratio_max_min"] = df[flujo_cols].max(
-        axis=1) / (df[flujo_cols].min(axis=1) + 1e-6)
-
-    df["Eficiencia_conductividad"] = df["Produccion_promedio"] / \
-        (df["Conductividad_promedio"] + 1e-6)
-    df["Flujo_conductividad_balance"] = df["FlujoMedio_promedio"] / \
-        (df["Conductividad_promedio"] + 1e-6)
-
-    df["Flujo_por_kg"] = df["FlujoMedio_promedio"] / \
-        (df["Produccion_total"] + 1e-6)
-    df["Conductividad_por_kg"] = df["Conductividad_promedio"] / \
-        (df["Produccion_total"] + 1e-6)
-    df["Conductividad_sobre_flujo"] = df["Conductividad_promedio"] / \
-        (df["FlujoMedio_promedio"] + 1e-6)
-
-    df["CV_flujo"] = df["FlujoMedio_std"] / (df["FlujoMedio_promedio"] + 1e-6)
-    df["CV_conductividad"] = df["Conductividad_std"] / \
-        (df["Conductividad_promedio"] + 1e-6)
-    df["Conductividad_rango_relativo"] = df["Conductividad_rango"] / \
-        (df["Conductividad_promedio"] + 1e-6)
-
-    df["Indice_variabilidad_total"] = (
-        df["FlujoMedio_std"] + df["Conductividad_std"]) / 2
-
-    df["Score_anomalia_simple"] = (
-        df["Conductividad_rango_relativo"]
-        + df["Indice_asimetria_flujo"]
-        + df["Indice_asimetria_conductividad"]
-    )
-
-    # ---- Temporales
-    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
-    df = df.sort_values(["vaca_id", "fecha"])
-
-    df["Produccion_promedio_prev"] = df.groupby(
-        "vaca_id")["Produccion_promedio"].shift(1)
-    df["Conductividad_promedio_prev"] = df.groupby(
-        "vaca_id")["Conductividad_promedio"].shift(1)
+        df["Produccion_promedio_prev"] = df.groupby(
+            "vaca_id")["Produccion_promedio"].shift(1)
+        df["Conductividad_promedio_prev"] = df.groupby(
+            "vaca_id")["Conductividad_promedio"].shift(1)
 
-    df["delta_produccion_promedio"] = df["Produccion_promedio"] - \
-        df["Produccion_promedio_prev"]
-    df["delta_conductividad_promedio"] = df["Conductividad_promedio"] - \
-        df["Conductividad_promedio_prev"]
+        df["delta_produccion_promedio"] = df["Produccion_promedio"] - \
+            df["Produccion_promedio_prev"]
+        df["delta_conductividad_promedio"] = df["Conductividad_promedio"] - \
+            df["Conductividad_promedio_prev"]
 
-    df["tasa_cambio_produccion"] = df["delta_produccion_promedio"] / \
-        (df["Produccion_promedio_prev"] + 1e-6)
-    df["tasa_cambio_conductividad"] = df["delta_conductividad_promedio"] / \
-        (df["Conductividad_promedio_prev"] + 1e-6)
+        df["tasa_cambio_produccion"] = df["delta_produccion_promedio"] / \
+            (df["Produccion_promedio_prev"] + 1e-6)
+        df["tasa_cambio_conductividad"] = df["delta_conductividad_promedio"] / \
+            (df["Conductividad_promedio_prev"] + 1e-6)
 
-    df.replace([np.inf, -np.inf], 0, inplace=True)
-    df.fillna(0, inplace=True)
+        df.replace([np.inf, -np.inf], 0, inplace=True)
+        df.fillna(0, inplace=True)
+        medicion["filas"] = len(df)
 
     return df
 
@@ -298,7 +193,28 @@ def main():
         default=None,
         help="Ruta al modelo .joblib (opcional, usa modelo_xgb_mastitis.joblib por defecto)."
     )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="Hilos para la predicción (opcional, por defecto todos los núcleos)."
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Agregar al JSON un bloque 'metrics' con tiempo, CPU, filas/s y memoria por etapa."
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        metavar="DIR",
+        help="Perfilar cada etapa con cProfile y tracemalloc y escribir en DIR un .prof y un .txt por etapa."
+    )
     args = parser.parse_args()
+    if args.timings:
+        metricas.activar()
+    if args.profile:
+        metricas.perfilar(args.profile)
 
     try:
         # Buscar CSVs
@@ -321,7 +237,7 @@ def main():
                 script_dir, "../models/modelo_xgb_mastitis.joblib")
 
         print(f"[INFO] Cargando modelo desde: {modelo_path}", file=sys.stderr)
-        modelo = joblib.load(modelo_path)
+        modelo = PredictorXGB(cargar_modelo(modelo_path)[0], COLUMNAS_MODELO, args.threads)
 
         # Construir features
         print("[INFO] Construyendo features...", file=sys.stderr)
@@ -334,7 +250,9 @@ def main():
 
         # Predecir probabilidades
         print("[INFO] Ejecutando predicción...", file=sys.stderr)
-        prob = modelo.predict_proba(X)[:, 1]
+        with metricas.etapa("predict") as medicion:
+            prob = modelo.predecir(X)
+            medicion["filas"] = len(prob)
         df["prob_mastitis"] = prob
         df["nivel_alarma"] = df["prob_mastitis"].apply(nivel_alarma)
 
@@ -372,7 +290,11 @@ def main():
             "vacas": resultados
         }
 
-        print(json.dumps(output, ensure_ascii=False, default=str))
+        print(metricas.serializar(output, len(df), ensure_ascii=False, default=str))
+        if args.profile:
+            rutas = metricas.guardar_perfiles()
+            print(f"[INFO] Perfiles por etapa guardados en {args.profile} ({len(rutas)} archivos)",
+                  file=sys.stderr)
 
     except Exception as e:
         import traceback
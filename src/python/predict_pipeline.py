@@ -4,17 +4,30 @@
 predict_pipeline.py
 
 Pipeline completo para predicción de mastitis (igual que maxime.py pero sin Flask):
-  1) Leer CSVs procesados de processed/
+  1) Leer archivos de features de processed/ (npz, feather o csv)
   2) Predecir prob_xgb instantánea con modelo XGBoost
   3) Construir pipeline C2 con features agregadas temporales  
   4) Predecir riesgo a 1, 2, 3 días y "next3" con modelos F1
   5) Devolver JSON con resultados por vaca
+
+Con --input-dir se omite el paso intermedio por processed/: los CSV crudos de
+ordeños se procesan con pipeline_ordenos en el mismo proceso y los DataFrames
+pasan directo a la predicción (--save-features guarda además los archivos).
+
+Con --input-dir y --append solo se procesan los ordeños nuevos de cada vaca:
+las features se agregan al final de los archivos de processed/ y el historial
+de predicciones se extiende desde el estado guardado (ver estado_vacas.py).
+
+Con --worker el proceso queda vivo: carga los modelos una sola vez y atiende
+trabajos JSON (uno por línea) por stdin o por un socket Unix (--socket),
+respondiendo cada uno con una línea JSON igual a la salida normal.
 """
 
 import os
 import sys
 import glob
 import traceback
+import functools
 import re
 import pandas as pd
 import numpy as np
@@ -23,12 +36,31 @@ import json
 
 # Importar C2_inference
 try:
-    from C2_inference import construir_pipeline_C2, preparar_X_para_modelo, predecir_c2_para_vaca
+    from C2_inference import (construir_pipeline_C2, preparar_X_para_modelo,
+                              predecir_c2_para_vaca, predecir_c2_rebano,
+                              planificar_c2, features_omitidas_c2)
     C2_DISPONIBLE = True
 except ImportError:
     C2_DISPONIBLE = False
     print("[WARN] C2_inference no disponible, solo predicción instantánea", file=sys.stderr)
 
+from pipeline_ordenos import (generar_features_archivo, generar_features_por_bloques,
+                              leer_csv_individual, features_de_ordenos,
+                              guardar_features_vaca, anexar_features_vaca,
+                              vaca_id_de_archivo, formato_por_bloques)
+from almacen_features import (FORMATOS, FORMATO_DEFECTO, resolver_formato,
+                              buscar_archivos_features, leer_features)
+from registro_features import nombres_features, con_dependencias
+from predictor_xgb import PredictorXGB, MOTORES
+import metricas
+import diagnostico
+from compacto import compactar_df
+from almacen_modelos import (cargar_modelo, cargar_nativo, leer_meta_nativa,
+                             EntradaPerezosa)
+from estado_vacas import (cargar_estado_vaca, guardar_estado_vaca, estado_vacio,
+                          filtrar_registros_nuevos, cola_c2, cola_reciente,
+                          actualizar_estado)
+
 
 # ======================================================
 # COLUMNAS EXACTAS QUE ESPERA EL MODELO XGBoost (66 columnas)
@@ -59,60 +91,96 @@ COLUMNAS_MODELO = [
 ]
 
 
-def preprocesar_csv(ruta_csv):
-    """Lee el CSV y adapta el DataFrame según lo que espera el modelo XGBoost."""
-    print(f"[DEBUG] Leyendo CSV: {ruta_csv}", file=sys.stderr)
-    df = pd.read_csv(ruta_csv)
-    print(f"[DEBUG] Shape del CSV original: {df.shape}", file=sys.stderr)
-    print(
-        f"[DEBUG] Columnas del CSV original: {df.columns.tolist()}", file=sys.stderr)
+def preprocesar_archivo(ruta):
+    """Lee un archivo de features y lo adapta según lo que espera el modelo XGBoost."""
+    diagnostico.debug(f"Leyendo features: {ruta}")
+    with metricas.etapa("read") as medicion:
+        df = leer_features(ruta)
+        medicion["filas"] = len(df)
+    return preprocesar_df(df)
+
+
+def preprocesar_df(df):
+    """Adapta un DataFrame de features según lo que espera el modelo XGBoost."""
+    with metricas.etapa("clean") as medicion:
+        diagnostico.debug(f"Shape del CSV original: {df.shape}")
+        diagnostico.detalle(lambda: f"Columnas del CSV original: {df.columns.tolist()}")
+
+        # Agregar columnas faltantes con valor 0
+        columnas_faltantes = [
+            col for col in COLUMNAS_MODELO if col not in df.columns]
+        if columnas_faltantes:
+            diagnostico.debug(
+                f"Columnas faltantes (se agregarán con 0): {columnas_faltantes}")
+            for col in columnas_faltantes:
+                df[col] = 0
+
+        # Seleccionar solo las columnas del modelo en el orden correcto
+        df_modelo = df[COLUMNAS_MODELO].copy()
+
+        # Asegurar que todas las columnas sean numéricas (desde formatos binarios
+        # ya lo son y solo queda rellenar NaN)
+        for col in df_modelo.columns:
+            if not pd.api.types.is_numeric_dtype(df_modelo[col].dtype):
+                df_modelo[col] = pd.to_numeric(df_modelo[col], errors='coerce')
+        df_modelo = df_modelo.fillna(0)
+
+        diagnostico.debug(
+            f"Shape final para modelo: {df_modelo.shape}")
+
+        # Primeras filas y estadísticas del DataFrame procesado antes de pasar
+        # al modelo (solo con --log-level detalle: describe() es caro)
+        diagnostico.detalle(lambda: "Primeras 3 filas del DataFrame procesado:\n"
+                            + df_modelo.head(3).to_string())
+        diagnostico.detalle(lambda: "Estadísticas del DataFrame procesado:\n"
+                            + df_modelo.describe().to_string())
+        medicion["filas"] = len(df_modelo)
 
-    # Agregar columnas faltantes con valor 0
-    columnas_faltantes = [
-        col for col in COLUMNAS_MODELO if col not in df.columns]
-    if columnas_faltantes:
-        print(
-            f"[DEBUG] Columnas faltantes (se agregarán con 0): {columnas_faltantes}", file=sys.stderr)
-        for col in columnas_faltantes:
-            df[col] = 0
-
-    # Seleccionar solo las columnas del modelo en el orden correcto
-    df_modelo = df[COLUMNAS_MODELO].copy()
-
-    # Asegurar que todas las columnas sean numéricas
-    for col in df_modelo.columns:
-        df_modelo[col] = pd.to_numeric(
-            df_modelo[col], errors='coerce').fillna(0)
+    return df, df_modelo
 
-    print(
-        f"[DEBUG] Shape final para modelo: {df_modelo.shape}", file=sys.stderr)
 
-    # Mostrar primeras filas del DataFrame procesado antes de pasar al modelo
-    print(f"[DEBUG] Primeras 3 filas del DataFrame procesado:", file=sys.stderr)
-    print(df_modelo.head(3).to_string(), file=sys.stderr)
-    print(f"[DEBUG] Estadísticas del DataFrame procesado:", file=sys.stderr)
-    print(df_modelo.describe().to_string(), file=sys.stderr)
+def cargar_f1_nativo(ruta, key, features, nthread=None, motor="xgboost"):
+    """Carga un modelo F1 desde su .ubj (la primera vez que se usa su horizonte)."""
+    modelo = PredictorXGB(cargar_nativo(ruta), features, nthread, motor)
+    diagnostico.debug(f"Modelo F1 {key} cargado desde formato nativo")
+    return modelo
 
-    return df, df_modelo
 
+def cargar_modelos_f1(models_dir, nthread=None, motor="xgboost"):
+    """
+    Carga los modelos F1 para predicciones temporales (C2), cada uno envuelto
+    en un PredictorXGB con las features de su metadata.
 
-def cargar_modelos_f1(models_dir):
-    """Carga los modelos F1 para predicciones temporales (C2)."""
+    Los que tienen conversión nativa vigente (ver almacen_modelos) solo leen
+    su .meta.json; el modelo se carga la primera vez que se pide
+    modelos_f1[key]["model"].
+    """
     modelos_f1 = {}
 
     for fname in os.listdir(models_dir):
         if fname.startswith("C2_") and fname.endswith("_F1.joblib"):
             try:
-                model, meta = joblib.load(os.path.join(models_dir, fname))
+                ruta = os.path.join(models_dir, fname)
                 # Extraer key: C2_t1_F1.joblib -> t1, C2_next3_F1.joblib -> next3
                 key = fname.replace("C2_", "").replace("_F1.joblib", "")
-                modelos_f1[key] = {
-                    "model": model,
-                    "thr": meta["threshold"],
-                    "features": meta["features"]
-                }
-                print(
-                    f"[DEBUG] Modelo F1 cargado: {key} (thr={meta['threshold']:.3f}, features={len(meta['features'])})", file=sys.stderr)
+                meta = leer_meta_nativa(ruta)
+                if meta is not None:
+                    modelos_f1[key] = EntradaPerezosa(
+                        functools.partial(cargar_f1_nativo, ruta, key, meta["features"],
+                                          nthread, motor),
+                        thr=meta["threshold"],
+                        features=meta["features"])
+                    origen = "nativo, carga diferida"
+                else:
+                    model, meta = joblib.load(ruta)
+                    modelos_f1[key] = {
+                        "model": PredictorXGB(model, meta["features"], nthread, motor),
+                        "thr": meta["threshold"],
+                        "features": meta["features"]
+                    }
+                    origen = "joblib"
+                diagnostico.debug(
+                    f"Modelo F1 cargado: {key} (thr={meta['threshold']:.3f}, features={len(meta['features'])}, {origen})")
             except Exception as e:
                 print(
                     f"[ERROR] No se pudo cargar {fname}: {e}", file=sys.stderr)
@@ -120,6 +188,24 @@ def cargar_modelos_f1(models_dir):
     return modelos_f1
 
 
+def features_requeridas(modelos_f1):
+    """
+    Features V7 que usan los modelos cargados: COLUMNAS_MODELO más las que
+    piden los modelos F1 (directas o como base de un lag), con sus
+    dependencias del registro. Informa las features del registro que quedan
+    fuera (no se calculan).
+    """
+    requeridas = set(COLUMNAS_MODELO)
+    if C2_DISPONIBLE and modelos_f1:
+        requeridas |= planificar_c2(modelos_f1)["bases"]
+    requeridas = con_dependencias(requeridas)
+
+    omitidas = [f for f in nombres_features() if f not in requeridas]
+    diagnostico.info(
+        f"Features V7 que no usa ningún modelo (no se calculan): {omitidas or 'ninguna'}")
+    return requeridas
+
+
 def nivel_alarma(prob):
     """Determina el nivel de alarma basado en la probabilidad."""
     if prob < 0.10:
@@ -134,6 +220,10 @@ def nivel_alarma(prob):
         return "Rojo"
 
 
+# --append ya lee solo los ordeños nuevos de cada vaca: no lee por bloques
+ERROR_BLOQUES_ANEXAR = "--chunk-size no se puede combinar con --append"
+
+
 def parse_args():
     """Parsea argumentos de línea de comandos."""
     import argparse
@@ -143,126 +233,469 @@ def parse_args():
                         help="Directorio con archivos de features procesados")
     parser.add_argument("--models-dir", type=str, default=None,
                         help="Directorio con los modelos (.joblib)")
+    parser.add_argument("--input-dir", type=str, default=None,
+                        help="Directorio con CSV crudos de ordeños: genera features "
+                             "en memoria sin pasar por processed/")
+    parser.add_argument("--save-features", action="store_true",
+                        help="Con --input-dir, guarda también los archivos de features "
+                             "en --processed-dir")
+    parser.add_argument("--append", action="store_true",
+                        help="Con --input-dir, procesa solo los ordeños nuevos de cada "
+                             "vaca y los agrega a --processed-dir (modo incremental)")
+    parser.add_argument("--format", choices=FORMATOS, default=FORMATO_DEFECTO,
+                        help="Formato de los archivos de features que se guardan con "
+                             "--save-features/--append (default: npz)")
+    parser.add_argument("--compress", action="store_true",
+                        help="Comprimir los archivos de features que se guardan")
+    parser.add_argument("--chunk-size", type=int, default=0,
+                        help="Con --input-dir, lee cada CSV en bloques de este número de "
+                             "filas para acotar la memoria (default: 0, archivo completo; "
+                             "no se combina con --append)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Hilos para la predicción XGBoost (default: todos los núcleos)")
+    parser.add_argument("--tree-backend", choices=MOTORES, default="xgboost",
+                        help="Evaluador de los árboles: xgboost o numpy (menor latencia "
+                             "con pocas filas por llamada, p. ej. --worker o --chunk-size)")
+    parser.add_argument("--compact", action="store_true",
+                        help="Memoria compacta: features en float32 e IDs/texto como "
+                             "categóricas (probabilidades dentro de compacto.TOLERANCIA)")
+    parser.add_argument("--timings", action="store_true",
+                        help="Agregar al JSON un bloque 'metrics' con tiempo, CPU, filas/s "
+                             "y memoria por etapa (read, clean, predict, c2, serialize)")
+    parser.add_argument("--log-level", choices=diagnostico.NIVELES, default=None,
+                        help="Nivel de los mensajes de diagnóstico (default: debug; 'detalle' "
+                             "agrega columnas y head/describe de cada vaca)")
+    parser.add_argument("--profile", type=str, default=None, metavar="DIR",
+                        help="Perfilar cada etapa con cProfile y tracemalloc y escribir en "
+                             "DIR un .prof y un .txt por etapa")
+    parser.add_argument("--worker", action="store_true",
+                        help="Modo worker: carga los modelos una sola vez y atiende "
+                             "trabajos JSON (uno por línea) por stdin o --socket")
+    parser.add_argument("--socket", type=str, default=None,
+                        help="Ruta de socket Unix para el modo worker (por defecto: stdin)")
     parser.add_argument("csv_files", nargs="*",
-                        help="Archivos CSV de features (opcional)")
-    return parser.parse_args()
+                        help="Archivos de features (opcional)")
+    args = parser.parse_args()
+    if args.chunk_size and args.append:
+        parser.error(ERROR_BLOQUES_ANEXAR)
+    return args
 
 
-def main():
-    print("[DEBUG] Iniciando predict_pipeline.py (versión C2)", file=sys.stderr)
-
-    args = parse_args()
-    base_dir = os.path.dirname(__file__)
-
-    # Determinar directorio de modelos
-    if args.models_dir:
-        models_dir = args.models_dir
+def resolver_ruta_modelo(models_dir_arg, base_dir):
+    """Determina la ruta del modelo instantáneo y el directorio de modelos."""
+    if models_dir_arg:
+        models_dir = models_dir_arg
         modelo_path = os.path.join(models_dir, "modelo_xgb_mastitis.joblib")
-        print(
-            f"[DEBUG] Usando models_dir desde argumento: {models_dir}", file=sys.stderr)
-    else:
-        # Buscar en múltiples ubicaciones (desarrollo vs producción)
-        possible_model_paths = [
-            # Desarrollo
-            os.path.join(base_dir, "../models/modelo_xgb_mastitis.joblib"),
-            # Producción
-            os.path.join(
-                base_dir, "../../resources/models/modelo_xgb_mastitis.joblib"),
-            # Alternativo
-            os.path.join(
-                base_dir, "../../../models/modelo_xgb_mastitis.joblib"),
-        ]
-
-        modelo_path = None
-        for p in possible_model_paths:
-            if os.path.exists(p):
-                modelo_path = p
-                break
-
-        if not modelo_path:
-            modelo_path = possible_model_paths[0]
-
-        models_dir = os.path.dirname(modelo_path)
-
-    # Cargar modelo XGBoost instantáneo
-    try:
-        print(
-            f"[DEBUG] Cargando modelo instantáneo: {modelo_path}", file=sys.stderr)
-        modelo_xgb = joblib.load(modelo_path)
-        print(
-            f"[DEBUG] Modelo cargado correctamente. Tipo: {type(modelo_xgb)}", file=sys.stderr)
-    except Exception as e:
-        print(f"[ERROR] Error cargando modelo: {e}", file=sys.stderr)
-        print(json.dumps({"error": f"No se pudo cargar el modelo: {e}"}))
-        sys.exit(1)
+        diagnostico.debug(
+            f"Usando models_dir desde argumento: {models_dir}")
+        return modelo_path, models_dir
+
+    # Buscar en múltiples ubicaciones (desarrollo vs producción)
+    possible_model_paths = [
+        # Desarrollo
+        os.path.join(base_dir, "../models/modelo_xgb_mastitis.joblib"),
+        # Producción
+        os.path.join(
+            base_dir, "../../resources/models/modelo_xgb_mastitis.joblib"),
+        # Alternativo
+        os.path.join(
+            base_dir, "../../../models/modelo_xgb_mastitis.joblib"),
+    ]
+
+    modelo_path = None
+    for p in possible_model_paths:
+        if os.path.exists(p):
+            modelo_path = p
+            break
+
+    if not modelo_path:
+        modelo_path = possible_model_paths[0]
+
+    return modelo_path, os.path.dirname(modelo_path)
+
+
+def cargar_modelos(modelo_path, models_dir, nthread=None, motor="xgboost"):
+    """
+    Carga el modelo XGBoost instantáneo y, si C2 está disponible, los modelos F1.
+    Los modelos se devuelven envueltos en PredictorXGB (nthread hilos, motor
+    "xgboost" o "numpy").
+    Lanza la excepción original si el modelo instantáneo no se puede cargar.
+    """
+    diagnostico.debug(
+        f"Cargando modelo instantáneo: {modelo_path}")
+    # Usa la conversión nativa (.ubj) si está vigente
+    modelo, _ = cargar_modelo(modelo_path)
+    diagnostico.debug(
+        f"Modelo cargado correctamente. Tipo: {type(modelo)}")
+    modelo_xgb = PredictorXGB(modelo, COLUMNAS_MODELO, nthread, motor)
 
     # Cargar modelos F1 para predicciones temporales C2
     modelos_f1 = {}
     if C2_DISPONIBLE:
-        modelos_f1 = cargar_modelos_f1(models_dir)
-        print(
-            f"[DEBUG] Total modelos F1 cargados: {len(modelos_f1)}", file=sys.stderr)
+        modelos_f1 = cargar_modelos_f1(models_dir, nthread, motor)
+        diagnostico.debug(
+            f"Total modelos F1 cargados: {len(modelos_f1)}")
 
-    # Determinar directorio de processed
-    if args.processed_dir:
-        processed_dir = args.processed_dir
-        print(
-            f"[DEBUG] Usando processed_dir desde argumento: {processed_dir}", file=sys.stderr)
-    else:
-        processed_dir = os.path.join(base_dir, '../../processed')
+    return modelo_xgb, modelos_f1
 
-    # Buscar archivos de features
-    if args.csv_files:
-        rutas_csv = args.csv_files
-        print(
-            f"[DEBUG] CSVs pasados como argumentos: {rutas_csv}", file=sys.stderr)
-    else:
-        rutas_csv = glob.glob(os.path.join(
-            processed_dir, 'vaca_*_features.csv'))
-        print(f"[DEBUG] Buscando CSVs en: {processed_dir}", file=sys.stderr)
-        print(f"[DEBUG] CSVs encontrados: {rutas_csv}", file=sys.stderr)
 
-    if not rutas_csv:
-        print(
-            f"[ERROR] No se encontraron archivos de features en {processed_dir}", file=sys.stderr)
-        print(json.dumps(
-            {"error": f"No se encontraron archivos de features en {processed_dir}"}))
-        sys.exit(1)
+def buscar_features(processed_dir, archivos=None):
+    """Devuelve las rutas de features a procesar (explícitas o por glob)."""
+    if archivos:
+        diagnostico.debug(
+            f"Archivos pasados como argumentos: {archivos}")
+        return list(archivos)
 
-    vacas_resultados = {}
-    total_registros = 0
+    rutas = buscar_archivos_features(processed_dir)
+    diagnostico.debug(f"Buscando features en: {processed_dir}")
+    diagnostico.detalle(lambda: f"Archivos de features encontrados: {rutas}")
+    return rutas
 
+
+def buscar_ordenos(input_dir):
+    """Devuelve las rutas de CSV crudos de ordeños en input_dir."""
+    rutas = glob.glob(os.path.join(input_dir, "*.csv"))
+    diagnostico.debug(f"Buscando CSVs crudos en: {input_dir}")
+    diagnostico.detalle(lambda: f"CSVs crudos encontrados: {rutas}")
+    return rutas
+
+
+def fuentes_desde_features(rutas_csv):
+    """
+    Genera (ruta, cargar) para archivos vaca_*_features.* ya procesados.
+    cargar() devuelve un dict con "vaca_id", "df_original" y "df_modelo".
+    """
     for ruta_csv in rutas_csv:
-        print(f"\n[DEBUG] ===== Procesando: {ruta_csv} =====", file=sys.stderr)
-        try:
+        def cargar(ruta_csv=ruta_csv):
             # Extraer ID de vaca del nombre del archivo
             nombre_archivo = os.path.basename(ruta_csv)
             match = re.search(r"vaca_(\d+)_features", nombre_archivo)
             vaca_id = match.group(1) if match else nombre_archivo
 
-            # Preprocesar
-            df_original, df_modelo = preprocesar_csv(ruta_csv)
+            df_original, df_modelo = preprocesar_archivo(ruta_csv)
+            return {"vaca_id": vaca_id, "df_original": df_original,
+                    "df_modelo": df_modelo}
+
+        yield ruta_csv, cargar
+
+
+def fuentes_desde_ordenos(rutas_crudas, output_dir=None,
+                          formato=FORMATO_DEFECTO, comprimir=False, features=None):
+    """
+    Genera (ruta, cargar) para CSV crudos de ordeños. Las features se calculan
+    en memoria con pipeline_ordenos; si output_dir no es None también se guardan.
+    features limita las que se calculan (ver features_requeridas).
+    """
+    for ruta_csv in rutas_crudas:
+        def cargar(ruta_csv=ruta_csv):
+            df_features, vaca_id = generar_features_archivo(
+                ruta_csv, features=features)
+            if output_dir is not None:
+                guardar_features_vaca(
+                    df_features, vaca_id, output_dir, formato, comprimir)
+
+            df_original, df_modelo = preprocesar_df(df_features)
+            return {"vaca_id": vaca_id, "df_original": df_original,
+                    "df_modelo": df_modelo}
+
+        yield ruta_csv, cargar
+
+
+def fuentes_incrementales(rutas_crudas, processed_dir,
+                          formato=FORMATO_DEFECTO, comprimir=False):
+    """
+    Genera (ruta, cargar) para el modo incremental (--append): solo se procesan
+    los ordeños posteriores al último guardado en el estado de cada vaca (ver
+    estado_vacas). Además de las claves normales, cargar() devuelve:
+      - "previo": historial y cola C2 guardados de corridas anteriores
+      - "al_terminar": callback que anexa las features nuevas y guarda el estado
+    """
+    for ruta_csv in rutas_crudas:
+        def cargar(ruta_csv=ruta_csv):
+            vaca_id = vaca_id_de_archivo(ruta_csv)
+            estado = cargar_estado_vaca(processed_dir, vaca_id)
+            nueva = estado is None
+            if nueva:
+                estado = estado_vacio()
+
+            # Los ordeños ya procesados se descartan antes de limpiar y
+            # calcular features: el estado guardado (temporal, mapa_eopo)
+            # alcanza para los *_prev y EOPO_ID de los nuevos
+            df, vaca_id = leer_csv_individual(ruta_csv)
+            df = filtrar_registros_nuevos(df, estado)
+            diagnostico.debug(f"Vaca {vaca_id}: {len(df)} ordeños nuevos")
+            df_features = features_de_ordenos(
+                df, estado_previo=estado["temporal"],
+                mapa_eopo=estado["mapa_eopo"])
+
+            # preprocesar_df agrega columnas al mismo DataFrame; al disco solo
+            # van las columnas de features
+            columnas_features = list(df_features.columns)
+            df_original, df_modelo = preprocesar_df(df_features)
+
+            def al_terminar(df_c2_entrada, fechas, probabilidades, produccion):
+                df_nuevo = df_original[columnas_features]
+                if nueva:
+                    guardar_features_vaca(
+                        df_nuevo, vaca_id, processed_dir, formato, comprimir)
+                elif len(df_nuevo):
+                    anexar_features_vaca(
+                        df_nuevo, vaca_id, processed_dir, formato, comprimir)
+                guardar_estado_vaca(processed_dir, vaca_id, actualizar_estado(
+                    estado, df_original, df_c2_entrada, fechas,
+                    probabilidades, produccion))
+
+            historial = estado["historial"]
+            return {
+                "vaca_id": vaca_id,
+                "df_original": df_original,
+                "df_modelo": df_modelo,
+                "previo": {
+                    "cola_c2": cola_c2(estado),
+                    "fechas": historial["fechas"],
+                    "probabilidades": historial["probabilidades"],
+                    "produccion": historial["produccion"],
+                },
+                "al_terminar": al_terminar,
+            }
 
-            # Predecir probabilidades instantáneas con XGBoost
-            # Probabilidad de clase 1 (mastitis)
-            probas = modelo_xgb.predict_proba(df_modelo)[:, 1]
+        yield ruta_csv, cargar
+
+
+def fuentes_por_bloques(rutas_crudas, modelo_xgb, filas_por_bloque, output_dir=None,
+                        formato=FORMATO_DEFECTO, comprimir=False, features=None):
+    """
+    Genera (ruta, cargar) para CSV crudos leídos en bloques de filas_por_bloque
+    filas (ver pipeline_ordenos.generar_features_por_bloques), para exportes
+    que no caben en memoria.
+
+    Cada bloque se predice al leerlo y de él solo se conserva lo que va en la
+    respuesta (fechas, probabilidades, producción) y la cola que necesita C2.
+    cargar() devuelve el último bloque con lo anterior en "previo", como
+    fuentes_incrementales, y predecir_vacas termina la vaca igual que siempre.
+    Si output_dir no es None las features se van agregando al archivo de la vaca.
+    """
+    for ruta_csv in rutas_crudas:
+        def cargar(ruta_csv=ruta_csv):
+            previo = {"cola_c2": pd.DataFrame(), "fechas": [],
+                      "probabilidades": [], "produccion": []}
+            pendiente = None
+            bloques = generar_features_por_bloques(
+                ruta_csv, filas_por_bloque, features=features)
+            for i, (df_features, vaca_id) in enumerate(bloques):
+                if output_dir is not None and i == 0:
+                    guardar_features_vaca(
+                        df_features, vaca_id, output_dir, formato, comprimir)
+                elif output_dir is not None and len(df_features):
+                    anexar_features_vaca(
+                        df_features, vaca_id, output_dir, formato, comprimir)
+
+                if pendiente is not None:
+                    acumular_bloque(previo, pendiente, vaca_id, modelo_xgb)
+                pendiente = preprocesar_df(df_features)
+
+            if pendiente is None:
+                raise ValueError(f"No hay ordeños en {ruta_csv}")
+
+            df_original, df_modelo = pendiente
+            return {"vaca_id": vaca_id, "df_original": df_original,
+                    "df_modelo": df_modelo, "previo": previo}
+
+        yield ruta_csv, cargar
+
+
+def acumular_bloque(previo, bloque, vaca_id, modelo_xgb):
+    """
+    Predice un bloque (df_original, df_modelo) ya leído y lo agrega al
+    historial y a la cola C2 de previo (ver fuentes_por_bloques).
+    """
+    df_original, df_modelo = bloque
+    probas = predecir_prob_xgb_lote(modelo_xgb, [df_modelo])[0]
+    df_original["prob_xgb"] = probas
+    df_original["vaca_id"] = vaca_id
+
+    previo["fechas"].extend(fechas_de_ordenos(df_original))
+    previo["probabilidades"].extend(probas.tolist())
+    prod_col = produccion_de_ordenos(df_original)
+    if prod_col is not None:
+        previo["produccion"].extend(prod_col.tolist())
+
+    cola = previo["cola_c2"]
+    previo["cola_c2"] = cola_reciente(
+        pd.concat([cola, df_original], ignore_index=True) if len(cola) else df_original)
+
+
+def fechas_de_ordenos(df_original):
+    """Fecha de cada ordeño (solo la fecha, sin hora) o [] si no hay "Hora de inicio"."""
+    if "Hora de inicio" not in df_original.columns:
+        return []
+    fechas_raw = df_original["Hora de inicio"].astype(str).tolist()
+    # Extraer solo la parte de la fecha (antes del espacio con la hora)
+    return [f.split(" ")[0] if " " in f else f for f in fechas_raw]
+
+
+def produccion_de_ordenos(df_original):
+    """Serie "Producción (kg)" numérica (NaN -> 0) o None si no existe."""
+    if "Producción (kg)" not in df_original.columns:
+        return None
+    return pd.to_numeric(df_original["Producción (kg)"], errors='coerce').fillna(0)
+
+
+def fuentes_ordenos(rutas_crudas, processed_dir, modelo_xgb, modelos_f1,
+                    formato=FORMATO_DEFECTO, comprimir=False, guardar=False,
+                    anexar=False, filas_por_bloque=0):
+    """
+    Elige las fuentes para CSV crudos según el modo (--append, --chunk-size,
+    --save-features) y las features que usan los modelos cargados.
+    """
+    if anexar:
+        if filas_por_bloque:
+            raise ValueError(ERROR_BLOQUES_ANEXAR)
+        return fuentes_incrementales(rutas_crudas, processed_dir, formato, comprimir)
+
+    output_dir = processed_dir if guardar else None
+    # Lo que se guarda en processed/ lleva todas las features
+    features = features_requeridas(modelos_f1) if output_dir is None else None
+
+    if filas_por_bloque:
+        if output_dir is not None:
+            formato = formato_por_bloques(formato)
+        return fuentes_por_bloques(rutas_crudas, modelo_xgb, filas_por_bloque,
+                                   output_dir, formato, comprimir, features)
+
+    return fuentes_desde_ordenos(rutas_crudas, output_dir, formato, comprimir, features)
+
+
+def predecir_prob_xgb_lote(modelo_xgb, dfs_modelo):
+    """
+    Predice prob_xgb de varias vacas con una sola llamada al modelo.
+
+    Las matrices COLUMNAS_MODELO de todas las vacas se copian a un solo buffer
+    float32 (ver PredictorXGB.predecir_lote) y el resultado se separa por
+    offsets de fila.
+
+    Returns:
+        Lista de arrays de probabilidades, uno por DataFrame y en el mismo orden
+    """
+    # Probabilidad de clase 1 (mastitis)
+    with metricas.etapa("predict") as medicion:
+        medicion["filas"] = sum(len(df) for df in dfs_modelo)
+        return modelo_xgb.predecir_lote(dfs_modelo)
+
+
+def predecir_vacas(fuentes, modelo_xgb, modelos_f1, compacto=False):
+    """
+    Ejecuta la predicción instantánea y C2 para cada vaca.
+
+    Todas las vacas se cargan primero y la predicción instantánea se hace en
+    lote (ver predecir_prob_xgb_lote); el resultado por vaca no cambia.
+
+    Args:
+        fuentes: Iterable de (ruta, cargar), ver fuentes_desde_features,
+            fuentes_desde_ordenos y fuentes_incrementales
+        compacto: Guardar las features de cada vaca en float32 y los IDs /
+            texto como categóricas apenas se cargan (ver compacto.py)
+
+    Returns:
+        Dict con el formato final compatible con el frontend.
+    """
+    # Solo se calculan las features C2 que usan los modelos F1 cargados
+    plan_c2 = None
+    if C2_DISPONIBLE and modelos_f1:
+        plan_c2 = planificar_c2(modelos_f1)
+        omitidas = features_omitidas_c2(plan_c2)
+        diagnostico.info(
+            f"Features C2 que no usa ningún modelo F1 (no se calculan): "
+            f"{omitidas or 'ninguna'}")
+
+    # --- 1) Leer y preprocesar todas las vacas ---
+    cargadas = []
+    for ruta_csv, cargar in fuentes:
+        diagnostico.debug(f"\n===== Procesando: {ruta_csv} =====")
+        try:
+            with metricas.por_vaca(os.path.basename(ruta_csv)):
+                cargada = cargar()
+                if compacto:
+                    # La producción que se reporta se toma antes, en float64:
+                    # el modo compacto solo cambia los DataFrames internos
+                    cargada["produccion"] = produccion_de_ordenos(cargada["df_original"])
+                    # Todas las vacas quedan cargadas hasta el final: se
+                    # guardan compactas y se liberan las versiones float64
+                    cargada["df_original"] = compactar_df(cargada["df_original"])
+                    cargada["df_modelo"] = compactar_df(cargada["df_modelo"])
+            cargada["ruta"] = ruta_csv
+            cargadas.append(cargada)
+        except Exception as e:
+            print(f"[ERROR] Error procesando {ruta_csv}: {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            cargadas.append({"ruta": ruta_csv, "error": str(e)})
 
-            print(
-                f"[DEBUG] Predicciones shape: {probas.shape}", file=sys.stderr)
-            print(
-                f"[DEBUG] Probabilidades (primeras 5): {probas[:5]}", file=sys.stderr)
+    # --- 2) Predicción instantánea de todo el hato en una sola llamada ---
+    validas = [c for c in cargadas if "error" not in c]
+    try:
+        probas_lote = predecir_prob_xgb_lote(
+            modelo_xgb, [c["df_modelo"] for c in validas])
+        diagnostico.debug(
+            f"Predicción en lote: {len(validas)} vacas, "
+            f"{sum(len(p) for p in probas_lote)} registros")
+        for c, probas in zip(validas, probas_lote):
+            c["probas"] = probas
+    except Exception as e:
+        # Si el lote falla, se predice vaca por vaca para aislar el error
+        print(
+            f"[WARN] Falló la predicción en lote ({e}), se predice por vaca", file=sys.stderr)
+
+    # --- 3) Resultados por vaca ---
+    vacas_resultados = {}
+    dfs_c2 = {}
+    total_registros = 0
+
+    for c in cargadas:
+        ruta_csv = c["ruta"]
+        if "error" in c:
+            vacas_resultados[os.path.basename(ruta_csv)] = {"error": c["error"]}
+            continue
+
+        try:
+            vaca_id = c["vaca_id"]
+            df_original = c["df_original"]
+
+            probas = c.get("probas")
+            if probas is None:
+                with metricas.etapa("predict") as medicion:
+                    probas = modelo_xgb.predecir(c["df_modelo"])
+                    medicion["filas"] = len(probas)
+
+            diagnostico.debug(
+                f"Predicciones shape: {probas.shape}")
+            diagnostico.debug(
+                f"Probabilidades (primeras 5): {probas[:5]}")
 
             # Agregar prob_xgb al DataFrame original para C2
             df_original["prob_xgb"] = probas
             df_original["vaca_id"] = vaca_id
-
-            # Extraer fechas si existen (solo la fecha, sin hora)
-            fechas = []
-            if "Hora de inicio" in df_original.columns:
-                fechas_raw = df_original["Hora de inicio"].astype(str).tolist()
-                # Extraer solo la parte de la fecha (antes del espacio con la hora)
-                fechas = [
-                    f.split(" ")[0] if " " in f else f for f in fechas_raw]
+            if compacto:
+                df_original["vaca_id"] = df_original["vaca_id"].astype("category")
+
+            fechas = fechas_de_ordenos(df_original)
+            prod_col = (c["produccion"] if "produccion" in c
+                        else produccion_de_ordenos(df_original))
+
+            # Modo incremental: se extiende el historial de corridas anteriores
+            df_c2_entrada = df_original
+            previo = c.get("previo")
+            if previo is not None:
+                fechas = previo["fechas"] + fechas
+                probas = np.concatenate(
+                    [np.asarray(previo["probabilidades"], dtype=probas.dtype), probas])
+                if previo["produccion"] or prod_col is not None:
+                    prod_col = pd.concat(
+                        [pd.Series(previo["produccion"], dtype=float),
+                         pd.Series([] if prod_col is None else prod_col, dtype=float)],
+                        ignore_index=True)
+                if len(previo["cola_c2"]):
+                    df_c2_entrada = pd.concat(
+                        [previo["cola_c2"], df_original], ignore_index=True)
 
             # Calcular estadísticas
             ultima_probabilidad = float(probas[-1]) if len(probas) > 0 else 0.0
@@ -271,34 +704,39 @@ def main():
             # Producción
             produccion_total = 0.0
             produccion_promedio = 0.0
-            if "Producción (kg)" in df_original.columns:
-                prod_col = pd.to_numeric(
-                    df_original["Producción (kg)"], errors='coerce').fillna(0)
+            if prod_col is not None:
                 produccion_total = float(prod_col.sum())
                 produccion_promedio = float(prod_col.mean())
 
             # Determinar nivel de alarma basado en la ÚLTIMA probabilidad instantánea
             alarma = nivel_alarma(ultima_probabilidad)
 
-            # --- Predicciones C2 (t1, t2, t3, next3) ---
-            predic_c2 = {}
+            # --- Features C2: solo se guarda la última fila de cada vaca ---
             if C2_DISPONIBLE and modelos_f1:
                 try:
-                    # Construir features C2 para esta vaca
-                    df_c2 = construir_pipeline_C2(
-                        df_original, modelo_xgb, COLUMNAS_MODELO)
-                    predic_c2 = predecir_c2_para_vaca(df_c2, modelos_f1)
-                    print(
-                        f"[DEBUG] Predicciones C2 para vaca {vaca_id}: {predic_c2}", file=sys.stderr)
+                    # Construir features C2 para esta vaca (solo la cola
+                    # reciente: la predicción usa únicamente la última fila)
+                    with metricas.por_vaca(os.path.basename(ruta_csv)), \
+                            metricas.etapa("c2") as medicion:
+                        df_c2 = construir_pipeline_C2(
+                            df_c2_entrada, modelo_xgb, COLUMNAS_MODELO, solo_cola=True,
+                            plan=plan_c2)
+                        medicion["filas"] = len(df_c2_entrada)
+                    dfs_c2[vaca_id] = df_c2.iloc[[-1]] if len(df_c2) else df_c2
                 except Exception as e:
+                    dfs_c2.pop(vaca_id, None)
                     print(
                         f"[WARN] Error en C2 para vaca {vaca_id}: {e}", file=sys.stderr)
                     traceback.print_exc(file=sys.stderr)
 
+            if "al_terminar" in c:
+                c["al_terminar"](df_c2_entrada, fechas, probas,
+                                 [] if prod_col is None else prod_col.tolist())
+
             # Guardar resultado para esta vaca
             vacas_resultados[vaca_id] = {
                 "vaca_id": vaca_id,
-                "registros": len(df_original),
+                "registros": len(probas),
                 "fechas": fechas,  # Todas las fechas para la gráfica histórica
                 # Todas las probabilidades
                 "probabilidades": [float(p) for p in probas.tolist()],
@@ -307,14 +745,11 @@ def main():
                 "nivel_alarma": alarma,
                 "produccion_total": produccion_total,
                 "produccion_promedio": produccion_promedio,
-                # Predicciones C2 (temporales)
-                "predicciones_c2": predic_c2,
+                # Predicciones C2 (temporales), se completan abajo en lote
+                "predicciones_c2": {},
             }
 
-            total_registros += len(df_original)
-
-            print(
-                f"[DEBUG] Resultado para vaca {vaca_id}: {alarma} ({ultima_probabilidad*100:.2f}%), C2={predic_c2}", file=sys.stderr)
+            total_registros += len(probas)
 
         except Exception as e:
             print(f"[ERROR] Error procesando {ruta_csv}: {e}", file=sys.stderr)
@@ -322,16 +757,226 @@ def main():
             vaca_id = os.path.basename(ruta_csv)
             vacas_resultados[vaca_id] = {"error": str(e)}
 
+    # --- 4) Predicciones C2 (t1, t2, t3, next3) de todo el hato por horizonte ---
+    if dfs_c2:
+        with metricas.etapa("c2") as medicion:
+            medicion["filas"] = len(dfs_c2)
+            try:
+                predic_c2_rebano = predecir_c2_rebano(dfs_c2, modelos_f1)
+            except Exception as e:
+                # Si el lote falla, se predice vaca por vaca para aislar el error
+                print(
+                    f"[WARN] Falló la predicción C2 en lote ({e}), se predice por vaca", file=sys.stderr)
+                predic_c2_rebano = {}
+                for vaca_id, df_c2 in dfs_c2.items():
+                    try:
+                        predic_c2_rebano[vaca_id] = predecir_c2_para_vaca(
+                            df_c2, modelos_f1)
+                    except Exception as e_vaca:
+                        print(
+                            f"[WARN] Error en C2 para vaca {vaca_id}: {e_vaca}", file=sys.stderr)
+                        traceback.print_exc(file=sys.stderr)
+
+        for vaca_id, predic_c2 in predic_c2_rebano.items():
+            resultado = vacas_resultados.get(vaca_id)
+            if resultado is None or "error" in resultado:
+                continue
+            resultado["predicciones_c2"] = predic_c2
+            diagnostico.debug(
+                f"Predicciones C2 para vaca {vaca_id}: {predic_c2}")
+
+    for vaca_id, resultado in vacas_resultados.items():
+        if "error" not in resultado:
+            diagnostico.debug(
+                f"Resultado para vaca {vaca_id}: {resultado['nivel_alarma']} "
+                f"({resultado['ultima_probabilidad']*100:.2f}%), C2={resultado['predicciones_c2']}")
+
     # Formato final compatible con el frontend
-    resultado_final = {
+    return {
         "success": True,
         "total_registros": total_registros,
         "total_vacas": len(vacas_resultados),
         "vacas": vacas_resultados,
     }
 
-    print(json.dumps(resultado_final, ensure_ascii=False))
-    print("[DEBUG] Pipeline completado", file=sys.stderr)
+
+def atender_trabajo(trabajo, modelo_xgb, modelos_f1, processed_dir_default):
+    """
+    Atiende un trabajo del modo worker y devuelve el dict de respuesta.
+
+    El trabajo es un objeto JSON con claves opcionales "processed_dir",
+    "csv_files", "input_dir", "save_features", "append", "format", "compress",
+    "chunk_size" y "compact" (mismo significado que los argumentos de línea de
+    comandos); la respuesta tiene la misma forma que imprime main().
+    """
+    processed_dir = trabajo.get("processed_dir") or processed_dir_default
+    formato = resolver_formato(trabajo.get("format"))
+    comprimir = bool(trabajo.get("compress"))
+
+    if trabajo.get("input_dir"):
+        if trabajo.get("chunk_size") and trabajo.get("append"):
+            return {"error": ERROR_BLOQUES_ANEXAR}
+        rutas_crudas = buscar_ordenos(trabajo["input_dir"])
+        if not rutas_crudas:
+            return {"error": f"No se encontraron CSV en {trabajo['input_dir']}"}
+        fuentes = fuentes_ordenos(
+            rutas_crudas, processed_dir, modelo_xgb, modelos_f1, formato, comprimir,
+            guardar=bool(trabajo.get("save_features")),
+            anexar=bool(trabajo.get("append")),
+            filas_por_bloque=int(trabajo.get("chunk_size") or 0))
+        return predecir_vacas(fuentes, modelo_xgb, modelos_f1,
+                              compacto=bool(trabajo.get("compact")))
+
+    rutas_csv = buscar_features(processed_dir, trabajo.get("csv_files"))
+
+    if not rutas_csv:
+        print(
+            f"[ERROR] No se encontraron archivos de features en {processed_dir}", file=sys.stderr)
+        return {"error": f"No se encontraron archivos de features en {processed_dir}"}
+
+    return predecir_vacas(fuentes_desde_features(rutas_csv), modelo_xgb, modelos_f1,
+                          compacto=bool(trabajo.get("compact")))
+
+
+def responder_linea(linea, modelo_xgb, modelos_f1, processed_dir_default):
+    """Convierte una línea de entrada del worker en una línea JSON de respuesta."""
+    # Con --timings cada respuesta lleva las métricas de su propio trabajo
+    if metricas.activo():
+        metricas.activar()
+    try:
+        trabajo = json.loads(linea)
+        if not isinstance(trabajo, dict):
+            raise ValueError("el trabajo debe ser un objeto JSON")
+        respuesta = atender_trabajo(
+            trabajo, modelo_xgb, modelos_f1, processed_dir_default)
+    except Exception as e:
+        print(f"[ERROR] Trabajo inválido o fallido: {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        respuesta = {"error": str(e)}
+
+    texto = metricas.serializar(
+        respuesta, respuesta.get("total_registros", 0), ensure_ascii=False)
+    # Con --profile los perfiles acumulados se reescriben tras cada trabajo
+    metricas.guardar_perfiles()
+    return texto
+
+
+def servir_worker(modelo_xgb, modelos_f1, processed_dir_default, socket_path=None):
+    """
+    Bucle del modo worker: lee un trabajo JSON por línea y responde con una
+    línea JSON. Usa stdin/stdout o, si se indica, un socket Unix local.
+    """
+    if socket_path is None:
+        diagnostico.debug("Worker listo, esperando trabajos por stdin")
+        for linea in sys.stdin:
+            if not linea.strip():
+                continue
+            sys.stdout.write(responder_linea(
+                linea, modelo_xgb, modelos_f1, processed_dir_default) + "\n")
+            sys.stdout.flush()
+        diagnostico.debug("stdin cerrado, worker terminado")
+        return
+
+    import socketserver
+    if not hasattr(socketserver, "UnixStreamServer"):
+        raise RuntimeError("Los sockets Unix no están disponibles en esta plataforma")
+
+    class ManejadorTrabajos(socketserver.StreamRequestHandler):
+        def handle(self):
+            for linea in self.rfile:
+                linea = linea.decode("utf-8")
+                if not linea.strip():
+                    continue
+                respuesta = responder_linea(
+                    linea, modelo_xgb, modelos_f1, processed_dir_default)
+                self.wfile.write((respuesta + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    with socketserver.UnixStreamServer(socket_path, ManejadorTrabajos) as server:
+        diagnostico.debug(
+            f"Worker listo, escuchando en socket: {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            diagnostico.debug("Worker interrumpido")
+        finally:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def main():
+    args = parse_args()
+    if args.log_level:
+        diagnostico.configurar(args.log_level)
+    diagnostico.debug("Iniciando predict_pipeline.py (versión C2)")
+    if args.timings:
+        metricas.activar()
+    if args.profile:
+        metricas.perfilar(args.profile)
+    base_dir = os.path.dirname(__file__)
+
+    # Determinar directorio de modelos
+    modelo_path, models_dir = resolver_ruta_modelo(args.models_dir, base_dir)
+
+    # Cargar modelo XGBoost instantáneo y modelos F1
+    try:
+        modelo_xgb, modelos_f1 = cargar_modelos(
+            modelo_path, models_dir, args.threads, args.tree_backend)
+    except Exception as e:
+        print(f"[ERROR] Error cargando modelo: {e}", file=sys.stderr)
+        print(json.dumps({"error": f"No se pudo cargar el modelo: {e}"}))
+        sys.exit(1)
+
+    # Determinar directorio de processed
+    if args.processed_dir:
+        processed_dir = args.processed_dir
+        diagnostico.debug(
+            f"Usando processed_dir desde argumento: {processed_dir}")
+    else:
+        processed_dir = os.path.join(base_dir, '../../processed')
+
+    if args.worker:
+        servir_worker(modelo_xgb, modelos_f1, processed_dir, args.socket)
+        return
+
+    if args.input_dir:
+        # Modo fusionado: CSV crudos -> features en memoria -> predicción
+        rutas_crudas = buscar_ordenos(args.input_dir)
+        if not rutas_crudas:
+            print(
+                f"[ERROR] No se encontraron CSV en {args.input_dir}", file=sys.stderr)
+            print(json.dumps(
+                {"error": f"No se encontraron CSV en {args.input_dir}"}))
+            sys.exit(1)
+
+        fuentes = fuentes_ordenos(
+            rutas_crudas, processed_dir, modelo_xgb, modelos_f1,
+            resolver_formato(args.format), args.compress, guardar=args.save_features,
+            anexar=args.append, filas_por_bloque=args.chunk_size)
+    else:
+        # Buscar archivos de features
+        rutas_csv = buscar_features(processed_dir, args.csv_files)
+
+        if not rutas_csv:
+            print(
+                f"[ERROR] No se encontraron archivos de features en {processed_dir}", file=sys.stderr)
+            print(json.dumps(
+                {"error": f"No se encontraron archivos de features en {processed_dir}"}))
+            sys.exit(1)
+
+        fuentes = fuentes_desde_features(rutas_csv)
+
+    resultado_final = predecir_vacas(fuentes, modelo_xgb, modelos_f1, args.compact)
+
+    print(metricas.serializar(
+        resultado_final, resultado_final["total_registros"], ensure_ascii=False))
+    if args.profile:
+        rutas = metricas.guardar_perfiles()
+        diagnostico.info(f"Perfiles por etapa guardados en {args.profile} ({len(rutas)} archivos)")
+    diagnostico.debug("Pipeline completado")
 
 
 if __name__ == "__main__":
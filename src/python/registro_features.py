@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+registro_features.py
+
+Registro único de las features derivadas por fila (V7) que usan todos los
+pipelines: pipeline_ordenos.py, predict_mastitis.py, process_xlsx.py
+(entrenamiento) y C2_inference.py.
+
+Cada feature declara sus columnas de entrada y su fórmula. calcular_features
+arma un plan en orden de dependencias y calcula cada feature una sola vez; las
+que no tienen sus entradas disponibles se omiten. Las estadísticas sobre los
+cuatro cuartos salen de features_cuartos (un solo tensor por DataFrame).
+
+Variantes:
+  - "v7": las fórmulas de entrenamiento (las de process_xlsx).
+  - "c2": las versiones con que se entrenaron los modelos F1 de C2; solo
+    redefine las features que cambian, el resto se toma de "v7".
+  - "ordenos": las de pipeline_ordenos (features de inferencia por vaca):
+    Score_anomalia_simple suma sus componentes ignorando los NaN, mientras
+    que en "v7" (entrenamiento, predict_mastitis) un NaN da score NaN.
+
+Las features temporales (prev / delta / tasa de cambio) dependen del orden
+de los registros y del estado entre corridas, y siguen en cada pipeline.
+"""
+
+import sys
+
+import numpy as np
+
+from features_cuartos import (MEDICIONES, columnas_medicion, tensor_cuartos,
+                              reducir_cuartos)
+
+
+EPS = 1e-6
+
+# {variante: {nombre: {"entradas", "formula", "grupo", "por_defecto"}}}
+REGISTRO = {"v7": {}, "c2": {}, "ordenos": {}}
+
+
+def registrar(nombre, entradas, formula, grupo=None, variante="v7", por_defecto=None):
+    """
+    Registra la fórmula de una feature.
+
+    Args:
+        nombre: Columna que produce
+        entradas: Columnas que necesita (pueden ser otras features registradas)
+        formula: Función (Contexto) -> array con los valores por fila
+        grupo: "basicas" o "asimetria" (orden en que las agregan los pipelines)
+        variante: "v7" o una variante que redefine la feature
+        por_defecto: Valor constante si faltan las entradas (None = omitir)
+    """
+    REGISTRO[variante][nombre] = {
+        "entradas": tuple(entradas),
+        "formula": formula,
+        "grupo": grupo,
+        "por_defecto": por_defecto,
+    }
+
+
+def definicion_feature(nombre, variante="v7"):
+    """Definición de una feature en la variante pedida (o la de v7)."""
+    return REGISTRO[variante].get(nombre) or REGISTRO["v7"].get(nombre)
+
+
+def nombres_features(grupo=None):
+    """Features registradas (en orden de registro), opcionalmente de un grupo."""
+    return [nombre for nombre, definicion in REGISTRO["v7"].items()
+            if grupo is None or definicion["grupo"] == grupo]
+
+
+def filtrar_features(nombres, features=None):
+    """Los nombres que están en features (todos si features es None), en orden."""
+    if features is None:
+        return list(nombres)
+    return [nombre for nombre in nombres if nombre in features]
+
+
+def con_dependencias(nombres, variante="v7"):
+    """Conjunto de las features pedidas más todas las registradas de las que dependen."""
+    resultado = set()
+    pendientes = list(nombres)
+    while pendientes:
+        nombre = pendientes.pop()
+        if nombre in resultado:
+            continue
+        resultado.add(nombre)
+        definicion = definicion_feature(nombre, variante)
+        if definicion is not None:
+            pendientes.extend(definicion["entradas"])
+    return resultado
+
+
+class Contexto:
+    """
+    Acceso a columnas (como float64) y a las estadísticas por cuarto de un
+    DataFrame, calculadas una sola vez mientras dura el plan.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._columnas = {}
+        self._tensor = None
+        self._cuartos = {}
+
+    def __getitem__(self, columna):
+        if columna not in self._columnas:
+            self._columnas[columna] = self.df[columna].to_numpy(
+                dtype=np.float64, na_value=np.nan)
+        return self._columnas[columna]
+
+    def actualizar(self, columna):
+        """Descarta la copia en cache de una columna recién escrita."""
+        self._columnas.pop(columna, None)
+
+    def cuartos(self, medicion):
+        """Reducciones por fila (features_cuartos.reducir_cuartos) de una medición."""
+        if medicion not in self._cuartos:
+            if self._tensor is None:
+                self._tensor, _ = tensor_cuartos(self.df)
+            self._cuartos[medicion] = reducir_cuartos(
+                self._tensor[:, MEDICIONES.index(medicion), :])
+        return self._cuartos[medicion]
+
+
+def planificar(objetivos, columnas, variante="v7", recalcular=False):
+    """
+    Ordena las features a calcular según sus dependencias.
+
+    Args:
+        objetivos: Features pedidas
+        columnas: Columnas ya presentes en el DataFrame
+        recalcular: Si es True, los objetivos se calculan aunque ya existan
+            (sus dependencias presentes se usan tal cual)
+
+    Returns:
+        (plan, omitidas): plan es una lista de (nombre, definicion, con_entradas)
+        en orden de cálculo; omitidas son los objetivos sin entradas disponibles.
+    """
+    columnas = set(columnas)
+    objetivos = list(objetivos)
+    plan, omitidas = [], []
+    resueltas = {}
+
+    def resolver(nombre, es_objetivo):
+        if nombre in resueltas:
+            return resueltas[nombre]
+
+        definicion = definicion_feature(nombre, variante)
+        if definicion is None or (nombre in columnas and not (es_objetivo and recalcular)):
+            resueltas[nombre] = nombre in columnas
+            return resueltas[nombre]
+
+        resueltas[nombre] = False
+        con_entradas = all(resolver(e, False) for e in definicion["entradas"])
+        if con_entradas or definicion["por_defecto"] is not None:
+            plan.append((nombre, definicion, con_entradas))
+            resueltas[nombre] = True
+        elif es_objetivo:
+            omitidas.append(nombre)
+        return resueltas[nombre]
+
+    for nombre in objetivos:
+        resolver(nombre, True)
+
+    return plan, omitidas
+
+
+def calcular_features(df, objetivos=None, variante="v7", recalcular=False):
+    """
+    Calcula las features pedidas sobre df (in place) y lo retorna.
+
+    Args:
+        df: DataFrame con las columnas de ordeño renombradas
+        objetivos: Lista de features (por defecto todas las registradas)
+        variante: "v7", "c2" u "ordenos"
+        recalcular: Recalcular los objetivos aunque ya existan en df
+    """
+    if objetivos is None:
+        objetivos = nombres_features()
+
+    plan, omitidas = planificar(objetivos, df.columns, variante, recalcular)
+    if omitidas:
+        print(
+            f"[INFO] Features omitidas por falta de columnas: {omitidas}", file=sys.stderr)
+
+    ctx = Contexto(df)
+    for nombre, definicion, con_entradas in plan:
+        df[nombre] = definicion["formula"](ctx) if con_entradas else definicion["por_defecto"]
+        ctx.actualizar(nombre)
+
+    return df
+
+
+def _dividir(a, b):
+    return a / (b + EPS)
+
+
+def _suma_sin_nan(*columnas):
+    """Suma por fila tratando NaN como 0 (como DataFrame.sum(axis=1))."""
+    total = np.where(np.isnan(columnas[0]), 0.0, columnas[0])
+    for col in columnas[1:]:
+        total = total + np.where(np.isnan(col), 0.0, col)
+    return total
+
+
+FLUJO = columnas_medicion("FlujoMedio")
+CONDUCTIVIDAD = columnas_medicion("Conductividad")
+PRODUCCION = columnas_medicion("Produccion")
+
+
+# -------------------------------------------------------------------
+# Features básicas (flujo, conductividad, producción)
+# -------------------------------------------------------------------
+registrar("FlujoMedio_promedio", FLUJO,
+          lambda c: c.cuartos("FlujoMedio")["promedio"], "basicas")
+registrar("Conductividad_promedio", CONDUCTIVIDAD,
+          lambda c: c.cuartos("Conductividad")["promedio"], "basicas")
+registrar("Conductividad_std", CONDUCTIVIDAD,
+          lambda c: c.cuartos("Conductividad")["std"], "basicas")
+registrar("Conductividad_rango", CONDUCTIVIDAD,
+          lambda c: c.cuartos("Conductividad")["max"] - c.cuartos("Conductividad")["min"],
+          "basicas")
+registrar("Conductividad_diff_max_prom", CONDUCTIVIDAD,
+          lambda c: c.cuartos("Conductividad")["max"] - c.cuartos("Conductividad")["promedio"],
+          "basicas")
+registrar("Conductividad_diff_min_prom", CONDUCTIVIDAD,
+          lambda c: c.cuartos("Conductividad")["promedio"] - c.cuartos("Conductividad")["min"],
+          "basicas")
+registrar("Conductividad_izq", CONDUCTIVIDAD,
+          lambda c: c.cuartos("Conductividad")["promedio_izq"], "basicas")
+registrar("Conductividad_der", CONDUCTIVIDAD,
+          lambda c: c.cuartos("Conductividad")["promedio_der"], "basicas")
+registrar("FlujoMedio_std", FLUJO,
+          lambda c: c.cuartos("FlujoMedio")["std"], "basicas")
+registrar("FlujoMedio_izq", FLUJO,
+          lambda c: c.cuartos("FlujoMedio")["promedio_izq"], "basicas")
+registrar("FlujoMedio_der", FLUJO,
+          lambda c: c.cuartos("FlujoMedio")["promedio_der"], "basicas")
+registrar("FlujoConductividad_ratio", ["FlujoMedio_promedio", "Conductividad_promedio"],
+          lambda c: _dividir(c["FlujoMedio_promedio"], c["Conductividad_promedio"]), "basicas")
+registrar("Produccion_promedio", PRODUCCION,
+          lambda c: c.cuartos("Produccion")["promedio"], "basicas")
+registrar("Produccion_total", PRODUCCION,
+          lambda c: c.cuartos("Produccion")["total"], "basicas")
+registrar("Produccion_izq", PRODUCCION,
+          lambda c: c.cuartos("Produccion")["total_izq"], "basicas")
+registrar("Produccion_der", PRODUCCION,
+          lambda c: c.cuartos("Produccion")["total_der"], "basicas")
+registrar("Produccion_diff_lados", ["Produccion_izq", "Produccion_der"],
+          lambda c: np.abs(c["Produccion_izq"] - c["Produccion_der"]), "basicas")
+registrar("Produccion_std", PRODUCCION,
+          lambda c: c.cuartos("Produccion")["std"], "basicas")
+# fmax/fmin saltan NaN como DataFrame.max/min(axis=1)
+registrar("Produccion_ratio_lados", ["Produccion_izq", "Produccion_der"],
+          lambda c: np.fmax(c["Produccion_izq"], c["Produccion_der"])
+          / (np.fmin(c["Produccion_izq"], c["Produccion_der"]) + EPS), "basicas")
+registrar("Produccion_rango", PRODUCCION,
+          lambda c: c.cuartos("Produccion")["max"] - c.cuartos("Produccion")["min"], "basicas")
+registrar("Eficiencia_flujo_produccion", ["FlujoMedio_promedio", "Produccion_promedio"],
+          lambda c: _dividir(c["FlujoMedio_promedio"], c["Produccion_promedio"]), "basicas")
+
+
+# -------------------------------------------------------------------
+# Features de asimetría y variabilidad
+# -------------------------------------------------------------------
+registrar("Flujo_diff_lados", ["FlujoMedio_izq", "FlujoMedio_der"],
+          lambda c: np.abs(c["FlujoMedio_izq"] - c["FlujoMedio_der"]), "asimetria")
+registrar("Conductividad_diff_lados", ["Conductividad_izq", "Conductividad_der"],
+          lambda c: np.abs(c["Conductividad_izq"] - c["Conductividad_der"]), "asimetria")
+registrar("Indice_asimetria_flujo", ["FlujoMedio_std", "FlujoMedio_promedio"],
+          lambda c: _dividir(c["FlujoMedio_std"], c["FlujoMedio_promedio"]), "asimetria")
+registrar("Indice_asimetria_conductividad", ["Conductividad_std", "Conductividad_promedio"],
+          lambda c: _dividir(c["Conductividad_std"], c["Conductividad_promedio"]), "asimetria")
+registrar("Flujo_ratio_max_min", FLUJO,
+          lambda c: c.cuartos("FlujoMedio")["max"] / (c.cuartos("FlujoMedio")["min"] + EPS),
+          "asimetria")
+registrar("Eficiencia_conductividad", ["Produccion_promedio", "Conductividad_promedio"],
+          lambda c: _dividir(c["Produccion_promedio"], c["Conductividad_promedio"]), "asimetria")
+registrar("Flujo_conductividad_balance", ["FlujoMedio_promedio", "Conductividad_promedio"],
+          lambda c: _dividir(c["FlujoMedio_promedio"], c["Conductividad_promedio"]), "asimetria")
+registrar("Flujo_por_kg", ["FlujoMedio_promedio", "Produccion_total"],
+          lambda c: _dividir(c["FlujoMedio_promedio"], c["Produccion_total"]), "asimetria")
+registrar("Conductividad_por_kg", ["Conductividad_promedio", "Produccion_total"],
+          lambda c: _dividir(c["Conductividad_promedio"], c["Produccion_total"]), "asimetria")
+registrar("Conductividad_sobre_flujo", ["Conductividad_promedio", "FlujoMedio_promedio"],
+          lambda c: _dividir(c["Conductividad_promedio"], c["FlujoMedio_promedio"]), "asimetria")
+registrar("CV_flujo", ["FlujoMedio_std", "FlujoMedio_promedio"],
+          lambda c: _dividir(c["FlujoMedio_std"], c["FlujoMedio_promedio"]), "asimetria")
+registrar("CV_conductividad", ["Conductividad_std", "Conductividad_promedio"],
+          lambda c: _dividir(c["Conductividad_std"], c["Conductividad_promedio"]), "asimetria")
+registrar("Conductividad_rango_relativo", ["Conductividad_rango", "Conductividad_promedio"],
+          lambda c: _dividir(c["Conductividad_rango"], c["Conductividad_promedio"]), "asimetria")
+registrar("Indice_variabilidad_total", ["FlujoMedio_std", "Conductividad_std"],
+          lambda c: (c["FlujoMedio_std"] + c["Conductividad_std"]) / 2, "asimetria")
+registrar("Score_anomalia_simple",
+          ["Conductividad_rango_relativo", "Indice_asimetria_flujo",
+           "Indice_asimetria_conductividad"],
+          lambda c: (c["Conductividad_rango_relativo"] + c["Indice_asimetria_flujo"]
+                     + c["Indice_asimetria_conductividad"]), "asimetria")
+
+
+# -------------------------------------------------------------------
+# Variante pipeline_ordenos: score sin NaN (como DataFrame.sum(axis=1))
+# -------------------------------------------------------------------
+registrar("Score_anomalia_simple",
+          ["Conductividad_rango_relativo", "Indice_asimetria_flujo",
+           "Indice_asimetria_conductividad"],
+          lambda c: _suma_sin_nan(c["Conductividad_rango_relativo"], c["Indice_asimetria_flujo"],
+                                  c["Indice_asimetria_conductividad"]),
+          "asimetria", variante="ordenos")
+
+
+# -------------------------------------------------------------------
+# Variante C2: fórmulas con que se entrenaron los modelos F1
+# (sin épsilon: 0 cuando el promedio no es positivo)
+# -------------------------------------------------------------------
+def _dividir_si_positivo(a, b):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(b > 0, a / b, 0)
+
+
+registrar("CV_flujo", ["FlujoMedio_std", "FlujoMedio_promedio"],
+          lambda c: _dividir_si_positivo(c["FlujoMedio_std"], c["FlujoMedio_promedio"]),
+          variante="c2", por_defecto=0)
+registrar("CV_conductividad", ["Conductividad_std", "Conductividad_promedio"],
+          lambda c: _dividir_si_positivo(c["Conductividad_std"], c["Conductividad_promedio"]),
+          variante="c2", por_defecto=0)
+registrar("Conductividad_rango_relativo", ["Conductividad_rango", "Conductividad_promedio"],
+          lambda c: _dividir_si_positivo(c["Conductividad_rango"], c["Conductividad_promedio"]),
+          variante="c2", por_defecto=0)
+registrar("Indice_variabilidad_total", ["CV_flujo", "CV_conductividad"],
+          lambda c: (c["CV_flujo"] + c["CV_conductividad"]) / 2, variante="c2")
+registrar("Score_anomalia_simple", [], lambda c: 0, variante="c2")
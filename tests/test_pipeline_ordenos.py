@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Pruebas de procesar_archivos (pipeline_ordenos --workers / --timeout):
+un archivo colgado o un worker que muere no afecta a los demás archivos.
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import multiprocessing
+
+import pytest
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(RAIZ, "src", "python"))
+import pipeline_ordenos
+
+PRUEBAS = os.path.join(RAIZ, "uploads", "pruebas")
+
+# El archivo colgado es un FIFO sin escritor (read_csv se bloquea al abrirlo)
+# y el worker que muere se simula con fork: ambos son de POSIX
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "mkfifo") or "fork" not in multiprocessing.get_all_start_methods(),
+    reason="requiere os.mkfifo y procesos fork")
+
+
+def copiar_sanos(destino, n):
+    sanos = sorted(f for f in os.listdir(PRUEBAS) if f.endswith(".csv"))[:n]
+    rutas = []
+    for nombre in sanos:
+        ruta = os.path.join(destino, nombre)
+        shutil.copy(os.path.join(PRUEBAS, nombre), ruta)
+        rutas.append(ruta)
+    return rutas
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_archivo_colgado_no_afecta_a_los_demas(tmp_path, workers):
+    entrada = tmp_path / "entrada"
+    entrada.mkdir()
+    colgado = str(entrada / "9999.csv")
+    os.mkfifo(colgado)
+    sanos = copiar_sanos(str(entrada), 3)
+
+    resultados = pipeline_ordenos.procesar_archivos(
+        [colgado] + sanos, str(tmp_path / "salida"), workers=workers, timeout=3)
+
+    assert not resultados[0]["success"]
+    assert "Tiempo límite excedido" in resultados[0]["error"]
+    assert [r["success"] for r in resultados[1:]] == [True] * len(sanos)
+    assert [r["input_file"] for r in resultados] == [os.path.basename(r) for r in [colgado] + sanos]
+
+
+def test_worker_que_muere_no_deja_esperando(tmp_path, monkeypatch):
+    entrada = tmp_path / "entrada"
+    entrada.mkdir()
+    sanos = copiar_sanos(str(entrada), 3)
+    original = pipeline_ordenos.procesar_archivo_individual
+
+    def muere_con_el_segundo(ruta_csv, *args):
+        if ruta_csv == sanos[1]:
+            os._exit(9)
+        return original(ruta_csv, *args)
+
+    monkeypatch.setattr(pipeline_ordenos, "procesar_archivo_individual", muere_con_el_segundo)
+    monkeypatch.setattr(multiprocessing, "Process",
+                        multiprocessing.get_context("fork").Process)
+
+    resultados = pipeline_ordenos.procesar_archivos(
+        sanos, str(tmp_path / "salida"), workers=2)
+
+    assert [r["success"] for r in resultados] == [True, False, True]
+    assert "terminó inesperadamente" in resultados[1]["error"]